@@ -9,21 +9,22 @@ bl_info = {
 }
 
 import bpy
-import os
 from bpy.props import StringProperty, CollectionProperty
 from bpy.types import Operator, Panel, PropertyGroup
 from . import ba_props
 from . import ba_props_outline
+from . import ba_outline_lod
 from . import ba_halo
 from . import ba_mouth
 from . import ba_ch_materials
 from . import ba_rigify
-from .ba_utils import refresh_view_layer
+from .ba_scene_plan import ScenePlan
+from .ba_utils import MaterialTemplates, SteppedOperator, id_alive, load_texture_index, preload_library, refresh_view_layer, register_stepped_operators, report_profile, span, unregister_stepped_operators
 
 # ---------------- operator ----------------
 
 
-class BA_OT_setup_prop(Operator):
+class BA_OT_setup_prop(SteppedOperator, Operator):
     bl_idname = "ba.setup_materials_prop"
     bl_label = "Setup weapon/props materials"
 
@@ -31,42 +32,63 @@ class BA_OT_setup_prop(Operator):
     directory: StringProperty(subtype='DIR_PATH')
 
     def invoke(self, context, event):
+        self._interactive = True
         context.window_manager.fileselect_add(self)
         return {'RUNNING_MODAL'}
 
-    def execute(self, context):
-        images = []
-
-        for f in self.files:
-            path = os.path.join(self.directory, f.name)
-            img = bpy.data.images.load(path, check_existing=True)
-            images.append(img)
+    def steps(self, context):
+        with span("load_images"):
+            images = load_texture_index(self.directory, [f.name for f in self.files])
 
-        mats = set()
+        with span("preload_library"):
+            preload_library(
+                node_groups=ba_props.PROP_NODE_GROUPS + ba_props_outline.LIBRARY_NODE_GROUPS,
+                materials=ba_props_outline.LIBRARY_MATERIALS,
+            )
 
         for obj in context.selected_objects:
-            if obj.type != 'MESH':
-                continue
-            if len(obj.material_slots) == 0:
+            if obj.type == 'MESH' and len(obj.material_slots) == 0:
                 mat = bpy.data.materials.new(name="Prop_Material")
                 obj.data.materials.append(mat)
-            for slot in obj.material_slots:
-                if slot.material:
-                    mats.add(slot.material)
-                    
-        for mat in mats:
-            if ba_props.is_car_alpha_material(mat):
-                ba_props.setup_car_alpha_material(mat, images)
-            elif ba_props.is_alpha_material(mat):
-                ba_props.setup_alpha_material(mat, images)
-            else:
-                ba_props.setup_prop_material(mat, images)
-
-            
-        ba_props_outline.add_ba_props_outline(context)
-        refresh_view_layer(context)
 
+        # Objects and materials can be deleted between steps; each step looks
+        # its datablock up again and skips it when it is gone.
+        plan = ScenePlan.from_context(context, classify=ba_props.prop_material_handler)
+        names = plan.material_names()
+
+        total = len(names) + len(plan.meshes)
+        done = 0
+        templates = MaterialTemplates()
+        try:
+            for name in names:
+                context = yield done, total, f"Material {name}"
+                mat = bpy.data.materials.get(name)
+                if mat is None:
+                    done += 1
+                    continue
+                handler = plan.role(mat)
+                with span(f"material/{handler.__name__}", material=mat.name):
+                    handler(mat, images, templates)
+                done += 1
+        finally:
+            templates.clear()
+
+        outline_assets = ba_props_outline.import_outline_assets()
+        for obj in plan.meshes:
+            context = yield done, total, "Outline"
+            if not id_alive(obj):
+                done += 1
+                continue
+            with span("outline", object=obj.name):
+                ba_props_outline.setup_prop_outline_geometry_nodes(obj, outline_assets)
+            done += 1
+
+        with span("refresh_view_layer"):
+            refresh_view_layer(context)
+
+    def finish(self, context, result):
         self.report({'INFO'}, "Setup Prop")
+        report_profile(self, "Setup Prop")
         return {'FINISHED'}
 
 
@@ -106,8 +128,9 @@ class BA_OT_convert_to_rigify(Operator):
     bl_label = "Convert to Rigify"
 
     def execute(self, context):
-        ba_rigify.run_convert_to_rigify()
+        ba_rigify.run_convert_to_rigify(context)
         self.report({'INFO'}, "Converted selection to Rigify")
+        report_profile(self, "Convert to Rigify")
         return {'FINISHED'}
 
 
@@ -133,6 +156,22 @@ class BA_PT_panel(Panel):
         layout.operator("ba.convert_to_rigify", icon='ARMATURE_DATA')
         layout.operator("ba.set_color_management", icon='COLOR')
 
+        layout.separator()
+
+        scene = context.scene
+        box = layout.box()
+        box.label(text="Outline LOD", icon='MOD_DECIM')
+        obj = context.active_object
+        if obj is not None and obj.type == 'MESH':
+            box.prop(obj, "ba_outline_lod", text="Active")
+        box.prop(scene, "ba_outline_hide_during_playback")
+        box.prop(scene, "ba_outline_lod_performance")
+        box.prop(scene, "ba_outline_lod_auto")
+        col = box.column(align=True)
+        col.active = scene.ba_outline_lod_auto
+        col.prop(scene, "ba_outline_lod_simplify_distance")
+        col.prop(scene, "ba_outline_lod_off_distance")
+
 
 # ---------------- register ----------------
 
@@ -151,9 +190,13 @@ classes = (
 def register():
     for c in classes:
         bpy.utils.register_class(c)
+    register_stepped_operators()
+    ba_outline_lod.register()
 
 
 def unregister():
+    ba_outline_lod.unregister()
+    unregister_stepped_operators()
     for c in reversed(classes):
         bpy.utils.unregister_class(c)
 
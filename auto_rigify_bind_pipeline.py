@@ -1,45 +1,44 @@
+import time
+from dataclasses import dataclass, field
+
 import bpy
-from pathlib import Path
-
-# One-click pipeline:
-# 1. Select one source/original armature and one or more meshes.
-# 2. Run this script.
-# 3. It creates/alights a Rigify Human metarig, generates the Rigify rig, and
-#    migrates selected meshes from the source armature to the generated rig.
-#
-# This script reuses the workspace scripts:
-# - create_and_align_human_metarig.py
-# - migrate_body_to_rig_auto.py
-
-CREATE_SCRIPT = "create_and_align_human_metarig.py"
-MIGRATE_SCRIPT = "migrate_body_to_rig_auto.py"
-GENERATED_RIG_SUFFIX = "_rigify_auto"
-IGNORED_RIG_NAME_TOKENS = ("mouthre",)
 
+from . import ba_rig_cache
+from . import create_and_align_human_metarig as metarig_stage
+from . import migrate_body_to_rig_auto as migrate_stage
+from .ba_rig_utils import is_ignored_rig, object_context, set_mode
+from .ba_utils import span
 
-def is_ignored_rig(obj):
-    if obj is None or obj.type != "ARMATURE":
-        return False
-    lowered = obj.name.lower()
-    return any(token in lowered for token in IGNORED_RIG_NAME_TOKENS)
+# One-click pipeline: select one source armature and one or more meshes, then
+# run(). It creates and aligns a Rigify Human metarig, generates the Rigify
+# rig, and migrates the meshes from the source armature to the generated rig.
+
+GENERATED_RIG_SUFFIX = "_rigify_auto"
+USE_RIG_CACHE = True
 
 
-def script_dir():
-    if "__file__" in globals():
-        return Path(__file__).resolve().parent
-    return Path(r"E:\project\code\ba\ba_shader")
+@dataclass
+class PipelineOptions:
+    metarig: metarig_stage.MetarigOptions = field(default_factory=metarig_stage.MetarigOptions)
+    migrate: migrate_stage.MigrateOptions = field(default_factory=migrate_stage.MigrateOptions)
+    generated_rig_suffix: str = GENERATED_RIG_SUFFIX
+    use_rig_cache: bool = USE_RIG_CACHE
 
 
-def load_script(name):
-    text = bpy.data.texts.get(name)
-    if text is not None:
-        return text.as_string()
-    path = script_dir() / name
-    return path.read_text(encoding="utf-8")
+@dataclass
+class PipelineReport:
+    source: object = None
+    metarig: object = None
+    rig: object = None
+    rig_cache: str = "off"
+    meshes: list = field(default_factory=list)
+    metarig_report: object = None
+    migrate_report: object = None
+    timings: dict = field(default_factory=dict)
 
 
-def require_selection():
-    selected = list(bpy.context.selected_objects)
+def require_selection(objects):
+    selected = list(objects)
     armatures = [obj for obj in selected if obj.type == "ARMATURE" and not is_ignored_rig(obj)]
     meshes = [obj for obj in selected if obj.type == "MESH"]
     if len(armatures) != 1 or len(meshes) < 1:
@@ -51,52 +50,25 @@ def require_selection():
 
 
 def select_only(objects, active=None):
-    bpy.ops.object.mode_set(mode="OBJECT")
-    bpy.ops.object.select_all(action="DESELECT")
+    view_layer = bpy.context.view_layer
+    set_mode(view_layer.objects.active, "OBJECT")
+    for obj in list(view_layer.objects.selected):
+        obj.select_set(False)
     for obj in objects:
         obj.select_set(True)
-    bpy.context.view_layer.objects.active = active or (objects[0] if objects else None)
+    view_layer.objects.active = active or (objects[0] if objects else None)
 
 
-def run_script_text(name, extra_namespace=None):
-    script = load_script(name)
-    namespace = {"__name__": "__main__", "__file__": str(script_dir() / name)}
-    if extra_namespace:
-        namespace.update(extra_namespace)
-    exec(compile(script, name, "exec"), namespace)
-    return namespace
-
-
-def create_and_align_metarig(source):
+def generate_rigify_rig(metarig, source, suffix=GENERATED_RIG_SUFFIX):
     before = set(bpy.data.objects)
-    select_only([source], active=source)
-    run_script_text(CREATE_SCRIPT)
-    after = set(bpy.data.objects)
-
-    new_armatures = [obj for obj in after - before if obj.type == "ARMATURE"]
-    if len(new_armatures) == 1:
-        return new_armatures[0]
-
-    expected_name = f"{source.name}_metarig_auto"
-    obj = bpy.data.objects.get(expected_name)
-    if obj and obj.type == "ARMATURE":
-        return obj
-
-    candidates = [obj for obj in bpy.data.objects if obj.type == "ARMATURE" and obj.name.endswith("_metarig_auto")]
-    if candidates:
-        return candidates[-1]
-    raise RuntimeError("Could not find generated metarig after create/alignment step")
-
-
-def generate_rigify_rig(metarig, source):
-    before = set(bpy.data.objects)
-    rig_basename = f"{source.name}{GENERATED_RIG_SUFFIX}"
+    rig_basename = f"{source.name}{suffix}"
     metarig.data.rigify_rig_basename = rig_basename
 
-    select_only([metarig], active=metarig)
-    bpy.ops.object.mode_set(mode="POSE")
-    bpy.ops.pose.rigify_generate()
-    bpy.ops.object.mode_set(mode="OBJECT")
+    # Rigify only needs the metarig as context object; no pose-mode round trip.
+    set_mode(metarig, "OBJECT")
+    with object_context(metarig):
+        bpy.ops.pose.rigify_generate()
+    set_mode(bpy.context.view_layer.objects.active, "OBJECT")
     after = set(bpy.data.objects)
 
     new_armatures = [obj for obj in after - before if obj.type == "ARMATURE"]
@@ -117,18 +89,37 @@ def generate_rigify_rig(metarig, source):
     return rig
 
 
-def migrate_meshes(source, generated_rig, meshes):
-    select_only([source, generated_rig] + meshes, active=meshes[0])
-    run_script_text(
-        MIGRATE_SCRIPT,
-        {
-            "BA_SOURCE_ARMATURE": source,
-            "BA_TARGET_ARMATURE": generated_rig,
-            "BA_SELECTED_MESHES": meshes,
-        },
+def rig_fingerprint(source, options):
+    metarig_options = options.metarig
+    return ba_rig_cache.skeleton_fingerprint(
+        source,
+        (
+            metarig_options.initial_scale,
+            metarig_options.remove_face,
+            metarig_options.remove_missing_optional_fingers,
+        ),
     )
 
 
+def reuse_cached_rig(source, fingerprint, options):
+    collection = source.users_collection[0] if source.users_collection else bpy.context.scene.collection
+    metarig, rig = ba_rig_cache.load(fingerprint, collection)
+    if metarig is None:
+        return None, None, None
+
+    report = metarig_stage.new_report()
+    metarig_name = metarig_stage.output_name_for_source(source, options.metarig.output_name_suffix)
+    metarig_stage.archive_existing_output(report, metarig_name, options.metarig.backup_existing_output)
+    metarig.name = metarig_name
+    metarig.data.name = metarig_name
+    rig_basename = f"{source.name}{options.generated_rig_suffix}"
+    metarig.data.rigify_rig_basename = rig_basename
+    rig.name = rig_basename
+    rig.data.name = rig_basename
+    report["created"].append(f"Reused cached metarig and rig {fingerprint[:12]} for {source.name}")
+    return metarig, rig, report
+
+
 def hide_setup_armatures(source, metarig):
     for obj in (source, metarig):
         obj.hide_set(True)
@@ -136,24 +127,63 @@ def hide_setup_armatures(source, metarig):
         obj.hide_render = True
 
 
-def main():
-    source, meshes = require_selection()
+def run(source, meshes, options=None, context=None):
+    options = options or PipelineOptions()
+    context = context or bpy.context
+    result = PipelineReport(source=source, meshes=list(meshes))
+
+    fingerprint = None
+    if options.use_rig_cache:
+        start = time.perf_counter()
+        with span("rig/cache_lookup", source=source.name):
+            fingerprint = rig_fingerprint(source, options)
+            result.metarig, result.rig, result.metarig_report = reuse_cached_rig(source, fingerprint, options)
+        result.rig_cache = "hit" if result.rig is not None else "miss"
+        result.timings["rig_cache"] = time.perf_counter() - start
+
+    if result.rig is None:
+        start = time.perf_counter()
+        with span("rig/metarig", source=source.name):
+            result.metarig, result.metarig_report = metarig_stage.run(source, options.metarig)
+        result.timings["metarig"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with span("rig/generate", source=source.name):
+            result.rig = generate_rigify_rig(result.metarig, source, options.generated_rig_suffix)
+        result.timings["generate"] = time.perf_counter() - start
+
+        # Stored before migration, which adds the source's extra bones to the rig.
+        if fingerprint is not None:
+            with span("rig/cache_store", source=source.name):
+                ba_rig_cache.store(fingerprint, result.metarig, result.rig, source.name)
+
+    start = time.perf_counter()
+    with span("rig/migrate", source=source.name):
+        result.migrate_report = migrate_stage.run(source, result.rig, result.meshes, options.migrate, context)
+    result.timings["migrate"] = time.perf_counter() - start
+
+    hide_setup_armatures(source, result.metarig)
+    # Stages work through context overrides; only the final hand-off
+    # selects the result, as Convert to Rigify always has.
+    select_only([result.rig] + result.meshes, active=result.rig)
+    return result
+
+
+def main(context=None):
+    context = context or bpy.context
+    source, meshes = require_selection(context.selected_objects)
     print("\n=== Auto Rigify bind pipeline ===")
     print(f"Source armature: {source.name}")
     print(f"Meshes: {[mesh.name for mesh in meshes]}")
 
-    metarig = create_and_align_metarig(source)
-    print(f"Generated aligned metarig: {metarig.name}")
-
-    generated_rig = generate_rigify_rig(metarig, source)
-    print(f"Generated Rigify rig: {generated_rig.name}")
-
-    migrate_meshes(source, generated_rig, meshes)
-    hide_setup_armatures(source, metarig)
-    select_only([generated_rig] + meshes, active=generated_rig)
+    result = run(source, meshes, context=context)
+    result.metarig_report.print()
+    result.migrate_report.print(migrate_stage.PRINTED_REPORT_KEYS)
+    print(f"Generated aligned metarig: {result.metarig.name}")
+    print(f"Generated Rigify rig: {result.rig.name} (rig cache: {result.rig_cache})")
     print("Migration completed")
-    print(f"Hidden setup armatures: {source.name}, {metarig.name}")
+    print(f"Hidden setup armatures: {source.name}, {result.metarig.name}")
+    for stage, seconds in result.timings.items():
+        print(f"{stage}: {seconds:.3f}s")
     print("=== End Auto Rigify bind pipeline ===\n")
-
-
-main()
+    return result
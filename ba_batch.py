@@ -0,0 +1,207 @@
+"""Headless batch conversion of BA character exports.
+
+Runs the add-on's character material, outline and Rigify pipeline on many
+characters with a pool of ``blender --background`` worker processes:
+
+    python ba_batch.py --blender /path/to/blender --input exports/ --output out/ --jobs 8
+
+``--input`` is a directory with one folder per character (model file plus
+textures, optionally in a ``textures``/``Texture2D`` subfolder). ``--manifest``
+takes a JSON list of ``{"name", "model", "textures"}`` entries instead. Each
+character produces ``<output>/<name>.blend`` and ``<output>/<name>.json``;
+characters whose report already says ``"ok"`` are skipped, so rerunning the same
+command resumes after a crash.
+
+This file runs under a plain Python interpreter and must not import bpy.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+MODEL_EXTENSIONS = (".fbx", ".glb", ".gltf", ".blend")
+TEXTURE_SUBFOLDERS = ("textures", "Textures", "Texture2D", "texture")
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ba_batch_worker.py")
+DEFAULT_RETRIES = 1
+DEFAULT_TIMEOUT = 1800
+SUMMARY_NAME = "batch_summary.json"
+
+
+def find_model(folder):
+    models = sorted(
+        name for name in os.listdir(folder)
+        if os.path.splitext(name)[1].lower() in MODEL_EXTENSIONS
+    )
+    return os.path.join(folder, models[0]) if models else None
+
+
+def find_texture_dir(folder):
+    for name in TEXTURE_SUBFOLDERS:
+        path = os.path.join(folder, name)
+        if os.path.isdir(path):
+            return path
+    return folder
+
+
+def characters_from_directory(root):
+    characters = []
+    for name in sorted(os.listdir(root)):
+        folder = os.path.join(root, name)
+        if not os.path.isdir(folder):
+            continue
+        model = find_model(folder)
+        if model is None:
+            print(f"[BA batch] No model file in {folder}; skipped")
+            continue
+        characters.append({"name": name, "model": model, "textures": find_texture_dir(folder)})
+    return characters
+
+
+def characters_from_manifest(path):
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    characters = []
+    for entry in entries:
+        model = os.path.join(base, entry["model"])
+        textures = os.path.join(base, entry.get("textures") or os.path.dirname(entry["model"]))
+        name = entry.get("name") or os.path.splitext(os.path.basename(model))[0]
+        characters.append({"name": name, "model": model, "textures": textures})
+    return characters
+
+
+def read_report(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(path, data):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(temp_path, path)
+
+
+def is_done(job):
+    report = read_report(job["report"])
+    return report is not None and report.get("status") == "ok" and os.path.isfile(job["output"])
+
+
+def build_job(character, args):
+    output_dir = os.path.abspath(args.output)
+    name = character["name"]
+    return {
+        "name": name,
+        "model": os.path.abspath(character["model"]),
+        "textures": os.path.abspath(character["textures"]),
+        "output": os.path.join(output_dir, f"{name}.blend"),
+        "report": os.path.join(output_dir, f"{name}.json"),
+        "log": os.path.join(output_dir, f"{name}.log"),
+        "job_file": os.path.join(output_dir, f"{name}.job.json"),
+        "rig": not args.no_rig,
+    }
+
+
+def run_job(job, blender, retries, timeout):
+    write_json(job["job_file"], job)
+    command = [
+        blender,
+        "--background",
+        "--factory-startup",
+        "--python-exit-code", "1",
+        "--python", WORKER_SCRIPT,
+        "--", "--job", job["job_file"],
+    ]
+
+    attempts = []
+    for attempt in range(1, retries + 2):
+        start = time.perf_counter()
+        try:
+            with open(job["log"], "a", encoding="utf-8") as log:
+                log.write(f"\n=== attempt {attempt} ===\n")
+                log.flush()
+                completed = subprocess.run(command, stdout=log, stderr=subprocess.STDOUT, timeout=timeout)
+            returncode = completed.returncode
+        except subprocess.TimeoutExpired:
+            returncode = "timeout"
+        elapsed = time.perf_counter() - start
+
+        report = read_report(job["report"])
+        status = report.get("status") if report else "crashed"
+        attempts.append({"attempt": attempt, "returncode": returncode, "status": status, "elapsed": elapsed})
+        if status == "ok" and returncode == 0:
+            break
+
+    report = read_report(job["report"]) or {"name": job["name"], "status": "crashed"}
+    if report.get("status") == "ok" and attempts[-1]["returncode"] != 0:
+        report["status"] = "failed"
+    report["attempts"] = attempts
+    write_json(job["report"], report)
+    try:
+        os.remove(job["job_file"])
+    except OSError:
+        pass
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-convert BA character exports with headless Blender workers.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="Directory with one folder per character")
+    source.add_argument("--manifest", help="JSON list of {name, model, textures} entries")
+    parser.add_argument("--output", required=True, help="Directory for processed .blend files and reports")
+    parser.add_argument("--blender", default=os.environ.get("BLENDER", "blender"), help="Blender executable")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Number of parallel Blender workers")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help="Extra attempts per failed character")
+    parser.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT, help="Seconds before a worker is killed")
+    parser.add_argument("--no-rig", action="store_true", help="Skip Convert to Rigify")
+    parser.add_argument("--force", action="store_true", help="Reprocess characters that already succeeded")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.output, exist_ok=True)
+
+    characters = characters_from_manifest(args.manifest) if args.manifest else characters_from_directory(args.input)
+    jobs = [build_job(character, args) for character in characters]
+    pending = [job for job in jobs if args.force or not is_done(job)]
+    print(f"[BA batch] {len(jobs)} characters, {len(jobs) - len(pending)} already done, {len(pending)} to run")
+
+    results = {}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = {pool.submit(run_job, job, args.blender, args.retries, args.timeout): job for job in pending}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                report = future.result()
+            except Exception as exc:
+                report = {"name": job["name"], "status": "error", "error": str(exc)}
+            results[job["name"]] = report
+            print(f"[BA batch] {job['name']}: {report.get('status')}")
+
+    summary = {
+        "elapsed": time.perf_counter() - start,
+        "characters": len(jobs),
+        "skipped": len(jobs) - len(pending),
+        "results": {name: report.get("status") for name, report in sorted(results.items())},
+    }
+    write_json(os.path.join(args.output, SUMMARY_NAME), summary)
+    failed = [name for name, status in summary["results"].items() if status != "ok"]
+    if failed:
+        print(f"[BA batch] {len(failed)} failed: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""Per-character worker for ba_batch.py, run inside ``blender --background``.
+
+    blender --background --factory-startup --python ba_batch_worker.py -- --job job.json
+
+Loads the add-on from this folder, imports the model, sets up materials,
+outlines and the Rigify rig, then saves the .blend and a JSON report.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+import traceback
+
+import addon_utils
+import bpy
+
+
+ADDON_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_MODULE = "ba_auto_material"
+
+
+def load_addon():
+    module = sys.modules.get(ADDON_MODULE)
+    if module is not None:
+        return module
+    spec = importlib.util.spec_from_file_location(
+        ADDON_MODULE,
+        os.path.join(ADDON_DIR, "__init__.py"),
+        submodule_search_locations=[ADDON_DIR],
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[ADDON_MODULE] = module
+    spec.loader.exec_module(module)
+    module.register()
+    return module
+
+
+def write_report(path, report):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1, sort_keys=True)
+    os.replace(temp_path, path)
+
+
+def import_model(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".blend":
+        bpy.ops.wm.open_mainfile(filepath=path)
+    elif ext == ".fbx":
+        bpy.ops.import_scene.fbx(filepath=path)
+    elif ext in {".glb", ".gltf"}:
+        bpy.ops.import_scene.gltf(filepath=path)
+    else:
+        raise RuntimeError(f"Unsupported model format: {path}")
+
+
+def texture_files(directory):
+    return sorted(
+        name for name in os.listdir(directory)
+        if os.path.isfile(os.path.join(directory, name))
+        and os.path.splitext(name)[1].lower() in {".png", ".tga", ".jpg", ".jpeg", ".dds", ".tif", ".tiff"}
+    )
+
+
+def character_objects(rig_utils):
+    meshes = [obj for obj in bpy.context.scene.objects if obj.type == 'MESH']
+    armatures = [
+        obj for obj in bpy.context.scene.objects
+        if obj.type == 'ARMATURE' and not rig_utils.is_ignored_rig(obj)
+    ]
+    return meshes, armatures
+
+
+class StageTimer:
+    def __init__(self, report):
+        self.report = report
+
+    def __call__(self, name, func, *args, **kwargs):
+        start = time.perf_counter()
+        self.report["stage"] = name
+        result = func(*args, **kwargs)
+        self.report["stages"][name] = time.perf_counter() - start
+        return result
+
+
+def process(job, report):
+    load_addon()
+    ba_utils = sys.modules[f"{ADDON_MODULE}.ba_utils"]
+    rig_utils = sys.modules[f"{ADDON_MODULE}.ba_rig_utils"]
+    ch_materials = sys.modules[f"{ADDON_MODULE}.ba_ch_materials"]
+    pipeline = sys.modules[f"{ADDON_MODULE}.auto_rigify_bind_pipeline"]
+    stage = StageTimer(report)
+
+    stage("import", import_model, job["model"])
+    meshes, armatures = character_objects(rig_utils)
+    if not meshes:
+        raise RuntimeError(f"No meshes imported from {job['model']}")
+    report["meshes"] = [mesh.name for mesh in meshes]
+    report["armatures"] = [armature.name for armature in armatures]
+
+    directory = job["textures"]
+    images = stage("textures", ba_utils.load_texture_index, directory, texture_files(directory))
+    report["textures"] = len(images)
+
+    with rig_utils.object_context(meshes[0], meshes + armatures):
+        mats = stage("materials", ch_materials.setup_character, bpy.context, images)
+    report["materials"] = sorted(mat.name for mat in mats)
+
+    if job.get("rig", True):
+        if len(armatures) != 1:
+            report["warnings"].append(f"Expected one source armature, found {len(armatures)}; skipped Rigify")
+        else:
+            result = stage("rigify", pipeline.run, armatures[0], meshes)
+            report["rig"] = result.rig.name
+            report["rig_cache"] = result.rig_cache
+            report["rig_timings"] = result.timings
+            report["warnings"].extend(result.migrate_report["warnings"])
+
+    os.makedirs(os.path.dirname(job["output"]), exist_ok=True)
+    stage("save", bpy.ops.wm.save_as_mainfile, filepath=job["output"], compress=True)
+
+    if ba_utils.profiler.enabled:
+        report["spans"] = {
+            name: {"calls": calls, "total": total}
+            for name, (calls, total) in ba_utils.profiler.stats.items()
+        }
+
+
+def main(argv=None):
+    argv = sys.argv[sys.argv.index("--") + 1:] if argv is None and "--" in sys.argv else (argv or [])
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--job", required=True)
+    args = parser.parse_args(argv)
+
+    with open(args.job, "r", encoding="utf-8") as f:
+        job = json.load(f)
+
+    report = {
+        "name": job["name"],
+        "model": job["model"],
+        "output": job["output"],
+        "blender": bpy.app.version_string,
+        "status": "running",
+        "stage": "",
+        "stages": {},
+        "warnings": [],
+    }
+    # A "running" report left behind means the worker crashed mid-stage.
+    write_report(job["report"], report)
+
+    start = time.perf_counter()
+    addon_utils.enable("rigify", default_set=True)
+    try:
+        process(job, report)
+        report["status"] = "ok"
+    except Exception as exc:
+        report["status"] = "error"
+        report["error"] = str(exc)
+        report["traceback"] = traceback.format_exc()
+        print(f"[BA batch] {job['name']} failed in {report['stage']}: {exc}")
+    report["elapsed"] = time.perf_counter() - start
+    write_report(job["report"], report)
+    return report["status"] == "ok"
+
+
+if __name__ == "__main__":
+    if not main():
+        sys.exit(1)
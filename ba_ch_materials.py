@@ -1,41 +1,26 @@
 import bpy
-import os
 from bpy.props import StringProperty, CollectionProperty
 from bpy.types import Operator, PropertyGroup
 
 from . import ba_shader_controls
 from . import ba_outline
-from .ba_utils import add_light_color_node, add_lit_alpha_node, clear_nodes, configure_alpha_material, ensure_node_group, ensure_output, link_alpha_to_output, new_tex, refresh_view_layer, safe_link
+from .ba_rig_utils import object_context
+from .ba_scene_plan import ScenePlan
+from .ba_utils import MaterialTemplates, SteppedOperator, id_alive, add_light_color_node, add_lit_alpha_node, build_material, clear_nodes, configure_alpha_material, ensure_node_group, ensure_output, image_stem, link_alpha_to_output, load_texture_index, new_tex, preload_library, refresh_view_layer, report_profile, run_steps, safe_link, span, texture_index
+
+CHARACTER_NODE_GROUPS = (
+    "ba_body_shader",
+    "ba_face_shader",
+    "ba_hair_shader",
+    "ba_light_color",
+    "ba_alpha",
+    "ba_no_shadow",
+    "eyebrow_in_front",
+)
 
 # -------- utils--------
-def build_import_image_map(images):
-
-    image_map = {}
-
-    for img in images:
-        if not img.filepath:
-            continue
-
-        name = os.path.splitext(
-            os.path.basename(bpy.path.abspath(img.filepath))
-        )[0]
-
-        image_map[name] = img
-
-    return image_map
-
 def find_image(images, keyword):
-    for img in images:
-        if not img.filepath:
-            continue
-
-        name = os.path.splitext(
-            os.path.basename(bpy.path.abspath(img.filepath))
-        )[0]
-
-        if name.lower().endswith(keyword.lower()):
-            return img
-    return None
+    return texture_index(images).find(keyword)
 
 def detect_material_base_type(mat):
     if not mat or not mat.use_nodes or not mat.node_tree:
@@ -49,9 +34,7 @@ def detect_material_base_type(mat):
         if not img or not img.filepath:
             continue
 
-        name = os.path.splitext(
-            os.path.basename(bpy.path.abspath(img.filepath))
-        )[0].lower()
+        name = image_stem(img).lower()
 
         if name.endswith("_body"):
             return "BODY"
@@ -83,7 +66,7 @@ def setup_emission(mat, image, strength=1.0):
     safe_link(nt, tex.outputs.get('Color'), emission.inputs.get('Color'))
     safe_link(nt, emission.outputs.get('Emission'), out.inputs.get('Surface'))
 
-def setup_eyemouth(mat, images):
+def setup_eyemouth(mat, images, templates=None):
 
     if not mat.use_nodes:
         mat.use_nodes = True
@@ -91,12 +74,18 @@ def setup_eyemouth(mat, images):
     tex = find_image(images, "EyeMouth")
     if tex is None:
         print(f"[BA] EyeMouth texture missing for {mat.name}")
-        return
+        return mat
+
+    mat = build_material(mat, "setup_eyemouth", {"EyeMouth": tex}, build_eyemouth, templates)
+    print(f"[BA] EyeMouth setup with ba_no_shadow: {mat.name}")
+    return mat
 
+
+def build_eyemouth(mat, roles):
     clear_nodes(mat)
     nt = mat.node_tree
 
-    tex_node = new_tex(nt, tex, False, (-400, 0))
+    tex_node = new_tex(nt, roles["EyeMouth"], False, (-400, 0), "EyeMouth")
 
     no_shadow_node = nt.nodes.new("ShaderNodeGroup")
     no_shadow_node.node_tree = ensure_node_group("ba_no_shadow")
@@ -114,23 +103,28 @@ def setup_eyemouth(mat, images):
     out_node = ensure_output(mat)
     safe_link(nt, no_shadow_node.outputs[0], out_node.inputs['Surface'])
 
-    print(f"[BA] EyeMouth setup with ba_no_shadow: {mat.name}")
 
 
 
-def setup_body(mat, images):
-    clear_nodes(mat)
-    nt = mat.node_tree
-
+def setup_body(mat, images, templates=None):
     tex_body = find_image(images, "Body")
     tex_mask = find_image(images, "Body_Mask")
 
     if not tex_body:
+        clear_nodes(mat)
         print(f"[BA] Body texture missing: {mat.name}")
-        return
+        return mat
+
+    roles = {"Body": tex_body, "Body_Mask": tex_mask}
+    return build_material(mat, "setup_body", roles, build_body, templates)
 
-    body = new_tex(nt, tex_body, False, (-600, 100))
-    mask = new_tex(nt, tex_mask, True, (-600, -100)) if tex_mask else None
+
+def build_body(mat, roles):
+    clear_nodes(mat)
+    nt = mat.node_tree
+
+    body = new_tex(nt, roles["Body"], False, (-600, 100), "Body")
+    mask = new_tex(nt, roles["Body_Mask"], True, (-600, -100), "Body_Mask")
 
     shader = nt.nodes.new("ShaderNodeGroup")
     shader.node_tree = ensure_node_group("ba_body_shader")
@@ -154,19 +148,25 @@ def setup_body(mat, images):
     safe_link(nt, light_color.outputs.get('Color'), out.inputs['Surface'])
 
 
-def setup_face(mat, images):
-    clear_nodes(mat)
-    nt = mat.node_tree
-
+def setup_face(mat, images, templates=None):
     tex_face = find_image(images, "Face")
     tex_mask = find_image(images, "Face_Mask")
 
     if not tex_face:
+        clear_nodes(mat)
         print(f"[BA] Face texture missing: {mat.name}")
-        return
+        return mat
 
-    face = new_tex(nt, tex_face, False, (-600, 100))
-    mask = new_tex(nt, tex_mask, True, (-600, -100)) if tex_mask else None
+    roles = {"Face": tex_face, "Face_Mask": tex_mask}
+    return build_material(mat, "setup_face", roles, build_face, templates)
+
+
+def build_face(mat, roles):
+    clear_nodes(mat)
+    nt = mat.node_tree
+
+    face = new_tex(nt, roles["Face"], False, (-600, 100), "Face")
+    mask = new_tex(nt, roles["Face_Mask"], True, (-600, -100), "Face_Mask")
 
     shader = nt.nodes.new("ShaderNodeGroup")
     shader.node_tree = ensure_node_group("ba_face_shader")
@@ -189,21 +189,27 @@ def setup_face(mat, images):
     safe_link(nt, light_color.outputs.get('Color'), out.inputs['Surface'])
 
 
-def setup_hair(mat, images):
-    clear_nodes(mat)
-    nt = mat.node_tree
-
+def setup_hair(mat, images, templates=None):
     tex_hair = find_image(images, "Hair")
     tex_mask = find_image(images, "Hair_Mask")
     tex_spec = find_image(images, "Hair_Spec")
 
     if not tex_hair:
+        clear_nodes(mat)
         print(f"[BA] Hair texture missing: {mat.name}")
-        return
+        return mat
+
+    roles = {"Hair": tex_hair, "Hair_Mask": tex_mask, "Hair_Spec": tex_spec}
+    return build_material(mat, "setup_hair", roles, build_hair, templates)
+
 
-    hair = new_tex(nt, tex_hair, False, (-600, 200))
-    mask = new_tex(nt, tex_mask, True, (-600, 0)) if tex_mask else None
-    spec = new_tex(nt, tex_spec, True, (-600, -200)) if tex_spec else None
+def build_hair(mat, roles):
+    clear_nodes(mat)
+    nt = mat.node_tree
+
+    hair = new_tex(nt, roles["Hair"], False, (-600, 200), "Hair")
+    mask = new_tex(nt, roles["Hair_Mask"], True, (-600, 0), "Hair_Mask")
+    spec = new_tex(nt, roles["Hair_Spec"], True, (-600, -200), "Hair_Spec")
 
     shader = nt.nodes.new("ShaderNodeGroup")
     shader.node_tree = ensure_node_group("ba_hair_shader")
@@ -229,7 +235,7 @@ def setup_hair(mat, images):
 
     safe_link(nt, light_color.outputs.get('Color'), out.inputs['Surface'])
 
-def setup_eyebrow(mat, images):
+def setup_eyebrow(mat, images, templates=None):
     if not mat.use_nodes:
         mat.use_nodes = True
 
@@ -245,6 +251,12 @@ def setup_eyebrow(mat, images):
     else:
         tex = None
 
+    return build_material(mat, "setup_eyebrow", {"Eyebrow": tex}, build_eyebrow, templates)
+
+
+def build_eyebrow(mat, roles):
+    tex = roles["Eyebrow"]
+
     if tex is None:
         clear_nodes(mat)
         nt = mat.node_tree
@@ -277,7 +289,7 @@ def setup_eyebrow(mat, images):
     clear_nodes(mat)
     nt = mat.node_tree
 
-    tex_node = new_tex(nt, tex, False, (-400, 0))
+    tex_node = new_tex(nt, tex, False, (-400, 0), "Eyebrow")
 
     # ba_no_shadow
     no_shadow_node = nt.nodes.new("ShaderNodeGroup")
@@ -306,21 +318,28 @@ def setup_eyebrow(mat, images):
 
     mat.displacement_method = 'BOTH'
 
-def setup_body_alpha(mat, images):
-    clear_nodes(mat)
-    nt = mat.node_tree
-
+def setup_body_alpha(mat, images, templates=None):
     tex_body = find_image(images, "Body")
     tex_mask = find_image(images, "Body_Mask")
 
-    configure_alpha_material(mat)
-
     if not tex_body:
+        clear_nodes(mat)
+        configure_alpha_material(mat)
         print(f"[BA] Body texture missing: {mat.name}")
-        return
+        return mat
+
+    roles = {"Body": tex_body, "Body_Mask": tex_mask}
+    return build_material(mat, "setup_body_alpha", roles, build_body_alpha, templates)
 
-    body = new_tex(nt, tex_body, False, (-800, 100))
-    mask = new_tex(nt, tex_mask, True, (-800, -100)) if tex_mask else None
+
+def build_body_alpha(mat, roles):
+    clear_nodes(mat)
+    nt = mat.node_tree
+
+    configure_alpha_material(mat)
+
+    body = new_tex(nt, roles["Body"], False, (-800, 100), "Body")
+    mask = new_tex(nt, roles["Body_Mask"], True, (-800, -100), "Body_Mask")
 
     body_shader = nt.nodes.new("ShaderNodeGroup")
     body_shader.node_tree = ensure_node_group("ba_body_shader")
@@ -343,26 +362,33 @@ def setup_body_alpha(mat, images):
         alpha_loc=(80, 0),
     )
 
-    link_alpha_to_output(nt, alpha_shader, out)
+    link_alpha_to_output(nt, alpha_shader, out)
 
 
-def setup_hair_alpha(mat, images):
-    clear_nodes(mat)
-    nt = mat.node_tree
-
+def setup_hair_alpha(mat, images, templates=None):
     tex_hair = find_image(images, "Hair")
     tex_mask = find_image(images, "Hair_Mask")
     tex_spec = find_image(images, "Hair_Spec")
 
-    configure_alpha_material(mat)
-
     if not tex_hair:
+        clear_nodes(mat)
+        configure_alpha_material(mat)
         print(f"[BA] Hair texture missing: {mat.name}")
-        return
+        return mat
+
+    roles = {"Hair": tex_hair, "Hair_Mask": tex_mask, "Hair_Spec": tex_spec}
+    return build_material(mat, "setup_hair_alpha", roles, build_hair_alpha, templates)
 
-    hair = new_tex(nt, tex_hair, False, (-800, 200))
-    mask = new_tex(nt, tex_mask, True, (-800, 0)) if tex_mask else None
-    spec = new_tex(nt, tex_spec, True, (-800, -200)) if tex_spec else None
+
+def build_hair_alpha(mat, roles):
+    clear_nodes(mat)
+    nt = mat.node_tree
+
+    configure_alpha_material(mat)
+
+    hair = new_tex(nt, roles["Hair"], False, (-800, 200), "Hair")
+    mask = new_tex(nt, roles["Hair_Mask"], True, (-800, 0), "Hair_Mask")
+    spec = new_tex(nt, roles["Hair_Spec"], True, (-800, -200), "Hair_Spec")
 
     hair_shader = nt.nodes.new("ShaderNodeGroup")
     hair_shader.node_tree = ensure_node_group("ba_hair_shader")
@@ -388,20 +414,20 @@ def setup_hair_alpha(mat, images):
         alpha_loc=(80, 0),
     )
 
-    link_alpha_to_output(nt, alpha_shader, out)
+    link_alpha_to_output(nt, alpha_shader, out)
 
 
-def setup_frill_alpha(mat, images):
-    setup_body_alpha(mat, images)
+def setup_frill_alpha(mat, images, templates=None):
+    return setup_body_alpha(mat, images, templates)
 
 
-CHARACTER_MATERIAL_HANDLERS = (
-    ("_Body_Arms", setup_body),
-    ("_Body", setup_body),
-    ("_Hair_Alpha", setup_hair_alpha),
-    ("_Frill", setup_frill_alpha),
-    ("_Alpha", setup_body_alpha),
-    ("_Face", setup_face),
+CHARACTER_MATERIAL_HANDLERS = (
+    ("_Body_Arms", setup_body),
+    ("_Body", setup_body),
+    ("_Hair_Alpha", setup_hair_alpha),
+    ("_Frill", setup_frill_alpha),
+    ("_Alpha", setup_body_alpha),
+    ("_Face", setup_face),
     ("_Hair", setup_hair),
     ("_EyeMouth", setup_eyemouth),
     ("_Eyebrow2", setup_eyebrow),
@@ -409,18 +435,90 @@ CHARACTER_MATERIAL_HANDLERS = (
 )
 
 
-def setup_character_material(mat, images):
+def character_material_handler(mat):
     for suffix, handler in CHARACTER_MATERIAL_HANDLERS:
         if mat.name.endswith(suffix):
-            handler(mat, images)
-            return True
+            return handler
+    return None
+
+
+def setup_character_material(mat, images, templates=None):
+    # Returns mat itself, built in place (from a shared template when
+    # templates is given), or None when no handler matches.
+    handler = character_material_handler(mat)
+    if handler is None:
+        return None
+    with span(f"material/{handler.__name__}", material=mat.name):
+        return handler(mat, images, templates)
+
+
+def setup_character_steps(context, images):
+    # One step per material, one for the shader controls and one per mesh
+    # outline. The selection is captured up front in a ScenePlan so later
+    # steps see the same objects even if the user clicks around in between,
+    # and shared materials are only visited once.
+    with span("preload_library"):
+        preload_library(
+            node_groups=CHARACTER_NODE_GROUPS + ba_outline.LIBRARY_NODE_GROUPS,
+            materials=ba_outline.LIBRARY_MATERIALS,
+        )
+
+    # Objects and materials can be deleted between steps; each step looks
+    # its datablock up again and skips it when it is gone.
+    active = context.active_object
+    plan = ScenePlan.from_context(context, classify=character_material_handler)
+    names = [mat.name for mat in plan.materials() if mat.use_nodes]
+
+    total = len(names) + 1 + len(plan.meshes)
+    done = 0
+    built = set()
+    templates = MaterialTemplates()
+    try:
+        for name in names:
+            context = yield done, total, f"Material {name}"
+            mat = bpy.data.materials.get(name)
+            if mat is None:
+                done += 1
+                continue
+            handler = plan.role(mat)
+            if handler is not None:
+                with span(f"material/{handler.__name__}", material=mat.name):
+                    mat = handler(mat, images, templates) or mat
+            built.add(mat)
+            done += 1
+    finally:
+        templates.clear()
+
+    context = yield done, total, "Shader controls"
+    plan.prune()
+    if active is not None and not id_alive(active):
+        active = None
+    with span("drivers"), object_context(active, plan.objects):
+        ba_shader_controls.setup_shader_controls(bpy.context, plan)
+    done += 1
+
+    outline_mats = ba_outline.import_outline_materials()
+    for obj in plan.meshes:
+        context = yield done, total, "Outline"
+        if not id_alive(obj):
+            done += 1
+            continue
+        with span("outline/geometry_nodes", object=obj.name):
+            ba_outline.setup_outline_geometry_nodes(obj, outline_mats)
+        done += 1
+
+    with span("refresh_view_layer"):
+        refresh_view_layer(context)
+    return built
 
-    return False
+
+def setup_character(context, images):
+    return run_steps(setup_character_steps(context, images), context)
 
 
 # -------- Operator --------
 
-class BA_OT_setup_materials(Operator):
+class BA_OT_setup_materials(SteppedOperator, Operator):
     bl_idname = "ba.setup_materials_ch"
     bl_label = "Setup Character Materials"
 
@@ -428,38 +526,15 @@ class BA_OT_setup_materials(Operator):
     directory: StringProperty(subtype='DIR_PATH')
 
     def invoke(self, context, event):
+        self._interactive = True
         context.window_manager.fileselect_add(self)
         return {'RUNNING_MODAL'}
 
-    def execute(self, context):
-        images = []
-        for f in self.files:
-            path = os.path.join(self.directory, f.name)
-            img = bpy.data.images.load(path, check_existing=True)
-            images.append(img)
-
-        mats = set()
-        for obj in context.selected_objects:
-            if obj.type != 'MESH':
-                continue
-            for slot in obj.material_slots:
-                if slot.material and slot.material.use_nodes:
-                    mats.add(slot.material)
+    def steps(self, context):
+        with span("load_images"):
+            images = load_texture_index(self.directory, [f.name for f in self.files])
+        return (yield from setup_character_steps(context, images))
 
-        for mat in mats:
-            setup_character_material(mat, images)
-
-        ba_shader_controls.remove_shared_node_group_drivers()
-        ba_shader_controls.ensure_hair_spec_control(context)
-        ba_shader_controls.ensure_face_light_dot_control(context)
-
-        empty = bpy.data.objects.get("face_light_dot")
-        ba_shader_controls.add_face_rotation_drivers(empty, context)
-
-        empty = bpy.data.objects.get("hair_spec_normal")
-        ba_shader_controls.add_hair_rotation_drivers(empty, context)
-
-        ba_outline.add_ba_outline(context)
-        refresh_view_layer(context)
-
-        return {'FINISHED'}
+    def finish(self, context, result):
+        report_profile(self, "Setup Character Materials")
+        return {'FINISHED'}
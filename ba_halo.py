@@ -31,7 +31,7 @@ class BA_OT_halo_pick_image(bpy.types.Operator, ImportHelper):
 
         image = bpy.data.images.get(image_name)
         if not image:
-            image = bpy.data.images.load(image_path)
+            image = bpy.data.images.load(image_path, check_existing=True)
 
 
         mat = bpy.data.materials.new(name="BA_Halo_Emission")
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+
+import bpy
+
+
+MANIFEST_VERSION = 2
+MANIFEST_DIR = "ba_auto_material"
+MANIFEST_SUFFIX = ".manifest.json"
+ASSET_KINDS = ("node_groups", "materials", "collections")
+
+_manifests = {}
+
+
+def manifest_path(blend_path):
+    try:
+        config_dir = bpy.utils.user_resource('CONFIG', path=MANIFEST_DIR, create=True)
+    except (TypeError, ValueError, OSError):
+        config_dir = ""
+    if not config_dir:
+        config_dir = os.path.dirname(blend_path)
+    return os.path.join(config_dir, os.path.basename(blend_path) + MANIFEST_SUFFIX)
+
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_manifest_file(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest_file(path, manifest):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(temp_path, path)
+    except OSError as exc:
+        print(f"[BA] Could not write library manifest {path}: {exc}")
+
+
+def group_sockets(group):
+    return [
+        {
+            "name": item.name,
+            "identifier": item.identifier,
+            "in_out": item.in_out,
+            "socket_type": item.socket_type,
+        }
+        for item in group.interface.items_tree
+        if item.item_type == 'SOCKET'
+    ]
+
+
+def scan_library(blend_path):
+    # Node groups are read into throwaway BlendData for their interfaces, so
+    # the user's file never sees them. Only runs when the manifest is rebuilt.
+    with bpy.data.temp_data() as temp_data:
+        with temp_data.libraries.load(blend_path, link=False) as (data_from, data_to):
+            listing = {kind: sorted(getattr(data_from, kind)) for kind in ASSET_KINDS}
+            data_to.node_groups = list(data_from.node_groups)
+
+        listing["sockets"] = {
+            group.name: group_sockets(group)
+            for group in data_to.node_groups
+            if group is not None and group.bl_idname == "GeometryNodeTree"
+        }
+    return listing
+
+
+def build_manifest(blend_path, size, mtime_ns, content_hash):
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "blend": os.path.basename(blend_path),
+        "size": size,
+        "mtime_ns": mtime_ns,
+        "hash": content_hash,
+    }
+    manifest.update(scan_library(blend_path))
+    return manifest
+
+
+def load_manifest(blend_path):
+    try:
+        stat = os.stat(blend_path)
+    except OSError:
+        _manifests.pop(blend_path, None)
+        return None
+
+    # The in-memory entry is only trusted while the file's size and mtime
+    # match, so a library replaced during the session is picked up.
+    cached = _manifests.get(blend_path)
+    if (
+        cached is not None
+        and cached.get("size") == stat.st_size
+        and cached.get("mtime_ns") == stat.st_mtime_ns
+    ):
+        return cached
+
+    path = manifest_path(blend_path)
+    manifest = read_manifest_file(path)
+
+    if (
+        manifest is None
+        or manifest.get("version") != MANIFEST_VERSION
+        or manifest.get("size") != stat.st_size
+    ):
+        manifest = build_manifest(blend_path, stat.st_size, stat.st_mtime_ns, file_hash(blend_path))
+        write_manifest_file(path, manifest)
+    elif manifest.get("mtime_ns") != stat.st_mtime_ns:
+        # Same size but touched: only trust the cached listing if the bytes match.
+        content_hash = file_hash(blend_path)
+        if manifest.get("hash") == content_hash:
+            manifest["mtime_ns"] = stat.st_mtime_ns
+        else:
+            manifest = build_manifest(blend_path, stat.st_size, stat.st_mtime_ns, content_hash)
+        write_manifest_file(path, manifest)
+
+    _manifests[blend_path] = manifest
+    return manifest
+
+
+def library_has(blend_path, kind, name):
+    manifest = load_manifest(blend_path)
+    if manifest is None:
+        return None
+    return name in manifest.get(kind, ())
+
+
+def library_sockets(blend_path, group_name):
+    manifest = load_manifest(blend_path)
+    if manifest is None:
+        return None
+    return manifest.get("sockets", {}).get(group_name)
+
+
+def socket_identifier(blend_path, group_name, socket_name, in_out='INPUT'):
+    for socket in library_sockets(blend_path, group_name) or ():
+        if socket["name"] == socket_name and socket["in_out"] == in_out:
+            return socket["identifier"]
+    return None
+
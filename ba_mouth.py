@@ -2,6 +2,8 @@
 import bpy
 import os
 
+from . import ba_manifest
+
 
 def setup_mouth(context):
     """
@@ -24,6 +26,9 @@ def setup_mouth(context):
 
     if collection_name in bpy.data.collections:
         mouth_col = bpy.data.collections.get(collection_name)
+    elif ba_manifest.library_has(blend_path, "collections", collection_name) is False:
+        print("[BA Mouth] Collection 'mouth' not found in blend")
+        return
     else:
         with bpy.data.libraries.load(blend_path, link=False) as (data_from, data_to):
             if collection_name not in data_from.collections:
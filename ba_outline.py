@@ -1,13 +1,27 @@
+import hashlib
+
 import bpy
+import numpy as np
 
+from .ba_outline_hull import (
+    OUTLINE_LOD_DROP_ATTRIBUTE,
+    build_outline_lod_attributes,
+    managed_outline_group,
+    topology_hash,
+)
 from .ba_utils import (
+    depsgraph_updates,
     ensure_socket_is_attribute,
     import_material,
     import_node_group,
+    recipe_signature,
+    refresh_view_layer,
     remove_existing_nodes_modifier,
+    span,
 )
 
 GEO_NODE_NAME = "ba_outline"
+BAKED_GEO_NODE_NAME = "ba_outline_baked"
 
 OUTLINE_MATERIALS = {
     "HairOutline": "hair_outline",
@@ -15,6 +29,17 @@ OUTLINE_MATERIALS = {
     "BodyOutline": "body_outline",
 }
 
+OUTLINE_MATERIAL_SUFFIXES = ("_Hair", "_Face", "_Body", "_Body_Arms")
+
+OUTLINE_RECIPE_PROPERTY = "ba_outline_recipe"
+
+OUTLINE_NORMAL_ATTRIBUTE = "ba_outline_normal"
+OUTLINE_NORMAL_RECIPE_PROPERTY = "ba_outline_normal_recipe"
+OUTLINE_NORMAL_WELD_DISTANCE = 1e-5
+
+LIBRARY_NODE_GROUPS = (GEO_NODE_NAME,)
+LIBRARY_MATERIALS = tuple(OUTLINE_MATERIALS.values())
+
 # ------------------------------------------------------------
 # Vertex group creation
 # ------------------------------------------------------------
@@ -23,52 +48,237 @@ def build_outline_vertex_group(obj):
     if obj.type != 'MESH':
         return None
 
+    mesh = obj.data
+
     vg = obj.vertex_groups.get("outline")
     if vg is None:
         vg = obj.vertex_groups.new(name="outline")
+    else:
+        vg.remove(range(len(mesh.vertices)))
+
+    # Decide per slot once, then expand to polygons and loops with arrays.
+    slot_mask = np.array(
+        [
+            bool(slot.material and slot.material.name.endswith(OUTLINE_MATERIAL_SUFFIXES))
+            for slot in obj.material_slots
+        ],
+        dtype=bool,
+    )
+    if not slot_mask.any():
+        return vg
+
+    polygons = mesh.polygons
+    material_index = np.empty(len(polygons), dtype=np.int32)
+    loop_totals = np.empty(len(polygons), dtype=np.int32)
+    polygons.foreach_get("material_index", material_index)
+    polygons.foreach_get("loop_total", loop_totals)
+
+    loop_vertices = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loop_vertices)
+
+    np.clip(material_index, 0, len(slot_mask) - 1, out=material_index)
+    loop_mask = np.repeat(slot_mask[material_index], loop_totals)
+    vertices = np.unique(loop_vertices[loop_mask])
+
+    if len(vertices):
+        vg.add(vertices.tolist(), 1.0, 'REPLACE')
 
-    mesh = obj.data
+    return vg
 
-    vg.remove(range(len(mesh.vertices)))
 
-    for poly in mesh.polygons:
-        mat = obj.material_slots[poly.material_index].material
-        if not mat:
-            continue
+# ------------------------------------------------------------
+# Smoothed outline normals
+# ------------------------------------------------------------
+# Hard edges split the mesh normals, so extruding along them tears the hull
+# apart. The outline extrudes along a baked point attribute instead: corner
+# angle-weighted face normals summed over all vertices sharing a position.
+#
+# The attribute is in rest object space. The outline modifier reads it from a
+# managed copy of the library group and sits before the Armature modifier,
+# so the hull is built in that rest space and then deformed with the mesh.
+
+def outline_normal_signature(mesh, topology):
+    # Keyed on topology only: the normals are recomputed when faces change,
+    # not on every vertex edit.
+    return recipe_signature(OUTLINE_NORMAL_ATTRIBUTE, len(mesh.vertices), len(mesh.polygons), topology)
+
+
+def smoothed_normals(co, loop_vertices, loop_starts, loop_totals, face_normals, vertex_normals):
+    # Corner angles from the neighbouring corners of each polygon.
+    loop_polygons = np.repeat(np.arange(len(loop_starts)), loop_totals)
+    starts = loop_starts[loop_polygons]
+    totals = loop_totals[loop_polygons]
+    local = np.arange(len(loop_vertices)) - starts
+    next_vertices = loop_vertices[starts + (local + 1) % totals]
+    prev_vertices = loop_vertices[starts + (local - 1) % totals]
+
+    a = co[next_vertices] - co[loop_vertices]
+    b = co[prev_vertices] - co[loop_vertices]
+    lengths = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    cosine = np.einsum("ij,ij->i", a, b) / np.maximum(lengths, 1e-12)
+    angles = np.where(lengths > 0.0, np.arccos(np.clip(cosine, -1.0, 1.0)), 0.0)
+
+    # Weld by quantized position so split vertices share one normal.
+    keys = np.round(co / OUTLINE_NORMAL_WELD_DISTANCE).astype(np.int64)
+    _, weld = np.unique(keys, axis=0, return_inverse=True)
+    weld = weld.reshape(-1)
+    corner_groups = weld[loop_vertices]
+    contribution = face_normals[loop_polygons] * angles[:, None]
+    summed = np.stack(
+        [np.bincount(corner_groups, weights=contribution[:, axis], minlength=weld.max() + 1) for axis in range(3)],
+        axis=1,
+    )
+
+    normals = summed[weld]
+    lengths = np.linalg.norm(normals, axis=1)
+    valid = lengths > 1e-12
+    normals[valid] /= lengths[valid, None]
+    normals[~valid] = vertex_normals[~valid]
+    return normals
+
+
+def build_outline_normal_attribute(obj):
+    if obj.type != 'MESH':
+        return None
+
+    mesh = obj.data
+    if not len(mesh.vertices) or not len(mesh.polygons):
+        return None
 
-        name = mat.name
-        if (
-            name.endswith("_Hair")
-            or name.endswith("_Face")
-            or name.endswith("_Body")
-            or name.endswith("_Body_Arms")
-        ):
-            vg.add(poly.vertices, 1.0, 'ADD')
+    loop_vertices, topology = topology_hash(mesh)
+    attribute = mesh.attributes.get(OUTLINE_NORMAL_ATTRIBUTE)
+    signature = outline_normal_signature(mesh, topology)
+    if (
+        attribute is not None
+        and attribute.domain == 'POINT'
+        and attribute.data_type == 'FLOAT_VECTOR'
+        and mesh.get(OUTLINE_NORMAL_RECIPE_PROPERTY) == signature
+    ):
+        return attribute
+
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", co)
+    loop_starts = np.empty(len(mesh.polygons), dtype=np.int32)
+    loop_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+    face_normals = np.empty(len(mesh.polygons) * 3, dtype=np.float32)
+    vertex_normals = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.polygons.foreach_get("loop_start", loop_starts)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+    mesh.polygons.foreach_get("normal", face_normals)
+    mesh.vertices.foreach_get("normal", vertex_normals)
+
+    normals = smoothed_normals(
+        co.reshape(-1, 3).astype(np.float64),
+        loop_vertices,
+        loop_starts,
+        loop_totals,
+        face_normals.reshape(-1, 3).astype(np.float64),
+        vertex_normals.reshape(-1, 3).astype(np.float64),
+    )
+
+    if attribute is not None and (attribute.domain != 'POINT' or attribute.data_type != 'FLOAT_VECTOR'):
+        mesh.attributes.remove(attribute)
+        attribute = None
+    if attribute is None:
+        attribute = mesh.attributes.new(OUTLINE_NORMAL_ATTRIBUTE, 'FLOAT_VECTOR', 'POINT')
+    attribute.data.foreach_set("vector", normals.astype(np.float32).ravel())
+    mesh[OUTLINE_NORMAL_RECIPE_PROPERTY] = signature
+    return attribute
+
+
+def read_baked_normals(nt):
+    # Each Normal node becomes a Named Attribute read of the baked normals:
+    # one node swapped for another, nothing added to the per-frame work.
+    for normal in [node for node in nt.nodes if node.bl_idname == 'GeometryNodeInputNormal']:
+        targets = [link.to_socket for link in nt.links if link.from_node == normal]
+
+        attribute = nt.nodes.new('GeometryNodeInputNamedAttribute')
+        attribute.data_type = 'FLOAT_VECTOR'
+        attribute.inputs["Name"].default_value = OUTLINE_NORMAL_ATTRIBUTE
+        attribute.location = normal.location
+        for socket in targets:
+            nt.links.new(attribute.outputs["Attribute"], socket)
+        nt.nodes.remove(normal)
+
+
+def baked_outline_group(geo_group):
+    # Managed copy of the library group that reads the baked normals and has
+    # the Simplify hull switch. The library asset stays untouched.
+    return managed_outline_group(geo_group, BAKED_GEO_NODE_NAME, tuple(OUTLINE_MATERIALS), read_baked_normals)
+
+
+def move_before_armature(obj, mod):
+    index = obj.modifiers.find(mod.name)
+    for armature_index, other in enumerate(obj.modifiers):
+        if other.type == 'ARMATURE':
+            if armature_index < index:
+                obj.modifiers.move(index, armature_index)
+            return
+
+
+def outline_signature(obj):
+    mesh = obj.data
+    material_index = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("material_index", material_index)
+    # Topology is part of the outline recipe, so a matching signature also
+    # means the baked normals are current.
+    return recipe_signature(
+        GEO_NODE_NAME,
+        [slot.material.name if slot.material else "" for slot in obj.material_slots],
+        (len(mesh.vertices), len(mesh.loops)),
+        hashlib.sha1(material_index.tobytes()).hexdigest(),
+        topology_hash(mesh)[1],
+    )
 
-    return vg
+
+def has_outline_modifier(obj, geo_group):
+    return any(mod.type == 'NODES' and mod.node_group == geo_group for mod in obj.modifiers)
 
 
 def refresh_modifier_viewport(obj, mod):
-    mod.show_viewport = False
-    mod.show_viewport = True
-    obj.update_tag()
+    # Deferred: evaluated once when the operator calls refresh_view_layer.
+    depsgraph_updates.tag(obj)
 
 
 # ------------------------------------------------------------
 # Geometry Nodes setup
 # ------------------------------------------------------------
-def setup_outline_geometry_nodes(obj):
-    geo_group = import_node_group(GEO_NODE_NAME, "[BA Outline]", report_missing=False)
-    if not geo_group:
-        print("[BA Outline] Node group not found")
-        return False
-
+def import_outline_materials():
     outline_mats = {}
     for key, mat_name in OUTLINE_MATERIALS.items():
         mat = import_material(mat_name, "[BA Outline]")
         if not mat:
-            return False
+            return None
         outline_mats[key] = mat
+    return outline_mats
+
+
+def setup_outline_geometry_nodes(obj, outline_mats=None):
+    geo_group = import_node_group(GEO_NODE_NAME, "[BA Outline]", report_missing=False)
+    if not geo_group:
+        print("[BA Outline] Node group not found")
+        return False
+
+    signature = outline_signature(obj)
+    if (
+        obj.get(OUTLINE_RECIPE_PROPERTY) == signature
+        and OUTLINE_NORMAL_ATTRIBUTE in obj.data.attributes
+        and OUTLINE_LOD_DROP_ATTRIBUTE in obj.data.attributes
+        and has_outline_modifier(obj, baked_outline_group(geo_group))
+    ):
+        return True
+
+    with span("outline/normals", object=obj.name):
+        # Meshes without faces have nothing to bake and keep the library group.
+        if build_outline_normal_attribute(obj) is not None:
+            build_outline_lod_attributes(obj)
+            geo_group = baked_outline_group(geo_group)
+
+    if outline_mats is None:
+        outline_mats = import_outline_materials()
+    if outline_mats is None:
+        return False
+    for mat in outline_mats.values():
         if mat.name not in obj.data.materials:
             obj.data.materials.append(mat)
 
@@ -84,15 +294,18 @@ def setup_outline_geometry_nodes(obj):
         elif mat.name.endswith("_Body"):
             model_mats["BodyMaterial"] = mat
 
-    vg = build_outline_vertex_group(obj)
+    with span("outline/vertex_group", object=obj.name):
+        vg = build_outline_vertex_group(obj)
     
     # --- Remove existing outline GN ---
     remove_existing_nodes_modifier(obj, GEO_NODE_NAME)
+    remove_existing_nodes_modifier(obj, BAKED_GEO_NODE_NAME)
 
 
     # --- GN Modifier ---
     mod = obj.modifiers.new("BA_Outline", 'NODES')
     mod.node_group = geo_group
+    move_before_armature(obj, mod)
 
     values = {
         "Group": vg.name if vg else "",
@@ -122,6 +335,8 @@ def setup_outline_geometry_nodes(obj):
 
 
     refresh_modifier_viewport(obj, mod)
+    # Stamped after the outline materials were appended to the slots.
+    obj[OUTLINE_RECIPE_PROPERTY] = outline_signature(obj)
     return True
 
 
@@ -137,7 +352,9 @@ def add_ba_outline(context):
 
     for obj in objs:
         if obj.type == 'MESH':
-            setup_outline_geometry_nodes(obj)
+            with span("outline/geometry_nodes", object=obj.name):
+                setup_outline_geometry_nodes(obj)
 
+    refresh_view_layer(context)
     return {'FINISHED'}
 
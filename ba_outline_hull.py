@@ -0,0 +1,209 @@
+import hashlib
+
+import bpy
+import numpy as np
+
+from .ba_utils import RECIPE_PROPERTY, recipe_signature
+
+
+# ------------------------------------------------------------
+# Managed outline groups
+# ------------------------------------------------------------
+# The outline modifiers use copies of the library groups, never the library
+# assets themselves. Each copy gains a Simplify input that swaps the hull
+# for a decimated one in the viewport; renders always get the full hull.
+
+SIMPLIFY_INPUT = "Simplify"
+
+OUTLINE_LOD_OFFSET_ATTRIBUTE = "ba_outline_lod_offset"
+OUTLINE_LOD_DROP_ATTRIBUTE = "ba_outline_lod_drop"
+OUTLINE_LOD_RECIPE_PROPERTY = "ba_outline_lod_recipe"
+OUTLINE_LOD_CELLS = 32  # Clusters along the longest bounding box side.
+
+
+def managed_outline_group(library_group, name, hull_materials, prepare=None):
+    # Rebuilt, with its users remapped, when the library changes.
+    signature = recipe_signature(name, SIMPLIFY_INPUT, OUTLINE_LOD_CELLS)
+    group = bpy.data.node_groups.get(name)
+    if group is not None and group.get(RECIPE_PROPERTY) == signature:
+        return group
+
+    managed = library_group.copy()
+    if prepare is not None:
+        prepare(managed)
+    add_hull_simplify(managed, hull_materials)
+    managed[RECIPE_PROPERTY] = signature
+    if group is not None:
+        group.user_remap(managed)
+        bpy.data.node_groups.remove(group)
+    managed.name = name
+    return managed
+
+
+def add_hull_simplify(nt, hull_materials):
+    # Output geometry -> Switch(Simplify and Is Viewport): the hull faces
+    # (those using an outline material input) are split off, snapped to their
+    # baked cluster centres and stripped of collapsed faces. The switch is
+    # lazy, so nothing below it runs while Simplify is off.
+    output = next((node for node in nt.nodes if node.bl_idname == 'NodeGroupOutput' and node.is_active_output), None)
+    if output is None:
+        return
+    target = next((socket for socket in output.inputs if socket.type == 'GEOMETRY'), None)
+    if target is None or not target.is_linked:
+        return
+    source = target.links[0].from_socket
+
+    # Without a hull material to select by, the split would decimate the
+    # character too; leave the group without a Simplify input instead.
+    inputs = {item.name for item in nt.interface.items_tree if item.item_type == 'SOCKET' and item.in_out == 'INPUT'}
+    hull_materials = [name for name in hull_materials if name in inputs]
+    if not hull_materials:
+        return
+
+    socket = nt.interface.new_socket(name=SIMPLIFY_INPUT, in_out='INPUT', socket_type='NodeSocketBool')
+    socket.default_value = False
+
+    x, y = output.location.x, output.location.y
+    output.location.x += 1400
+
+    group_input = new_node(nt, 'NodeGroupInput', (x, y - 300))
+    hull = None
+    for offset, name in enumerate(hull_materials):
+        selection = new_node(nt, 'GeometryNodeMaterialSelection', (x + 200, y - 300 - offset * 120))
+        nt.links.new(group_input.outputs[name], selection.inputs["Material"])
+        if hull is None:
+            hull = selection.outputs["Selection"]
+        else:
+            either = new_node(nt, 'FunctionNodeBooleanMath', (x + 400, y - 300 - offset * 120))
+            either.operation = 'OR'
+            nt.links.new(hull, either.inputs[0])
+            nt.links.new(selection.outputs["Selection"], either.inputs[1])
+            hull = either.outputs["Boolean"]
+
+    separate = new_node(nt, 'GeometryNodeSeparateGeometry', (x + 600, y - 100))
+    separate.domain = 'FACE'
+    nt.links.new(source, separate.inputs["Geometry"])
+    nt.links.new(hull, separate.inputs["Selection"])
+
+    offsets = named_attribute(nt, 'FLOAT_VECTOR', OUTLINE_LOD_OFFSET_ATTRIBUTE, (x + 600, y - 300))
+    snap = new_node(nt, 'GeometryNodeSetPosition', (x + 800, y - 100))
+    nt.links.new(separate.outputs["Selection"], snap.inputs["Geometry"])
+    nt.links.new(offsets.outputs["Attribute"], snap.inputs["Offset"])
+
+    dropped = named_attribute(nt, 'BOOLEAN', OUTLINE_LOD_DROP_ATTRIBUTE, (x + 800, y - 300))
+    delete = new_node(nt, 'GeometryNodeDeleteGeometry', (x + 1000, y - 100))
+    delete.domain = 'FACE'
+    nt.links.new(snap.outputs["Geometry"], delete.inputs["Geometry"])
+    nt.links.new(dropped.outputs["Attribute"], delete.inputs["Selection"])
+
+    join = new_node(nt, 'GeometryNodeJoinGeometry', (x + 1200, y - 100))
+    nt.links.new(delete.outputs["Geometry"], join.inputs["Geometry"])
+    nt.links.new(separate.outputs["Inverted"], join.inputs["Geometry"])
+
+    viewport = new_node(nt, 'GeometryNodeIsViewport', (x + 1000, y + 150))
+    enabled = new_node(nt, 'FunctionNodeBooleanMath', (x + 1200, y + 150))
+    enabled.operation = 'AND'
+    nt.links.new(group_input.outputs[SIMPLIFY_INPUT], enabled.inputs[0])
+    nt.links.new(viewport.outputs["Is Viewport"], enabled.inputs[1])
+
+    switch = new_node(nt, 'GeometryNodeSwitch', (x + 1400, y))
+    switch.input_type = 'GEOMETRY'
+    nt.links.new(enabled.outputs["Boolean"], switch.inputs["Switch"])
+    nt.links.new(source, switch.inputs["False"])
+    nt.links.new(join.outputs["Geometry"], switch.inputs["True"])
+    nt.links.new(switch.outputs["Output"], target)
+
+
+def new_node(nt, idname, location):
+    node = nt.nodes.new(idname)
+    node.location = location
+    return node
+
+
+def named_attribute(nt, data_type, name, location):
+    node = new_node(nt, 'GeometryNodeInputNamedAttribute', location)
+    node.data_type = data_type
+    node.inputs["Name"].default_value = name
+    return node
+
+
+# ------------------------------------------------------------
+# Decimated hull bake
+# ------------------------------------------------------------
+# Vertex clustering on a grid: every vertex is snapped to the centroid of its
+# cell, and faces left with fewer than three distinct cells collapse and are
+# dropped. Stored as a point offset and a face flag, which the hull inherits
+# from the mesh it is built from.
+
+def topology_hash(mesh):
+    loop_vertices = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loop_vertices)
+    return loop_vertices, hashlib.sha1(loop_vertices.tobytes()).hexdigest()
+
+
+def cluster_hull(co, loop_vertices, loop_totals, cells=OUTLINE_LOD_CELLS):
+    low = co.min(axis=0)
+    size = (co.max(axis=0) - low).max()
+    cell = size / cells if size > 0.0 else 1.0
+    keys = np.floor((co - low) / cell).astype(np.int64)
+    _, cluster = np.unique(keys, axis=0, return_inverse=True)
+    cluster = cluster.reshape(-1)
+
+    counts = np.bincount(cluster)
+    centroids = np.stack([np.bincount(cluster, weights=co[:, axis]) for axis in range(3)], axis=1) / counts[:, None]
+    offsets = centroids[cluster] - co
+
+    # Distinct clusters per face from unique (face, cluster) pairs.
+    loop_polygons = np.repeat(np.arange(len(loop_totals), dtype=np.int64), loop_totals)
+    stride = int(cluster.max()) + 1
+    pairs = np.unique(loop_polygons * stride + cluster[loop_vertices])
+    distinct = np.bincount(pairs // stride, minlength=len(loop_totals))
+    return offsets, distinct < 3
+
+
+def build_outline_lod_attributes(obj):
+    if obj.type != 'MESH':
+        return False
+
+    mesh = obj.data
+    if not len(mesh.vertices) or not len(mesh.polygons):
+        return False
+
+    # Keyed on topology, like the outline normals.
+    loop_vertices, topology = topology_hash(mesh)
+    signature = recipe_signature(OUTLINE_LOD_OFFSET_ATTRIBUTE, OUTLINE_LOD_CELLS, len(mesh.vertices), topology)
+    offset_attribute = mesh.attributes.get(OUTLINE_LOD_OFFSET_ATTRIBUTE)
+    drop_attribute = mesh.attributes.get(OUTLINE_LOD_DROP_ATTRIBUTE)
+    if (
+        is_attribute(offset_attribute, 'POINT', 'FLOAT_VECTOR')
+        and is_attribute(drop_attribute, 'FACE', 'BOOLEAN')
+        and mesh.get(OUTLINE_LOD_RECIPE_PROPERTY) == signature
+    ):
+        return True
+
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", co)
+    loop_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+
+    offsets, drop = cluster_hull(co.reshape(-1, 3).astype(np.float64), loop_vertices, loop_totals)
+
+    offset_attribute = replace_attribute(mesh, offset_attribute, OUTLINE_LOD_OFFSET_ATTRIBUTE, 'POINT', 'FLOAT_VECTOR')
+    offset_attribute.data.foreach_set("vector", offsets.astype(np.float32).ravel())
+    drop_attribute = replace_attribute(mesh, drop_attribute, OUTLINE_LOD_DROP_ATTRIBUTE, 'FACE', 'BOOLEAN')
+    drop_attribute.data.foreach_set("value", drop)
+    mesh[OUTLINE_LOD_RECIPE_PROPERTY] = signature
+    return True
+
+
+def is_attribute(attribute, domain, data_type):
+    return attribute is not None and attribute.domain == domain and attribute.data_type == data_type
+
+
+def replace_attribute(mesh, attribute, name, domain, data_type):
+    if attribute is not None and not is_attribute(attribute, domain, data_type):
+        mesh.attributes.remove(attribute)
+        attribute = None
+    if attribute is None:
+        attribute = mesh.attributes.new(name, data_type, domain)
+    return attribute
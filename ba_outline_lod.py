@@ -0,0 +1,232 @@
+import bpy
+from bpy.app.handlers import persistent
+from bpy.props import BoolProperty, EnumProperty, FloatProperty
+
+from . import ba_outline
+from . import ba_props_outline
+from .ba_outline_hull import SIMPLIFY_INPUT
+
+
+OUTLINE_NODE_GROUPS = (
+    ba_outline.GEO_NODE_NAME,
+    ba_outline.BAKED_GEO_NODE_NAME,
+    ba_props_outline.GEO_NODE_NAME,
+    ba_props_outline.MANAGED_GEO_NODE_NAME,
+)
+# Decimate modifier added by earlier versions; removed when found.
+LEGACY_LOD_MODIFIER_NAME = "BA_Outline_LOD"
+LOD_TIMER_INTERVAL = 0.5
+
+OUTLINE_MODES = (
+    ('AUTO', "Auto", "Follow the scene outline LOD settings"),
+    ('FULL', "Full", "Full outline hull"),
+    ('SIMPLIFIED', "Simplified", "Decimated outline hull in the viewport; renders keep the full hull"),
+    ('OFF', "Off", "No outline in the viewport; renders keep it"),
+)
+
+# Only the outline hull is simplified, never the mesh it is built from: the
+# managed outline groups switch to a decimated hull through their Simplify
+# input, gated on Is Viewport inside the group (see ba_outline_hull).
+# Modifiers still on a bare library group, set up before the managed copies
+# existed, fall back to Off until their outline is set up again. Otherwise
+# only viewport visibility is touched, so renders always get the full outline.
+
+_playback = {"playing": False}
+
+
+def outline_modifiers(obj):
+    return [
+        mod for mod in obj.modifiers
+        if mod.type == 'NODES' and mod.node_group and mod.node_group.name in OUTLINE_NODE_GROUPS
+    ]
+
+
+def outlined_objects(scene):
+    return [obj for obj in scene.objects if obj.type == 'MESH' and outline_modifiers(obj)]
+
+
+def camera_distance(scene, obj):
+    camera = scene.camera
+    if camera is None:
+        return None
+    return (obj.matrix_world.translation - camera.matrix_world.translation).length
+
+
+def is_playing():
+    wm = bpy.context.window_manager
+    if wm is None:
+        return False
+    return any(window.screen and window.screen.is_animation_playing for window in wm.windows)
+
+
+def resolve_outline_mode(scene, obj):
+    mode = obj.ba_outline_lod
+    if mode != 'AUTO':
+        return mode
+
+    if scene.ba_outline_lod_auto:
+        distance = camera_distance(scene, obj)
+        if distance is not None:
+            if distance >= scene.ba_outline_lod_off_distance:
+                return 'OFF'
+            if distance >= scene.ba_outline_lod_simplify_distance:
+                return 'SIMPLIFIED'
+    return 'SIMPLIFIED' if scene.ba_outline_lod_performance else 'FULL'
+
+
+def simplify_input(mod):
+    for item in mod.node_group.interface.items_tree:
+        if (
+            item.item_type == 'SOCKET'
+            and item.in_out == 'INPUT'
+            and item.name == SIMPLIFY_INPUT
+            and item.socket_type == 'NodeSocketBool'
+        ):
+            return item.identifier
+    return None
+
+
+def remove_legacy_lod_modifier(obj):
+    lod = obj.modifiers.get(LEGACY_LOD_MODIFIER_NAME)
+    if lod is not None and lod.type == 'DECIMATE':
+        obj.modifiers.remove(lod)
+
+
+def apply_outline_mode(obj, mode, playing=False):
+    outline_mods = outline_modifiers(obj)
+    if not outline_mods:
+        return
+    remove_legacy_lod_modifier(obj)
+
+    simplify = mode == 'SIMPLIFIED'
+    for mod in outline_mods:
+        ident = simplify_input(mod)
+        visible = not playing and mode != 'OFF' and (not simplify or ident is not None)
+        if mod.show_viewport != visible:
+            mod.show_viewport = visible
+        if ident is not None and mod.get(ident) != simplify:
+            mod[ident] = simplify
+            obj.update_tag()
+
+
+def update_outline_lod(scene=None, playing=None):
+    scene = scene or bpy.context.scene
+    if playing is None:
+        playing = scene.ba_outline_hide_during_playback and is_playing()
+    for obj in outlined_objects(scene):
+        apply_outline_mode(obj, resolve_outline_mode(scene, obj), playing)
+
+
+def set_outline_mode(obj, mode):
+    # Public entry: per-object override, applied immediately.
+    obj.ba_outline_lod = mode
+
+
+# ------------------------------------------------------------
+# Property callbacks, handlers and timer
+# ------------------------------------------------------------
+
+def _on_object_mode(self, context):
+    apply_outline_mode(self, resolve_outline_mode(context.scene, self), _playback["playing"])
+
+
+def _on_scene_settings(self, context):
+    update_outline_lod(self, _playback["playing"])
+
+
+@persistent
+def _on_playback_pre(scene, *args):
+    if scene.ba_outline_hide_during_playback:
+        _playback["playing"] = True
+        update_outline_lod(scene, True)
+
+
+@persistent
+def _on_playback_post(scene, *args):
+    if _playback["playing"]:
+        _playback["playing"] = False
+        update_outline_lod(scene, False)
+
+
+def _lod_timer():
+    # Distance updates, plus playback detection on Blender versions without
+    # the animation_playback_pre/post handlers.
+    scene = bpy.context.scene
+    if scene is None:
+        return LOD_TIMER_INTERVAL
+
+    playing = scene.ba_outline_hide_during_playback and is_playing()
+    if scene.ba_outline_lod_auto or playing != _playback["playing"]:
+        _playback["playing"] = playing
+        update_outline_lod(scene, playing)
+    return LOD_TIMER_INTERVAL
+
+
+PLAYBACK_HANDLERS = (
+    ("animation_playback_pre", _on_playback_pre),
+    ("animation_playback_post", _on_playback_post),
+)
+
+
+def register():
+    bpy.types.Object.ba_outline_lod = EnumProperty(
+        name="Outline LOD",
+        items=OUTLINE_MODES,
+        default='AUTO',
+        update=_on_object_mode,
+    )
+    bpy.types.Scene.ba_outline_lod_auto = BoolProperty(
+        name="Distance LOD",
+        description="Simplify or hide outlines by distance to the scene camera",
+        default=False,
+        update=_on_scene_settings,
+    )
+    bpy.types.Scene.ba_outline_lod_performance = BoolProperty(
+        name="Viewport Performance",
+        description="Use simplified outlines for objects in Auto mode",
+        default=False,
+        update=_on_scene_settings,
+    )
+    bpy.types.Scene.ba_outline_hide_during_playback = BoolProperty(
+        name="Hide During Playback",
+        description="Turn viewport outlines off while the animation plays",
+        default=False,
+        update=_on_scene_settings,
+    )
+    bpy.types.Scene.ba_outline_lod_simplify_distance = FloatProperty(
+        name="Simplify Distance",
+        default=15.0,
+        min=0.0,
+        subtype='DISTANCE',
+        update=_on_scene_settings,
+    )
+    bpy.types.Scene.ba_outline_lod_off_distance = FloatProperty(
+        name="Off Distance",
+        default=40.0,
+        min=0.0,
+        subtype='DISTANCE',
+        update=_on_scene_settings,
+    )
+
+    for name, handler in PLAYBACK_HANDLERS:
+        handlers = getattr(bpy.app.handlers, name, None)
+        if handlers is not None and handler not in handlers:
+            handlers.append(handler)
+    if not bpy.app.timers.is_registered(_lod_timer):
+        bpy.app.timers.register(_lod_timer, first_interval=LOD_TIMER_INTERVAL, persistent=True)
+
+
+def unregister():
+    if bpy.app.timers.is_registered(_lod_timer):
+        bpy.app.timers.unregister(_lod_timer)
+    for name, handler in PLAYBACK_HANDLERS:
+        handlers = getattr(bpy.app.handlers, name, None)
+        if handlers is not None and handler in handlers:
+            handlers.remove(handler)
+
+    del bpy.types.Scene.ba_outline_lod_off_distance
+    del bpy.types.Scene.ba_outline_lod_simplify_distance
+    del bpy.types.Scene.ba_outline_hide_during_playback
+    del bpy.types.Scene.ba_outline_lod_performance
+    del bpy.types.Scene.ba_outline_lod_auto
+    del bpy.types.Object.ba_outline_lod
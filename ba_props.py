@@ -1,9 +1,15 @@
 import bpy
-import os
 from bpy.types import Operator, PropertyGroup
 from bpy.props import CollectionProperty, StringProperty
 
-from .ba_utils import add_alpha_node, add_light_color_node, add_lit_alpha_node, clear_nodes, configure_alpha_material, ensure_node_group, ensure_output, link_alpha_to_output, new_tex, safe_link, set_input_default
+from .ba_utils import add_alpha_node, add_light_color_node, add_lit_alpha_node, build_material, clear_nodes, configure_alpha_material, ensure_node_group, ensure_output, link_alpha_to_output, new_tex, safe_link, set_input_default, texture_index
+
+PROP_NODE_GROUPS = (
+    "ba_weapon_shader",
+    "ba_metallic_shader",
+    "ba_light_color",
+    "ba_alpha",
+)
 
 # ---------------- utils ----------------
 
@@ -27,11 +33,9 @@ def find_base_and_mask(images):
     base = None
     mask = None
 
-    for img in images:
-        if img.filepath:
-            name = os.path.splitext(os.path.basename(bpy.path.abspath(img.filepath)))[0].lower()
-        else:
-            name = os.path.splitext(os.path.basename(img.name))[0].lower()
+    index = texture_index(images)
+    for img in index:
+        name = index.stems[img].lower()
 
         if name.endswith("mask"):
             if mask is None:
@@ -44,7 +48,7 @@ def find_base_and_mask(images):
 
 
 
-def setup_prop_material(mat, images):
+def setup_prop_material(mat, images, templates=None):
     if not mat.use_nodes:
         mat.use_nodes = True
 
@@ -52,18 +56,21 @@ def setup_prop_material(mat, images):
 
     if base_img is None:
         print(f"[BA] Missing base texture for {mat.name}")
-        return
+        return mat
 
+    roles = {"Base": base_img, "Mask": mask_img}
+    return build_material(mat, "setup_prop_material", roles, build_prop_material, templates)
+
+
+def build_prop_material(mat, roles):
     clear_nodes(mat)
     nt = mat.node_tree
 
     # ---  Base  ---
-    base_node = new_tex(nt, base_img, non_color=False, loc=(-600, 100))
+    base_node = new_tex(nt, roles["Base"], non_color=False, loc=(-600, 100), name="Base")
 
     # --- Mask  ---
-    mask_node = None
-    if mask_img:
-        mask_node = new_tex(nt, mask_img, non_color=True, loc=(-600, -100))
+    mask_node = new_tex(nt, roles["Mask"], non_color=True, loc=(-600, -100), name="Mask")
 
     # --- Shader Groups ---
     weapon_node = nt.nodes.new("ShaderNodeGroup")
@@ -107,42 +114,49 @@ def setup_prop_material(mat, images):
 
 
 
-def setup_alpha_material(mat, images):
-    setup_prop_alpha_material(mat, images)
+def setup_alpha_material(mat, images, templates=None):
+    return setup_prop_alpha_material(mat, images, templates=templates)
+
 
+def setup_car_alpha_material(mat, images, templates=None):
+    return setup_prop_alpha_material(mat, images, use_textures=False, templates=templates)
 
-def setup_car_alpha_material(mat, images):
-    setup_prop_alpha_material(mat, images, use_textures=False)
 
+def prop_material_handler(mat):
+    if is_car_alpha_material(mat):
+        return setup_car_alpha_material
+    if is_alpha_material(mat):
+        return setup_alpha_material
+    return setup_prop_material
 
-def setup_prop_alpha_material(mat, images, use_textures=True):
+
+def setup_prop_alpha_material(mat, images, use_textures=True, templates=None):
     if not mat.use_nodes:
         mat.use_nodes = True
 
-    configure_alpha_material(mat)
-
     old_tex = find_image_node(mat) if use_textures else None
     had_texture = old_tex is not None
     old_image = old_tex.image if old_tex else None
 
-    clear_nodes(mat)
-    nt = mat.node_tree
-
-    out = ensure_output(mat)
-
     base_img, mask_img = find_base_and_mask(images) if use_textures else (None, None)
 
     if base_img is None and had_texture:
         base_img = old_image
 
-    base_node = None
-    mask_node = None
+    roles = {"Base": base_img, "Mask": mask_img}
+    return build_material(mat, "setup_prop_alpha_material", roles, build_prop_alpha_material, templates)
+
+
+def build_prop_alpha_material(mat, roles):
+    configure_alpha_material(mat)
 
-    if base_img:
-        base_node = new_tex(nt, base_img, non_color=False, loc=(-620, 0))
+    clear_nodes(mat)
+    nt = mat.node_tree
+
+    out = ensure_output(mat)
 
-    if mask_img:
-        mask_node = new_tex(nt, mask_img, non_color=True, loc=(-620, -280))
+    base_node = new_tex(nt, roles["Base"], non_color=False, loc=(-620, 0), name="Base")
+    mask_node = new_tex(nt, roles["Mask"], non_color=True, loc=(-620, -280), name="Mask")
 
     weapon_node = nt.nodes.new("ShaderNodeGroup")
     weapon_group = ensure_node_group("ba_weapon_shader")
@@ -1,15 +1,22 @@
 import bpy
 
+from .ba_outline_hull import build_outline_lod_attributes, managed_outline_group
 from .ba_utils import (
+    depsgraph_updates,
     ensure_socket_is_attribute,
     import_material,
     import_node_group,
+    refresh_view_layer,
     remove_existing_nodes_modifier,
 )
 
 GEO_NODE_NAME = "ba_weapon_outline"
+MANAGED_GEO_NODE_NAME = "ba_weapon_outline_lod"
 OUTLINE_MATERIAL_NAME = "weapon_outline"
 
+LIBRARY_NODE_GROUPS = (GEO_NODE_NAME,)
+LIBRARY_MATERIALS = (OUTLINE_MATERIAL_NAME,)
+
 
 def find_alpha_material(obj):
     for mat in obj.data.materials:
@@ -32,19 +39,15 @@ def build_outline_vertex_group(obj):
 
     mesh = obj.data
 
-
-    vg.remove(range(len(mesh.vertices)))
-
-
-    vg.add(range(len(mesh.vertices)), 1.0, 'ADD')
+    # REPLACE sets every vertex to 1.0 in one call, no prior remove needed.
+    vg.add(range(len(mesh.vertices)), 1.0, 'REPLACE')
 
     return vg
 
 
 def refresh_modifier_viewport(obj, mod):
-    mod.show_viewport = False
-    mod.show_viewport = True
-    obj.update_tag()
+    # Deferred: evaluated once when the operator calls refresh_view_layer.
+    depsgraph_updates.tag(obj)
 
 
 # ------------------------------------------------------------
@@ -55,14 +58,23 @@ def refresh_modifier_viewport(obj, mod):
 # main setup
 # ------------------------------------------------------------
 
-def setup_prop_outline_geometry_nodes(obj):
+def import_outline_assets():
     geo_group = import_node_group(GEO_NODE_NAME, "[BA Props Outline]")
     if not geo_group:
-        return False
+        return None
 
     outline_mat = import_material(OUTLINE_MATERIAL_NAME, "[BA Props Outline]")
     if not outline_mat:
+        return None
+    return geo_group, outline_mat
+
+
+def setup_prop_outline_geometry_nodes(obj, assets=None):
+    if assets is None:
+        assets = import_outline_assets()
+    if assets is None:
         return False
+    geo_group, outline_mat = assets
 
 
     if outline_mat.name not in obj.data.materials:
@@ -71,8 +83,14 @@ def setup_prop_outline_geometry_nodes(obj):
 
     vg = build_outline_vertex_group(obj)
 
+    # Managed copy with the Simplify hull switch; faceless meshes have no
+    # hull to decimate and keep the library group.
+    if build_outline_lod_attributes(obj):
+        geo_group = managed_outline_group(geo_group, MANAGED_GEO_NODE_NAME, ("Outline",))
+
     # --- Remove existing outline GN ---
     remove_existing_nodes_modifier(obj, GEO_NODE_NAME)
+    remove_existing_nodes_modifier(obj, MANAGED_GEO_NODE_NAME)
 
 
     # Geometry Nodes Modifier
@@ -120,8 +138,10 @@ def add_ba_props_outline(context):
     if not objs:
         return {'CANCELLED'}
 
+    assets = import_outline_assets()
     for obj in objs:
         if obj.type == 'MESH':
-            setup_prop_outline_geometry_nodes(obj)
+            setup_prop_outline_geometry_nodes(obj, assets)
 
+    refresh_view_layer(context)
     return {'FINISHED'}
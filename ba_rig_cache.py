@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import sys
+
+import bpy
+import numpy as np
+
+from . import ba_manifest
+
+
+RIG_CACHE_VERSION = 2
+RIG_CACHE_DIR = "rig_cache"
+FINGERPRINT_TOLERANCE = 1e-4
+
+# Code the cached rigs depend on besides Rigify itself; editing any of these
+# invalidates the cache.
+RIG_CACHE_SOURCES = (
+    "create_and_align_human_metarig.py",
+    "auto_rigify_bind_pipeline.py",
+    "ba_rig_cache.py",
+    "ba_rig_utils.py",
+)
+
+_versions = {}
+
+
+def cache_dir():
+    try:
+        config_dir = bpy.utils.user_resource('CONFIG', path=ba_manifest.MANIFEST_DIR, create=True)
+    except (TypeError, ValueError, OSError):
+        config_dir = ""
+    if not config_dir:
+        return ""
+    path = os.path.join(config_dir, RIG_CACHE_DIR)
+    try:
+        os.makedirs(path, exist_ok=True)
+    except OSError as exc:
+        print(f"[BA] Rig cache disabled, could not create {path}: {exc}")
+        return ""
+    return path
+
+
+def cache_paths(fingerprint):
+    directory = cache_dir()
+    if not directory:
+        return None, None
+    base = os.path.join(directory, fingerprint)
+    return base + ".blend", base + ".json"
+
+
+def rest_pose_points(source):
+    bones = source.data.bones
+    count = len(bones)
+    heads = np.empty(count * 3, dtype=np.float64)
+    tails = np.empty(count * 3, dtype=np.float64)
+    bones.foreach_get("head_local", heads)
+    bones.foreach_get("tail_local", tails)
+
+    matrix = np.array(source.matrix_world, dtype=np.float64)
+    points = np.concatenate((heads.reshape(-1, 3), tails.reshape(-1, 3)))
+    return points @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def addon_version():
+    info = getattr(sys.modules.get(__package__), "bl_info", {})
+    return ".".join(str(part) for part in info.get("version", ()))
+
+
+def source_version():
+    # Hashed once per session; the sources only change with a reinstall.
+    if "source" not in _versions:
+        digest = hashlib.sha1()
+        directory = os.path.dirname(__file__)
+        for name in RIG_CACHE_SOURCES:
+            try:
+                with open(os.path.join(directory, name), "rb") as f:
+                    digest.update(f.read())
+            except OSError:
+                digest.update(f"missing:{name}".encode("utf-8"))
+        _versions["source"] = digest.hexdigest()
+    return _versions["source"]
+
+
+def rigify_version():
+    # Legacy add-on ("rigify") or extension ("bl_ext.<repo>.rigify"). The
+    # file mtime catches updates that keep the version number.
+    for name, module in list(sys.modules.items()):
+        if name != "rigify" and not name.endswith(".rigify"):
+            continue
+        info = getattr(module, "bl_info", {})
+        version = ".".join(str(part) for part in info.get("version", ()))
+        try:
+            mtime = os.stat(module.__file__).st_mtime_ns
+        except (OSError, TypeError, AttributeError):
+            mtime = 0
+        return f"{name}:{version}:{mtime}"
+    return ""
+
+
+def skeleton_fingerprint(source, extra=(), tolerance=FINGERPRINT_TOLERANCE):
+    # World-space rest pose, so the cached rig lands where a fresh one would.
+    digest = hashlib.sha1()
+    digest.update(f"v{RIG_CACHE_VERSION};{bpy.app.version_string};{tolerance}".encode("utf-8"))
+    digest.update(f";{addon_version()};{source_version()};{rigify_version()}".encode("utf-8"))
+    for value in extra:
+        digest.update(f";{value}".encode("utf-8"))
+    for bone in source.data.bones:
+        parent = bone.parent.name if bone.parent else ""
+        digest.update(f"\n{bone.name}>{parent}".encode("utf-8"))
+
+    quantized = np.rint(rest_pose_points(source) / tolerance).astype(np.int64)
+    digest.update(quantized.tobytes())
+    return digest.hexdigest()
+
+
+def read_index(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def text_hash(text):
+    return hashlib.sha1(text.as_string().encode("utf-8")).hexdigest()
+
+
+def store(fingerprint, metarig, rig, source_name=""):
+    blend_path, index_path = cache_paths(fingerprint)
+    if blend_path is None:
+        return False
+
+    datablocks = {metarig, rig}
+    rig_ui = getattr(metarig.data, "rigify_rig_ui", None)
+    if rig_ui is not None:
+        datablocks.add(rig_ui)
+
+    # Per-process temp names: batch workers may store the same skeleton at
+    # once. Both files are complete before either replaces the cached pair.
+    temp_blend = f"{blend_path}.{os.getpid()}.tmp"
+    temp_index = f"{index_path}.{os.getpid()}.tmp"
+    try:
+        bpy.data.libraries.write(temp_blend, datablocks, fake_user=True, compress=True)
+        with open(temp_index, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": RIG_CACHE_VERSION,
+                    "source": source_name,
+                    "metarig": metarig.name,
+                    "rig": rig.name,
+                    "rig_ui": rig_ui.name if rig_ui is not None else "",
+                    "rig_ui_hash": text_hash(rig_ui) if rig_ui is not None else "",
+                },
+                f,
+                indent=1,
+                sort_keys=True,
+            )
+        os.replace(temp_blend, blend_path)
+        os.replace(temp_index, index_path)
+    except (OSError, RuntimeError) as exc:
+        print(f"[BA] Could not write rig cache {blend_path}: {exc}")
+        for path in (temp_blend, temp_index):
+            if os.path.exists(path):
+                os.remove(path)
+        return False
+    return True
+
+
+def load(fingerprint, collection):
+    blend_path, index_path = cache_paths(fingerprint)
+    if blend_path is None or not os.path.isfile(blend_path):
+        return None, None
+    index = read_index(index_path)
+    if index is None or index.get("version") != RIG_CACHE_VERSION:
+        return None, None
+
+    wanted = (index["metarig"], index["rig"])
+    try:
+        with bpy.data.libraries.load(blend_path, link=False) as (data_from, data_to):
+            if not all(name in data_from.objects for name in wanted):
+                return None, None
+            data_to.objects = list(wanted)
+    except (OSError, RuntimeError) as exc:
+        print(f"[BA] Could not read rig cache {blend_path}: {exc}")
+        return None, None
+
+    metarig, rig = data_to.objects
+    if metarig is None or rig is None:
+        return None, None
+    for obj in (metarig, rig):
+        obj.use_fake_user = False
+        obj.data.use_fake_user = False
+        collection.objects.link(obj)
+
+    rig_ui = getattr(metarig.data, "rigify_rig_ui", None)
+    if rig_ui is not None:
+        rig_ui.use_fake_user = False
+        # Rigify registers the rig UI panel by running its script after
+        # generate. The cached text is only run if it is byte for byte what
+        # Rigify produced when the cache entry was stored.
+        if text_hash(rig_ui) != index.get("rig_ui_hash"):
+            print(f"[BA] Cached rig UI {rig_ui.name} does not match the stored Rigify script; not running it")
+        else:
+            try:
+                rig_ui.as_module()
+            except Exception as exc:
+                print(f"[BA] Could not register cached rig UI {rig_ui.name}: {exc}")
+    return metarig, rig
@@ -0,0 +1,81 @@
+import bpy
+
+
+IGNORED_RIG_NAME_TOKENS = ("mouthre",)
+
+
+def is_ignored_rig(obj):
+    if obj is None or obj.type != "ARMATURE":
+        return False
+    lowered = obj.name.lower()
+    return any(token in lowered for token in IGNORED_RIG_NAME_TOKENS)
+
+
+def find_rig_from_objects(objs):
+    for obj in objs:
+        if obj.type == 'ARMATURE' and not is_ignored_rig(obj):
+            return obj
+        for mod in obj.modifiers:
+            if mod.type == 'ARMATURE' and mod.object and not is_ignored_rig(mod.object):
+                return mod.object
+        if obj.parent and obj.parent.type == 'ARMATURE' and not is_ignored_rig(obj.parent):
+            return obj.parent
+    return None
+
+
+def object_context(active, selected=None):
+    selected = [active] if selected is None else list(selected)
+    return bpy.context.temp_override(
+        active_object=active,
+        object=active,
+        selected_objects=selected,
+        selected_editable_objects=selected,
+    )
+
+
+def set_mode(obj, mode):
+    if obj is None or obj.mode == mode:
+        return
+    with object_context(obj):
+        bpy.ops.object.mode_set(mode=mode)
+
+
+class StageReport:
+    # Named lists of messages collected by one rig stage. Indexing by key
+    # returns the list so stages can keep using report["warnings"].append(...).
+    def __init__(self, title, keys, quiet_keys=()):
+        self.title = title
+        self.keys = tuple(keys)
+        self.quiet_keys = frozenset(quiet_keys)
+        self.entries = {key: [] for key in self.keys}
+        self.elapsed = 0.0
+
+    def __getitem__(self, key):
+        return self.entries[key]
+
+    def merge(self, other):
+        for key, values in other.entries.items():
+            self.entries.setdefault(key, []).extend(values)
+        self.dedupe()
+
+    def dedupe(self):
+        for key, values in self.entries.items():
+            self.entries[key] = list(dict.fromkeys(values))
+
+    def as_dict(self):
+        return {
+            "title": self.title,
+            "elapsed": self.elapsed,
+            "entries": {key: list(values) for key, values in self.entries.items()},
+        }
+
+    def print(self, keys=None):
+        self.dedupe()
+        print(f"\n=== {self.title} report ===")
+        for key in keys or self.keys:
+            values = self.entries[key]
+            print(f"{key}: {len(values)}")
+            if key not in self.quiet_keys:
+                for value in values:
+                    print(f"  - {value}")
+        print("=== End report ===\n")
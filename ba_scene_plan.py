@@ -0,0 +1,73 @@
+import bpy
+
+from .ba_rig_utils import find_rig_from_objects
+from .ba_utils import id_alive
+
+
+class ScenePlan:
+    # The selection of one setup run, walked once: material -> objects using
+    # it, material -> role (handler) and mesh -> rig. Stages read it instead
+    # of looping over selected_objects x material_slots again, so a material
+    # shared by many meshes is visited once.
+    #
+    # Materials are keyed by name and resolved again on each read, so a
+    # material deleted while a modal run is in progress is simply skipped.
+    # Passing rig assigns every mesh to it instead of looking it up.
+    def __init__(self, objects, classify=None, rig=None):
+        self.objects = list(objects)
+        self.meshes = [obj for obj in self.objects if obj.type == 'MESH']
+        self.rig = rig or find_rig_from_objects(self.objects)
+
+        self.material_objects = {}
+        for obj in self.meshes:
+            for slot in obj.material_slots:
+                if slot.material is None:
+                    continue
+                users = self.material_objects.setdefault(slot.material.name, [])
+                if obj not in users:
+                    users.append(obj)
+
+        self.roles = {}
+        if classify is not None:
+            for name in self.material_objects:
+                self.roles[name] = classify(bpy.data.materials[name])
+
+        if rig is not None:
+            self.object_rigs = {obj: rig for obj in self.meshes}
+        else:
+            self.object_rigs = {obj: find_rig_from_objects([obj]) or self.rig for obj in self.meshes}
+
+    @classmethod
+    def from_context(cls, context, classify=None, rig=None):
+        return cls(context.selected_objects, classify, rig)
+
+    def prune(self):
+        # Drops objects removed since the plan was built.
+        self.objects = [obj for obj in self.objects if id_alive(obj)]
+        self.meshes = [obj for obj in self.meshes if id_alive(obj)]
+        if self.rig is not None and not id_alive(self.rig):
+            self.rig = None
+        self.object_rigs = {
+            obj: rig if rig is not None and id_alive(rig) else None
+            for obj, rig in self.object_rigs.items()
+            if id_alive(obj)
+        }
+        for users in self.material_objects.values():
+            users[:] = [obj for obj in users if id_alive(obj)]
+
+    def material_names(self):
+        return sorted(self.material_objects)
+
+    def materials(self):
+        for name in sorted(self.material_objects):
+            mat = bpy.data.materials.get(name)
+            if mat is not None:
+                yield mat
+
+    def role(self, mat):
+        return self.roles.get(mat.name)
+
+    def materials_for_rig(self, rig):
+        for mat in self.materials():
+            if any(self.object_rigs.get(obj) == rig for obj in self.material_objects[mat.name]):
+                yield mat
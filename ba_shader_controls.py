@@ -1,8 +1,17 @@
 import bpy
 
+from .ba_rig_utils import find_rig_from_objects
+from .ba_scene_plan import ScenePlan
+
 
 CONTROL_EMPTY_NAME = "hair_spec_normal"
 CONTROL_EMPTY_NAME_FACE = "face_light_dot"
+CONTROL_REGISTRY_PREFIX = "ba_control_"
+ROTATION_SOURCE_PROPERTY = "ba_rotation_source"
+ROTATION_SOURCE_PREFIX = "BA_Rotation"
+ROTATION_SOURCE_NODE_NAME = "BA Rotation"
+FACE_ROTATION_OUTPUT = "FaceRotation"
+HAIR_ROTATION_OUTPUT = "HairRotation"
 SHARED_SHADER_DRIVER_NODE_GROUPS = (
     "ba_face_shader",
     "ba_hair_shader",
@@ -17,28 +26,7 @@ RIGIFY_HEAD_BONE_CANDIDATES = (
     "Bip001 Head",
 )
 
-IGNORED_RIG_NAME_TOKENS = ("mouthre",)
-
-
-def is_ignored_rig(obj):
-    if obj is None or obj.type != "ARMATURE":
-        return False
-    lowered = obj.name.lower()
-    return any(token in lowered for token in IGNORED_RIG_NAME_TOKENS)
-
 
-def find_rig_from_objects(objs):
-    for obj in objs:
-        if obj.type == 'ARMATURE' and not is_ignored_rig(obj):
-            return obj
-        for mod in obj.modifiers:
-            if mod.type == 'ARMATURE' and mod.object and not is_ignored_rig(mod.object):
-                return mod.object
-        if obj.parent and obj.parent.type == 'ARMATURE' and not is_ignored_rig(obj.parent):
-            return obj.parent
-    return None
-
-
 def find_head_bone(rig):
     if rig is None or rig.type != 'ARMATURE':
         return None
@@ -53,16 +41,72 @@ def find_head_bone(rig):
     return None
 
 
+ROTATION_ONLY_CHILD_OF = {
+    "use_location_x": False,
+    "use_location_y": False,
+    "use_location_z": False,
+    "use_rotation_x": True,
+    "use_rotation_y": True,
+    "use_rotation_z": True,
+    "use_scale_x": False,
+    "use_scale_y": False,
+    "use_scale_z": False,
+}
+HEAD_CONTROL_CONSTRAINTS = ('COPY_LOCATION', 'CHILD_OF')
+
+
+def set_if_changed(owner, attr, value):
+    if getattr(owner, attr) == value:
+        return False
+    setattr(owner, attr, value)
+    return True
+
+
 def configure_rotation_only_child_of(constraint):
-    constraint.use_location_x = False
-    constraint.use_location_y = False
-    constraint.use_location_z = False
-    constraint.use_rotation_x = True
-    constraint.use_rotation_y = True
-    constraint.use_rotation_z = True
-    constraint.use_scale_x = False
-    constraint.use_scale_y = False
-    constraint.use_scale_z = False
+    changed = False
+    for attr, value in ROTATION_ONLY_CHILD_OF.items():
+        changed |= set_if_changed(constraint, attr, value)
+    return changed
+
+
+def head_rest_rotation_inverse(rig, head_bone):
+    # Child Of only keeps the rotation channels, so the inverse is the rest
+    # rotation of the head bone. Using the rest pose keeps it independent of
+    # whatever pose the rig is in during setup.
+    rest = rig.matrix_world @ rig.data.bones[head_bone].matrix_local
+    return rest.to_quaternion().to_matrix().to_4x4().inverted()
+
+
+def reconcile_head_constraint(empty, constraint_type, rig, head_bone):
+    # Returns (constraint, rebound); rebound is True when the constraint was
+    # created or its target changed.
+    matches = [c for c in empty.constraints if c.type == constraint_type]
+    for extra in matches[1:]:
+        empty.constraints.remove(extra)
+    if matches:
+        constraint = matches[0]
+        rebound = False
+    else:
+        constraint = empty.constraints.new(type=constraint_type)
+        rebound = True
+    rebound |= set_if_changed(constraint, "target", rig)
+    rebound |= set_if_changed(constraint, "subtarget", head_bone)
+    return constraint, rebound
+
+
+# Each rig owns its control empties, named "<rig>_<control>". The rig keeps
+# ID pointers to them in custom properties (ba_control_<control>), so
+# lookups do not scan the scene and survive renames.
+
+def control_empty_name(rig, empty_name):
+    return f"{rig.name}_{empty_name}"
+
+
+def registered_control(rig, empty_name):
+    if rig is None:
+        return None
+    empty = rig.get(CONTROL_REGISTRY_PREFIX + empty_name)
+    return empty if isinstance(empty, bpy.types.Object) else None
 
 
 def ensure_head_control(context, empty_name, rig=None):
@@ -75,35 +119,31 @@ def ensure_head_control(context, empty_name, rig=None):
     if head_bone is None:
         return None
 
-    empty = bpy.data.objects.get(empty_name)
+    empty = registered_control(rig, empty_name)
     if empty is None:
-        empty = bpy.data.objects.new(empty_name, None)
+        name = control_empty_name(rig, empty_name)
+        empty = bpy.data.objects.get(name)
+        if empty is None or empty.type != 'EMPTY':
+            empty = bpy.data.objects.new(name, None)
+        rig[CONTROL_REGISTRY_PREFIX + empty_name] = empty
+    if not empty.users_collection:
         context.collection.objects.link(empty)
 
-    empty.constraints.clear()
-
-    copy_location = None
-    for c in empty.constraints:
-        if c.type == 'COPY_LOCATION':
-            copy_location = c
-            break
-
-    if copy_location is None:
-        copy_location = empty.constraints.new(type='COPY_LOCATION')
-    copy_location.target = rig
-    copy_location.subtarget = head_bone
-
-    child_of = None
-    for c in empty.constraints:
-        if c.type == 'CHILD_OF' and c.target == rig and c.subtarget == head_bone:
-            child_of = c
-            break
-
-    if child_of is None:
-        child_of = empty.constraints.new(type='CHILD_OF')
-    child_of.target = rig
-    child_of.subtarget = head_bone
+    # Reconcile instead of clearing: untouched constraints keep the
+    # depsgraph relations valid across repeated setup and retarget runs.
+    for c in list(empty.constraints):
+        if c.type not in HEAD_CONTROL_CONSTRAINTS:
+            empty.constraints.remove(c)
+
+    reconcile_head_constraint(empty, 'COPY_LOCATION', rig, head_bone)
+    child_of, rebound = reconcile_head_constraint(empty, 'CHILD_OF', rig, head_bone)
     configure_rotation_only_child_of(child_of)
+    if rebound:
+        child_of.set_inverse_pending = False
+        child_of.inverse_matrix = head_rest_rotation_inverse(rig, head_bone)
+
+    if empty.constraints[0].type != 'COPY_LOCATION':
+        empty.constraints.move(1, 0)
 
     return empty
 
@@ -116,13 +156,24 @@ def ensure_face_light_dot_control(context):
     return ensure_head_control(context, CONTROL_EMPTY_NAME_FACE)
 
 
-def retarget_shader_controls_to_rig(context, rig):
+def setup_shader_controls(context, plan=None):
+    if plan is None:
+        plan = ScenePlan.from_context(context)
+    if plan.rig is None:
+        remove_shared_node_group_drivers()
+        return None, None
+    return retarget_shader_controls_to_rig(context, plan.rig, plan)
+
+
+def retarget_shader_controls_to_rig(context, rig, plan=None):
+    if plan is None:
+        plan = ScenePlan.from_context(context, rig=rig)
     hair_empty = ensure_head_control(context, CONTROL_EMPTY_NAME, rig=rig)
     face_empty = ensure_head_control(context, CONTROL_EMPTY_NAME_FACE, rig=rig)
 
     remove_shared_node_group_drivers()
-    add_hair_rotation_drivers(hair_empty, context)
-    add_face_rotation_drivers(face_empty, context)
+    add_hair_rotation_drivers(rig, context, plan)
+    add_face_rotation_drivers(rig, context, plan)
 
     return hair_empty, face_empty
 
@@ -158,53 +209,129 @@ def _find_rotation_shader_node(mat, node_group_name):
     return None
 
 
-def _add_rotation_drivers(empty, context, node_group_name, axis_map, invert_map):
-    if empty is None:
+# The control empties drive one small node group per character whose
+# FaceRotation/HairRotation outputs feed the Rotation input of every face and
+# hair shader. The driver count stays at six per character however many
+# materials and objects share it.
+
+def rotation_source_name(rig):
+    return f"{ROTATION_SOURCE_PREFIX}_{rig.name}"
+
+
+def _has_output_socket(group, name):
+    return any(
+        item.item_type == 'SOCKET' and item.in_out == 'OUTPUT' and item.name == name
+        for item in group.interface.items_tree
+    )
+
+
+def ensure_rotation_source(rig):
+    group = rig.get(ROTATION_SOURCE_PROPERTY)
+    if not isinstance(group, bpy.types.ShaderNodeTree):
+        group = bpy.data.node_groups.new(rotation_source_name(rig), 'ShaderNodeTree')
+        rig[ROTATION_SOURCE_PROPERTY] = group
+
+    output = group.nodes.get("Group Output")
+    if output is None:
+        output = group.nodes.new('NodeGroupOutput')
+        output.name = "Group Output"
+        output.location = (200, 0)
+
+    for i, socket_name in enumerate((FACE_ROTATION_OUTPUT, HAIR_ROTATION_OUTPUT)):
+        if not _has_output_socket(group, socket_name):
+            group.interface.new_socket(socket_name, in_out='OUTPUT', socket_type='NodeSocketVector')
+
+        combine = group.nodes.get(socket_name)
+        if combine is None:
+            combine = group.nodes.new('ShaderNodeCombineXYZ')
+            combine.name = socket_name
+            combine.label = socket_name
+            combine.location = (0, -150 * i)
+        if not output.inputs[socket_name].is_linked:
+            group.links.new(combine.outputs[0], output.inputs[socket_name])
+
+    return group
+
+
+def _drive_rotation_source(group, output_name, empty, axis_map, invert_map):
+    combine = group.nodes[output_name]
+    for socket, axis, invert in zip(combine.inputs, axis_map, invert_map):
+        try:
+            socket.driver_remove("default_value")
+        except TypeError:
+            pass
+
+        fcurve = socket.driver_add("default_value")
+        driver = fcurve.driver
+        driver.type = 'SCRIPTED'
+
+        var = driver.variables.new()
+        var.name = 'rot'
+        var.type = 'TRANSFORMS'
+
+        target = var.targets[0]
+        target.id = empty
+        target.transform_type = f'ROT_{axis}'
+        target.transform_space = 'WORLD_SPACE'
+
+        driver.expression = '-rot' if invert else 'rot'
+
+
+def _link_rotation_source(mat, shader_node, rotation_input, group, output_name):
+    # Drivers written on the Rotation socket by earlier versions are dropped.
+    for i in range(3):
+        try:
+            rotation_input.driver_remove("default_value", i)
+        except TypeError:
+            pass
+
+    nt = mat.node_tree
+    source = nt.nodes.get(ROTATION_SOURCE_NODE_NAME)
+    if source is None or source.type != 'GROUP':
+        source = nt.nodes.new('ShaderNodeGroup')
+        source.name = ROTATION_SOURCE_NODE_NAME
+        source.label = ROTATION_SOURCE_NODE_NAME
+        source.location = (shader_node.location.x - 250, shader_node.location.y - 400)
+    if source.node_tree != group:
+        source.node_tree = group
+
+    output = source.outputs.get(output_name)
+    if any(link.from_socket == output for link in rotation_input.links):
         return
+    for link in list(rotation_input.links):
+        nt.links.remove(link)
+    nt.links.new(output, rotation_input)
 
-    for obj in context.selected_objects:
-        if obj.type != 'MESH':
-            continue
-
-        for slot in obj.material_slots:
-            mat = slot.material
-            shader_node = _find_rotation_shader_node(mat, node_group_name)
-            if shader_node is None:
-                continue
 
-            rotation_input = shader_node.inputs.get("Rotation")
-            if rotation_input is None:
-                print(f"[Warning] Node Group {shader_node.node_tree.name} has no input named 'Rotation'")
-                continue
-            if rotation_input.type != 'VECTOR':
-                print(f"[Warning] Input 'Rotation' of Node Group {shader_node.node_tree.name} is not VECTOR")
-                continue
-
-            for i, (axis, invert) in enumerate(zip(axis_map, invert_map)):
-                try:
-                    rotation_input.driver_remove("default_value", i)
-                except TypeError:
-                    pass
+def _add_rotation_drivers(rig, context, plan, empty_name, node_group_name, output_name, axis_map, invert_map):
+    empty = registered_control(rig, empty_name)
+    if empty is None:
+        return
 
-                fcurve = rotation_input.driver_add("default_value", i)
-                driver = fcurve.driver
-                driver.type = 'SCRIPTED'
+    group = ensure_rotation_source(rig)
+    _drive_rotation_source(group, output_name, empty, axis_map, invert_map)
 
-                var = driver.variables.new()
-                var.name = 'rot'
-                var.type = 'TRANSFORMS'
+    if plan is None:
+        plan = ScenePlan.from_context(context, rig=rig)
+    for mat in plan.materials_for_rig(rig):
+        shader_node = _find_rotation_shader_node(mat, node_group_name)
+        if shader_node is None:
+            continue
 
-                target = var.targets[0]
-                target.id = empty
-                target.transform_type = f'ROT_{axis}'
-                target.transform_space = 'WORLD_SPACE'
+        rotation_input = shader_node.inputs.get("Rotation")
+        if rotation_input is None:
+            print(f"[Warning] Node Group {shader_node.node_tree.name} has no input named 'Rotation'")
+            continue
+        if rotation_input.type != 'VECTOR':
+            print(f"[Warning] Input 'Rotation' of Node Group {shader_node.node_tree.name} is not VECTOR")
+            continue
 
-                driver.expression = '-rot' if invert else 'rot'
+        _link_rotation_source(mat, shader_node, rotation_input, group, output_name)
 
 
-def add_face_rotation_drivers(empty, context):
-    _add_rotation_drivers(empty, context, 'ba_face_shader', ['X', 'Y', 'Z'], [False, False, False])
+def add_face_rotation_drivers(rig, context, plan=None):
+    _add_rotation_drivers(rig, context, plan, CONTROL_EMPTY_NAME_FACE, 'ba_face_shader', FACE_ROTATION_OUTPUT, ['X', 'Y', 'Z'], [False, False, False])
 
 
-def add_hair_rotation_drivers(empty, context):
-    _add_rotation_drivers(empty, context, 'ba_hair_shader', ['X', 'Z', 'Y'], [True, True, True])
+def add_hair_rotation_drivers(rig, context, plan=None):
+    _add_rotation_drivers(rig, context, plan, CONTROL_EMPTY_NAME, 'ba_hair_shader', HAIR_ROTATION_OUTPUT, ['X', 'Z', 'Y'], [True, True, True])
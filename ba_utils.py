@@ -1,6 +1,17 @@
+import cProfile
+import hashlib
+import io
+import json
 import os
+import pstats
+import time
+import tracemalloc
 
 import bpy
+from bpy.app.handlers import persistent
+
+from . import ba_manifest
+from .ba_rig_utils import object_context
 
 
 NODE_GROUP_BLEND = "ba_node_groups.blend"
@@ -25,6 +36,11 @@ def import_node_group(group_name, log_prefix="[BA]", report_missing=True):
         return bpy.data.node_groups[group_name]
 
     blend_path = nodegroup_blend_path(log_prefix)
+    if ba_manifest.library_has(blend_path, "node_groups", group_name) is False:
+        if report_missing:
+            print(f"{log_prefix} Node group not found: {group_name}")
+        return None
+
     with bpy.data.libraries.load(blend_path, link=False) as (data_from, data_to):
         if group_name in data_from.node_groups:
             data_to.node_groups = [group_name]
@@ -36,6 +52,45 @@ def import_node_group(group_name, log_prefix="[BA]", report_missing=True):
     return bpy.data.node_groups.get(group_name)
 
 
+def preload_library(node_groups=(), materials=(), collections=(), log_prefix="[BA]"):
+    requested = {
+        "node_groups": (node_groups, bpy.data.node_groups, "Node group"),
+        "materials": (materials, bpy.data.materials, "Material"),
+        "collections": (collections, bpy.data.collections, "Collection"),
+    }
+    wanted = {
+        attr: list(dict.fromkeys(name for name in names if name not in existing))
+        for attr, (names, existing, _) in requested.items()
+    }
+    if not any(wanted.values()):
+        return
+
+    blend_path = nodegroup_blend_path(log_prefix)
+    if not os.path.exists(blend_path):
+        return
+
+    for attr, names in wanted.items():
+        listed = []
+        for name in names:
+            if ba_manifest.library_has(blend_path, attr, name) is False:
+                print(f"{log_prefix} {requested[attr][2]} not found: {name}")
+            else:
+                listed.append(name)
+        wanted[attr] = listed
+    if not any(wanted.values()):
+        return
+
+    with bpy.data.libraries.load(blend_path, link=False) as (data_from, data_to):
+        for attr, names in wanted.items():
+            if not names:
+                continue
+            available = set(getattr(data_from, attr))
+            for name in names:
+                if name not in available:
+                    print(f"{log_prefix} {requested[attr][2]} not found: {name}")
+            setattr(data_to, attr, [name for name in names if name in available])
+
+
 def ensure_node_group(group_name, log_prefix="[BA]"):
     return import_node_group(group_name, log_prefix)
 
@@ -45,6 +100,10 @@ def import_material(mat_name, log_prefix="[BA]"):
         return bpy.data.materials[mat_name]
 
     blend_path = nodegroup_blend_path(log_prefix)
+    if ba_manifest.library_has(blend_path, "materials", mat_name) is False:
+        print(f"{log_prefix} Material not found: {mat_name}")
+        return None
+
     with bpy.data.libraries.load(blend_path, link=False) as (data_from, data_to):
         if mat_name not in data_from.materials:
             print(f"{log_prefix} Material not found: {mat_name}")
@@ -54,6 +113,53 @@ def import_material(mat_name, log_prefix="[BA]"):
     return bpy.data.materials.get(mat_name)
 
 
+def image_stem(img):
+    path = bpy.path.abspath(img.filepath) if img.filepath else img.name
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+class TextureIndex:
+    def __init__(self, images):
+        self.images = list(images)
+        self.stems = {}
+        self._by_suffix = {}
+
+        for img in self.images:
+            stem = image_stem(img)
+            self.stems[img] = stem
+            if not img.filepath:
+                continue
+
+            # Index every suffix so a role lookup is one dict hit while keeping
+            # find_image's "first image whose name ends with keyword" result.
+            lowered = stem.lower()
+            for start in range(len(lowered)):
+                self._by_suffix.setdefault(lowered[start:], img)
+
+    def __iter__(self):
+        return iter(self.images)
+
+    def __len__(self):
+        return len(self.images)
+
+    def find(self, keyword):
+        return self._by_suffix.get(keyword.lower())
+
+
+def texture_index(images):
+    if isinstance(images, TextureIndex):
+        return images
+    return TextureIndex(images)
+
+
+def load_texture_index(directory, filenames):
+    images = []
+    for filename in filenames:
+        path = os.path.join(directory, filename)
+        images.append(bpy.data.images.load(path, check_existing=True))
+    return TextureIndex(images)
+
+
 def ensure_output(mat):
     nt = mat.node_tree
     out = nt.nodes.get("Material Output")
@@ -73,21 +179,54 @@ def configure_alpha_material(mat):
     mat.show_transparent_back = False
 
 
+# -------- deferred depsgraph updates --------
+# Stages tag the objects they changed (for example modifier inputs written
+# as ID properties, which do not notify the depsgraph) and the operator
+# flushes once at the end: one update_tag per object, one view layer
+# evaluation per run.
+
+class DepsgraphUpdates:
+    def __init__(self):
+        self.object_names = {}
+
+    def tag(self, obj):
+        self.object_names[obj.name] = None
+
+    def flush(self, context=None):
+        context = context or bpy.context
+        for name in self.object_names:
+            obj = bpy.data.objects.get(name)
+            if obj is not None:
+                obj.update_tag()
+        self.object_names.clear()
+        context.view_layer.update()
+
+
+depsgraph_updates = DepsgraphUpdates()
+
+
 def refresh_view_layer(context):
-    context.view_layer.update()
+    depsgraph_updates.flush(context)
+
 
+def prepare_image(img, non_color=False):
+    img.alpha_mode = 'CHANNEL_PACKED'
+    if non_color:
+        img.colorspace_settings.name = 'Non-Color'
 
-def new_tex(nt, img, non_color=False, loc=(0, 0)):
+
+def new_tex(nt, img, non_color=False, loc=(0, 0), name=None):
     if img is None:
         return None
 
     node = nt.nodes.new("ShaderNodeTexImage")
     node.image = img
+    if name:
+        # Role name ("Body", "Hair_Mask"...) so template copies can swap images.
+        node.name = name
 
     if node.image:
-        node.image.alpha_mode = 'CHANNEL_PACKED'
-        if non_color:
-            node.image.colorspace_settings.name = 'Non-Color'
+        prepare_image(node.image, non_color)
 
     node.location = loc
     return node
@@ -176,6 +315,240 @@ def link_alpha_to_output(nt, alpha_node, output_node):
     )
 
 
+# -------- recipe signatures --------
+# A handler stamps the signature of its inputs on the material; re-running
+# with the same inputs skips the material instead of rebuilding it.
+
+RECIPE_VERSION = 1
+RECIPE_PROPERTY = "ba_recipe"
+
+
+def library_version():
+    manifest = ba_manifest.load_manifest(nodegroup_blend_path())
+    return manifest.get("hash", "") if manifest else ""
+
+
+def image_signature(img):
+    if img is None:
+        return "-"
+    path = bpy.path.abspath(img.filepath)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = 0
+    return f"{img.name}|{path}|{mtime}"
+
+
+def recipe_signature(name, *parts):
+    digest = hashlib.sha1(f"v{RECIPE_VERSION}|{name}|{library_version()}".encode("utf-8"))
+    for part in parts:
+        digest.update(f"\n{part}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def material_signature(name, roles):
+    return recipe_signature(name, *(f"{role}={image_signature(roles[role])}" for role in sorted(roles)))
+
+
+def is_up_to_date(mat, signature):
+    return mat.get(RECIPE_PROPERTY) == signature and mat.node_tree is not None and len(mat.node_tree.nodes) > 0
+
+
+# -------- material templates --------
+# Each handler builds its node tree once per (handler, roles present) into a
+# scratch material; later materials get that tree written into their own
+# node tree with the role images swapped in, instead of a node-by-node
+# rebuild. The material datablock itself is never replaced, so its settings,
+# animation data, asset data and library/override status stay intact. Of
+# the material settings only those the handler's build changed on the
+# template are carried over.
+
+TEMPLATE_PREFIX = "BA_TEMPLATE"
+TEMPLATE_MATERIAL_SETTINGS = (
+    "surface_render_method",
+    "show_transparent_back",
+    "displacement_method",
+)
+
+
+class MaterialTemplates:
+    def __init__(self):
+        self.materials = {}
+        self.settings = {}
+
+    @staticmethod
+    def key(name, roles):
+        return name, tuple(sorted(role for role, img in roles.items() if img is not None))
+
+    def get(self, name, roles, build):
+        key = self.key(name, roles)
+        template = self.materials.get(key)
+        if template is None:
+            template = bpy.data.materials.new(f"{TEMPLATE_PREFIX}_{name}")
+            template.use_nodes = True
+            defaults = {attr: getattr(template, attr) for attr in TEMPLATE_MATERIAL_SETTINGS}
+            build(template, roles)
+            mark_managed(template.node_tree)
+            self.materials[key] = template
+            self.settings[template.name] = {
+                attr: getattr(template, attr)
+                for attr in TEMPLATE_MATERIAL_SETTINGS
+                if getattr(template, attr) != defaults[attr]
+            }
+        return template
+
+    def apply(self, template, mat, roles):
+        # A material the add-on has not set up yet starts from an empty tree,
+        # as the handlers' own builds do.
+        if not has_managed_nodes(mat):
+            clear_nodes(mat)
+        reconcile_material(mat, template, roles)
+        for attr, value in self.settings.get(template.name, {}).items():
+            if getattr(mat, attr) != value:
+                setattr(mat, attr, value)
+        return mat
+
+    def clear(self):
+        for template in self.materials.values():
+            if id_alive(template):
+                bpy.data.materials.remove(template)
+        self.materials.clear()
+        self.settings.clear()
+
+
+# -------- node tree reconciliation --------
+# Nodes created by a handler carry node["ba_managed"] set to their template
+# node's name, which stays valid when Blender had to rename the node because
+# an artist node already held the name. A material that was set up before
+# is diffed against the handler's template instead of cleared:
+# managed nodes are updated, added or removed, artist nodes and the links
+# they feed are left alone, and default values are only written on nodes
+# that had to be created.
+
+MANAGED_PROPERTY = "ba_managed"
+
+
+def mark_managed(nt):
+    for node in nt.nodes:
+        node[MANAGED_PROPERTY] = node.name
+
+
+def managed_name(node):
+    # Trees tagged before the template name was stored carry True.
+    value = node.get(MANAGED_PROPERTY)
+    if not value:
+        return None
+    return value if isinstance(value, str) else node.name
+
+
+def has_managed_nodes(mat):
+    return mat.node_tree is not None and any(node.get(MANAGED_PROPERTY) for node in mat.node_tree.nodes)
+
+
+def socket_by_identifier(sockets, identifier):
+    for socket in sockets:
+        if socket.identifier == identifier:
+            return socket
+    return None
+
+
+def link_key(link, names=None):
+    from_name, to_name = link.from_node.name, link.to_node.name
+    if names is not None:
+        from_name, to_name = names[from_name], names[to_name]
+    return (from_name, link.from_socket.identifier, to_name, link.to_socket.identifier)
+
+
+def copy_input_defaults(src, node):
+    for src_socket in src.inputs:
+        if src_socket.is_linked or not hasattr(src_socket, "default_value"):
+            continue
+        socket = socket_by_identifier(node.inputs, src_socket.identifier)
+        if socket is not None and hasattr(socket, "default_value"):
+            socket.default_value = src_socket.default_value
+
+
+def update_managed_node(src, node, roles):
+    if src.type == 'GROUP' and node.node_tree != src.node_tree:
+        node.node_tree = src.node_tree
+    elif src.type == 'TEX_IMAGE':
+        img = roles.get(src.name) or src.image
+        if node.image != img:
+            if img is not None:
+                prepare_image(img, src.image is not None and src.image.colorspace_settings.name == 'Non-Color')
+            node.image = img
+
+
+def reconcile_material(mat, template, roles):
+    nt = mat.node_tree
+    existing = {}
+    for node in nt.nodes:
+        name = managed_name(node)
+        if name is not None:
+            existing[name] = node
+    managed = {}
+    for src in template.node_tree.nodes:
+        node = existing.pop(src.name, None)
+        if node is not None and node.bl_idname != src.bl_idname:
+            nt.nodes.remove(node)
+            node = None
+        if node is None:
+            node = nt.nodes.new(src.bl_idname)
+            node.name = src.name
+            node.label = src.label
+            node.location = src.location
+            node[MANAGED_PROPERTY] = src.name
+            update_managed_node(src, node, roles)
+            copy_input_defaults(src, node)
+        else:
+            update_managed_node(src, node, roles)
+        managed[src.name] = node
+
+    for node in existing.values():
+        nt.nodes.remove(node)
+
+    # Node names can differ from the template's when an artist node held the
+    # name; map both trees onto the stored template names.
+    names = {node.name: name for name, node in managed.items()}
+    desired = {link_key(link) for link in template.node_tree.links}
+    present = set()
+    for link in list(nt.links):
+        if link.from_node.name not in names or link.to_node.name not in names:
+            continue
+        key = link_key(link, names)
+        if key in desired:
+            present.add(key)
+        else:
+            nt.links.remove(link)
+
+    for key in desired - present:
+        from_name, from_identifier, to_name, to_identifier = key
+        from_socket = socket_by_identifier(managed[from_name].outputs, from_identifier)
+        to_socket = socket_by_identifier(managed[to_name].inputs, to_identifier)
+        if from_socket is None or to_socket is None or to_socket.is_linked:
+            continue
+        nt.links.new(from_socket, to_socket)
+
+
+def build_material(mat, name, roles, build, templates=None):
+    signature = material_signature(name, roles)
+    if is_up_to_date(mat, signature):
+        return mat
+
+    if templates is None and not has_managed_nodes(mat):
+        build(mat, roles)
+        mark_managed(mat.node_tree)
+    else:
+        cache = templates or MaterialTemplates()
+        try:
+            cache.apply(cache.get(name, roles, build), mat, roles)
+        finally:
+            if templates is None:
+                cache.clear()
+    mat[RECIPE_PROPERTY] = signature
+    return mat
+
+
 def remove_existing_nodes_modifier(obj, node_group_name):
     for mod in list(obj.modifiers):
         if (
@@ -187,13 +560,273 @@ def remove_existing_nodes_modifier(obj, node_group_name):
 
 
 def ensure_socket_is_attribute(obj, modifier, socket_identifier):
-    view_layer = bpy.context.view_layer
-    view_layer.objects.active = obj
-
-    if obj.mode != 'OBJECT':
-        bpy.ops.object.mode_set(mode='OBJECT')
-
-    bpy.ops.object.geometry_nodes_input_attribute_toggle(
-        modifier_name=modifier.name,
-        input_name=socket_identifier
-    )
+    # The input-attribute toggle operator only flips the modifier's
+    # "<identifier>_use_attribute" ID property. Write it directly so no
+    # context, active object or mode is needed; the operator is the fallback
+    # when the property does not exist. The caller tags the object for the
+    # depsgraph, since ID property writes do not.
+    key = f"{socket_identifier}_use_attribute"
+    if key in modifier:
+        modifier[key] = True
+        return
+
+    with object_context(obj):
+        if obj.mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode='OBJECT')
+        bpy.ops.object.geometry_nodes_input_attribute_toggle(
+            modifier_name=modifier.name,
+            input_name=socket_identifier
+        )
+
+
+# -------- profiling --------
+# BA_PROFILE=1 records span timings; add ",cprofile" and/or ",tracemalloc" for
+# captures on outermost spans. BA_PROFILE_LOG=<path> appends one JSON line per span.
+
+PROFILE_ENV = "BA_PROFILE"
+PROFILE_LOG_ENV = "BA_PROFILE_LOG"
+PROFILE_TOP_FUNCTIONS = 15
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Profiler:
+    def __init__(self, enabled=False, captures=(), log_path=""):
+        self.enabled = enabled
+        self.captures = frozenset(captures)
+        self.log_path = log_path
+        self.depth = 0
+        self.stats = {}
+
+    @classmethod
+    def from_env(cls):
+        flags = [flag.strip().lower() for flag in os.environ.get(PROFILE_ENV, "").split(",") if flag.strip()]
+        enabled = any(flag not in {"0", "false", "off"} for flag in flags)
+        return cls(enabled, [flag for flag in flags if flag in {"cprofile", "tracemalloc"}], os.environ.get(PROFILE_LOG_ENV, ""))
+
+    def record(self, name, elapsed, fields, extra):
+        entry = self.stats.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed
+        if not self.log_path:
+            return
+        line = {"span": name, "elapsed": elapsed, "time": time.time(), "depth": self.depth}
+        line.update(fields)
+        line.update(extra)
+        try:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(line, default=str) + "\n")
+        except OSError as exc:
+            print(f"[BA] Could not write profile log {self.log_path}: {exc}")
+
+    def summary(self, limit=8):
+        ranked = sorted(self.stats.items(), key=lambda item: item[1][1], reverse=True)
+        return ", ".join(f"{name} {calls}x {total:.3f}s" for name, (calls, total) in ranked[:limit])
+
+    def reset(self):
+        self.stats.clear()
+
+
+class _Span:
+    def __init__(self, profiler, name, fields):
+        self.profiler = profiler
+        self.name = name
+        self.fields = fields
+        self.profile = None
+        self.tracing = False
+
+    def __enter__(self):
+        profiler = self.profiler
+        # Captures only on outermost spans: cProfile cannot nest and
+        # tracemalloc has a single peak counter.
+        if profiler.depth == 0:
+            if "tracemalloc" in profiler.captures and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.tracing = True
+            if "cprofile" in profiler.captures:
+                self.profile = cProfile.Profile()
+                self.profile.enable()
+        profiler.depth += 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        profiler = self.profiler
+        profiler.depth -= 1
+        extra = {}
+        if self.profile is not None:
+            self.profile.disable()
+            out = io.StringIO()
+            pstats.Stats(self.profile, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+            extra["cprofile"] = out.getvalue()
+        if self.tracing:
+            extra["tracemalloc_peak"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        profiler.record(self.name, elapsed, self.fields, extra)
+        return False
+
+
+profiler = Profiler.from_env()
+
+
+def span(name, **fields):
+    if not profiler.enabled:
+        return _NULL_SPAN
+    return _Span(profiler, name, fields)
+
+
+def report_profile(operator=None, title="BA profile"):
+    if not profiler.enabled or not profiler.stats:
+        return
+    message = f"{title}: {profiler.summary()}"
+    print(f"[BA] {message}")
+    if operator is not None:
+        operator.report({'INFO'}, message)
+    profiler.reset()
+
+
+# -------- time-sliced operators --------
+# A step generator yields (done, total, label) before each unit of work and
+# is sent the context to continue with. Every unit leaves the scene
+# consistent, so stopping between two units never leaves a half-built
+# material behind.
+
+STEP_TIME_BUDGET = 0.05
+STEP_TIMER_INTERVAL = 0.01
+
+
+def id_alive(datablock):
+    # False once the datablock was removed, e.g. by the user between two
+    # modal steps.
+    try:
+        datablock.name
+    except ReferenceError:
+        return False
+    return True
+
+
+def run_steps(steps, context):
+    try:
+        next(steps)
+        while True:
+            steps.send(context)
+    except StopIteration as stop:
+        return stop.value
+
+
+# Modal runs in progress; an undo invalidates the datablocks they hold, so
+# undo_pre cancels them before their next step.
+_stepped_runs = set()
+
+
+@persistent
+def _cancel_stepped_runs(*args):
+    for operator in _stepped_runs:
+        operator._undone = True
+
+
+class SteppedOperator:
+    # Mixin for operators whose work is a step generator. Invoked from the UI
+    # with a window, the steps run from a timer in slices of STEP_TIME_BUDGET
+    # and Esc or an undo cancels. Called from a script (execute only) or in
+    # the background, they run synchronously so callers see the result on
+    # return. Subclasses set self._interactive in invoke.
+    _steps = None
+    _timer = None
+    _interactive = False
+    _undone = False
+
+    def steps(self, context):
+        raise NotImplementedError
+
+    def finish(self, context, result):
+        return {'FINISHED'}
+
+    def execute(self, context):
+        steps = self.steps(context)
+        if not self._interactive or context.window is None:
+            return self.finish(context, run_steps(steps, context))
+
+        try:
+            progress = next(steps)
+        except StopIteration as stop:
+            return self.finish(context, stop.value)
+
+        wm = context.window_manager
+        self._steps = steps
+        self._timer = wm.event_timer_add(STEP_TIMER_INTERVAL, window=context.window)
+        wm.progress_begin(0, max(progress[1], 1))
+        wm.modal_handler_add(self)
+        _stepped_runs.add(self)
+        self.show_progress(context, progress)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if self._undone:
+            self.abort_steps(context)
+            self.report({'WARNING'}, f"{self.bl_label}: cancelled by undo")
+            return {'CANCELLED'}
+        if event.type == 'ESC' and event.value == 'PRESS':
+            self.abort_steps(context)
+            self.report({'WARNING'}, f"{self.bl_label}: cancelled")
+            return {'CANCELLED'}
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        deadline = time.perf_counter() + STEP_TIME_BUDGET
+        try:
+            progress = self._steps.send(context)
+            while time.perf_counter() < deadline:
+                progress = self._steps.send(context)
+        except StopIteration as stop:
+            self.end_steps(context)
+            return self.finish(context, stop.value)
+        except Exception:
+            self.abort_steps(context)
+            raise
+
+        self.show_progress(context, progress)
+        return {'RUNNING_MODAL'}
+
+    def show_progress(self, context, progress):
+        done, total, label = progress
+        context.window_manager.progress_update(done)
+        if context.workspace is not None:
+            context.workspace.status_text_set(f"{self.bl_label}: {label} ({done}/{total}), Esc to cancel")
+
+    def abort_steps(self, context):
+        # Runs the generator's finally blocks now rather than at garbage
+        # collection, and flushes the depsgraph tags queued by finished steps.
+        self._steps.close()
+        self.end_steps(context)
+        refresh_view_layer(context)
+
+    def end_steps(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        if context.workspace is not None:
+            context.workspace.status_text_set(None)
+        _stepped_runs.discard(self)
+        self._steps = None
+        self._timer = None
+
+
+def register_stepped_operators():
+    if _cancel_stepped_runs not in bpy.app.handlers.undo_pre:
+        bpy.app.handlers.undo_pre.append(_cancel_stepped_runs)
+
+
+def unregister_stepped_operators():
+    if _cancel_stepped_runs in bpy.app.handlers.undo_pre:
+        bpy.app.handlers.undo_pre.remove(_cancel_stepped_runs)
@@ -0,0 +1,200 @@
+"""Compare a benchmark run against a stored baseline and emit a verdict.
+
+    python benchmarks/compare.py --candidate results.json
+    python benchmarks/compare.py --blender /path/to/blender --vertices 10000 100000
+    python benchmarks/compare.py --candidate results.json --update-baseline
+
+A stage fails when its wall time grew by more than --threshold percent (and
+by at least --min-seconds), when its Python call count grew by more than
+--calls-threshold percent, or when it created more datablocks than in the
+baseline. Exits 1 on a failing verdict. Plain Python; does not import bpy.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_VERDICT = os.path.join(BENCH_DIR, "verdict.json")
+GATED_STAGES = (
+    "setup_character_material",
+    "build_outline_vertex_group",
+    "add_ba_outline",
+    "metarig_alignment",
+    "copy_extra_bones_to_target",
+    "migrate_vertex_groups",
+)
+DEFAULT_THRESHOLD = 25.0
+DEFAULT_CALLS_THRESHOLD = 5.0
+DEFAULT_MIN_SECONDS = 0.005
+
+
+def load_results(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def run_benchmark(blender, vertices):
+    fd, output = tempfile.mkstemp(prefix="ba_bench_", suffix=".json")
+    os.close(fd)
+    command = [
+        blender,
+        "--background",
+        "--factory-startup",
+        "--python-exit-code", "1",
+        "--python", os.path.join(BENCH_DIR, "run.py"),
+        "--", "--output", output,
+    ]
+    if vertices:
+        command += ["--vertices"] + [str(count) for count in vertices]
+    subprocess.run(command, check=True)
+    return output
+
+
+def cases_by_vertices(results):
+    return {case["vertices"]: case for case in results.get("cases", ())}
+
+
+def datablock_delta(entry):
+    before = entry.get("datablocks_before")
+    after = entry.get("datablocks_after")
+    if before is None or after is None:
+        return {}
+    return {name: after[name] - before.get(name, 0) for name in after}
+
+
+def percent_change(baseline, candidate):
+    if baseline <= 0:
+        return None
+    return 100.0 * (candidate - baseline) / baseline
+
+
+def compare_stage(case, stage, base, cand, args):
+    findings = []
+
+    base_time, cand_time = base["wall_time"], cand["wall_time"]
+    change = percent_change(base_time, cand_time)
+    if change is not None and change > args.threshold and cand_time - base_time >= args.min_seconds:
+        findings.append(("wall_time", base_time, cand_time, change))
+
+    if "python_calls" in base and "python_calls" in cand:
+        change = percent_change(base["python_calls"], cand["python_calls"])
+        if change is not None and change > args.calls_threshold:
+            findings.append(("python_calls", base["python_calls"], cand["python_calls"], change))
+
+    base_blocks = datablock_delta(base)
+    for name, created in datablock_delta(cand).items():
+        if created > base_blocks.get(name, 0):
+            findings.append((f"datablocks.{name}", base_blocks.get(name, 0), created, None))
+
+    return [
+        {
+            "vertices": case,
+            "stage": stage,
+            "metric": metric,
+            "baseline": base_value,
+            "candidate": cand_value,
+            "change_pct": None if change is None else round(change, 2),
+        }
+        for metric, base_value, cand_value, change in findings
+    ]
+
+
+def compare(baseline, candidate, args):
+    stages = args.stages or GATED_STAGES
+    base_cases = cases_by_vertices(baseline)
+    cand_cases = cases_by_vertices(candidate)
+
+    regressions = []
+    missing = []
+    compared = []
+    for vertices, base_case in sorted(base_cases.items()):
+        cand_case = cand_cases.get(vertices)
+        if cand_case is None:
+            missing.append({"vertices": vertices, "stage": None})
+            continue
+        for stage in stages:
+            base = base_case["stages"].get(stage)
+            cand = cand_case["stages"].get(stage)
+            if base is None:
+                continue
+            if cand is None:
+                missing.append({"vertices": vertices, "stage": stage})
+                continue
+            compared.append(
+                {
+                    "vertices": vertices,
+                    "stage": stage,
+                    "baseline_wall_time": base["wall_time"],
+                    "candidate_wall_time": cand["wall_time"],
+                    "change_pct": percent_change(base["wall_time"], cand["wall_time"]),
+                }
+            )
+            regressions += compare_stage(vertices, stage, base, cand, args)
+
+    return {
+        "verdict": "fail" if regressions or missing else "pass",
+        "thresholds": {
+            "wall_time_pct": args.threshold,
+            "min_seconds": args.min_seconds,
+            "python_calls_pct": args.calls_threshold,
+        },
+        "baseline_blender": baseline.get("blender"),
+        "candidate_blender": candidate.get("blender"),
+        "regressions": regressions,
+        "missing": missing,
+        "compared": compared,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Gate benchmark results against a stored baseline.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--candidate", help="Results JSON from benchmarks/run.py; runs the benchmark if omitted")
+    parser.add_argument("--blender", default=os.environ.get("BLENDER", "blender"))
+    parser.add_argument("--vertices", type=int, nargs="*", help="Vertex counts passed to run.py")
+    parser.add_argument("--stages", nargs="*", help=f"Stages to gate (default: {' '.join(GATED_STAGES)})")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed wall-time growth in percent")
+    parser.add_argument("--calls-threshold", type=float, default=DEFAULT_CALLS_THRESHOLD, help="Allowed Python call-count growth in percent")
+    parser.add_argument("--min-seconds", type=float, default=DEFAULT_MIN_SECONDS, help="Ignore wall-time growth below this")
+    parser.add_argument("--output", default=DEFAULT_VERDICT, help="Where to write the verdict JSON")
+    parser.add_argument("--update-baseline", action="store_true", help="Store the candidate as the new baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    candidate_path = args.candidate or run_benchmark(args.blender, args.vertices)
+
+    if args.update_baseline:
+        shutil.copyfile(candidate_path, args.baseline)
+        print(f"[BA bench] Baseline updated: {args.baseline}")
+        return 0
+
+    if not os.path.isfile(args.baseline):
+        print(f"[BA bench] No baseline at {args.baseline}; create one with --update-baseline")
+        return 2
+
+    verdict = compare(load_results(args.baseline), load_results(candidate_path), args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(verdict, f, indent=1, sort_keys=True)
+
+    for item in verdict["regressions"]:
+        print(
+            f"[BA bench] REGRESSION {item['stage']} @ {item['vertices']} vertices: "
+            f"{item['metric']} {item['baseline']} -> {item['candidate']}"
+        )
+    for item in verdict["missing"]:
+        print(f"[BA bench] MISSING {item['stage'] or 'case'} @ {item['vertices']} vertices")
+    print(f"[BA bench] Verdict: {verdict['verdict']} ({args.output})")
+    return 0 if verdict["verdict"] == "pass" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""Benchmark the add-on stages on synthetic BA-style characters.
+
+    blender --background --factory-startup --python benchmarks/run.py -- \
+        --vertices 10000 100000 1000000 --slots 9 --hair-chains 24 --skirt-chains 12 \
+        --output benchmarks/results.json
+
+Every size starts from an empty scene with the same seed, so runs are
+comparable across commits.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import addon_utils
+import bpy
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_DIR = os.path.dirname(BENCH_DIR)
+for path in (BENCH_DIR, ADDON_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import ba_batch_worker
+import synthetic
+from timer import StageTimer, datablock_counts, merge_instrumented
+
+
+DEFAULT_VERTICES = (10_000, 100_000, 1_000_000)
+RESET_COLLECTIONS = ("objects", "meshes", "armatures", "materials", "node_groups", "images", "actions", "texts")
+
+
+def addon_module(name):
+    return sys.modules[f"{ba_batch_worker.ADDON_MODULE}.{name}"]
+
+
+def reset_scene():
+    for name in RESET_COLLECTIONS:
+        collection = getattr(bpy.data, name)
+        if len(collection):
+            bpy.data.batch_remove(list(collection))
+
+
+def handler_name(ch_materials, mat):
+    for suffix, handler in ch_materials.CHARACTER_MATERIAL_HANDLERS:
+        if mat.name.endswith(suffix):
+            return handler.__name__
+    return "unhandled"
+
+
+def run_case(vertex_count, args, texture_dir, timer):
+    rig_utils = addon_module("ba_rig_utils")
+    ba_utils = addon_module("ba_utils")
+    ch_materials = addon_module("ba_ch_materials")
+    outline = addon_module("ba_outline")
+    metarig_stage = addon_module("create_and_align_human_metarig")
+    migrate_stage = addon_module("migrate_body_to_rig_auto")
+
+    reset_scene()
+    start_counts = datablock_counts()
+
+    source = timer(
+        "generate_skeleton",
+        synthetic.create_source_armature,
+        rig_utils,
+        args.hair_chains,
+        args.skirt_chains,
+        args.chain_length,
+    )
+    mesh = timer("generate_mesh", synthetic.create_mesh, "CH0000_Body", vertex_count, args.slots)
+    timer("generate_weights", synthetic.bind_mesh, mesh, source, args.seed)
+    filenames = synthetic.create_textures(texture_dir)
+    images = ba_utils.load_texture_index(texture_dir, filenames)
+
+    ba_utils.preload_library(
+        node_groups=ch_materials.CHARACTER_NODE_GROUPS + outline.LIBRARY_NODE_GROUPS,
+        materials=outline.LIBRARY_MATERIALS,
+    )
+    templates = ba_utils.MaterialTemplates()
+    materials_before = datablock_counts()
+    for mat in [slot.material for slot in mesh.material_slots]:
+        stage = f"setup_character_material/{handler_name(ch_materials, mat)}"
+        timer(stage, ch_materials.setup_character_material, mat, images, templates)
+    templates.clear()
+    materials_after = datablock_counts()
+
+    timer("build_outline_vertex_group", outline.build_outline_vertex_group, mesh)
+    with rig_utils.object_context(mesh, [mesh]):
+        timer("add_ba_outline", outline.add_ba_outline, bpy.context)
+
+    timer("metarig_alignment", metarig_stage.run, source)
+
+    target = synthetic.create_def_target(source, migrate_stage.BODY_BONE_TO_DEF, rig_utils)
+    report = migrate_stage.new_report()
+    old_to_new_body = migrate_stage.build_body_mapping()
+    timer("copy_extra_bones_to_target", migrate_stage.copy_extra_bones_to_target, report, source, target, old_to_new_body)
+    valid_target_bones = {bone.name for bone in target.data.bones}
+    timer("migrate_vertex_groups", migrate_stage.migrate_vertex_groups, report, mesh, old_to_new_body, valid_target_bones)
+
+    return {
+        "vertices": len(mesh.data.vertices),
+        "polygons": len(mesh.data.polygons),
+        "material_slots": len(mesh.material_slots),
+        "source_bones": len(source.data.bones),
+        "datablocks_start": start_counts,
+        "datablocks_end": datablock_counts(),
+        # Around the whole loop, template clean-up included, so the gate sees
+        # datablocks the material stage leaves behind.
+        "material_datablocks": (materials_before, materials_after),
+        "stages": timer.results,
+    }
+
+
+def measure_case(vertex_count, args, texture_dir):
+    # Two runs from a clean scene: wall time and datablocks from a plain
+    # pass, peak memory and call counts from a traced one, so tracing
+    # overhead never reaches the wall-time gate.
+    case = run_case(vertex_count, args, texture_dir, StageTimer())
+    traced = run_case(vertex_count, args, texture_dir, StageTimer(instrument=True, count_calls=not args.no_call_counts))
+    stages = merge_instrumented(case["stages"], traced["stages"])
+
+    materials_before, materials_after = case.pop("material_datablocks")
+    material_stages = [entry for name, entry in stages.items() if name.startswith("setup_character_material/")]
+    stages["setup_character_material"] = {
+        "calls": sum(entry["calls"] for entry in material_stages),
+        "wall_time": sum(entry["wall_time"] for entry in material_stages),
+        "peak_python_bytes": max((entry["peak_python_bytes"] for entry in material_stages), default=0),
+        "datablocks_before": materials_before,
+        "datablocks_after": materials_after,
+    }
+    if not args.no_call_counts:
+        stages["setup_character_material"]["python_calls"] = sum(entry["python_calls"] for entry in material_stages)
+    return case
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark BA add-on stages on synthetic characters.")
+    parser.add_argument("--vertices", type=int, nargs="+", default=list(DEFAULT_VERTICES))
+    parser.add_argument("--slots", type=int, default=len(synthetic.MATERIAL_SUFFIXES))
+    parser.add_argument("--hair-chains", type=int, default=24)
+    parser.add_argument("--skirt-chains", type=int, default=12)
+    parser.add_argument("--chain-length", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-call-counts", action="store_true", help="Skip cProfile call counting")
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results.json"))
+    return parser.parse_args(argv)
+
+
+def main():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    args = parse_args(argv)
+
+    addon_utils.enable("rigify", default_set=True)
+    ba_batch_worker.load_addon()
+
+    texture_dir = os.path.join(tempfile.gettempdir(), "ba_benchmark_textures")
+    results = {
+        "blender": bpy.app.version_string,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "parameters": vars(args),
+        "cases": [],
+    }
+    for vertex_count in args.vertices:
+        print(f"[BA bench] {vertex_count} vertices")
+        results["cases"].append(measure_case(vertex_count, args, texture_dir))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+    print(f"[BA bench] Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
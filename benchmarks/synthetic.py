@@ -0,0 +1,207 @@
+import os
+
+import bpy
+import numpy as np
+
+
+BODY_HEIGHT = 1.6
+MATERIAL_SUFFIXES = (
+    "_Body",
+    "_Face",
+    "_Hair",
+    "_EyeMouth",
+    "_Eyebrow",
+    "_Body_Arms",
+    "_Hair_Alpha",
+    "_Alpha",
+    "_Frill",
+)
+TEXTURE_SUFFIXES = (
+    "Body",
+    "Body_Mask",
+    "Face",
+    "Face_Mask",
+    "Hair",
+    "Hair_Mask",
+    "Hair_Spec",
+    "EyeMouth",
+)
+TEXTURE_SIZE = 64
+
+
+def side_bones(side):
+    x = 1.0 if side == "L" else -1.0
+    prefix = f"Bip001 {side}"
+    bones = [
+        (f"{prefix} Clavicle", "Bip001 Spine1", (0.02 * x, 0.0, 1.28), (0.15 * x, 0.0, 1.28)),
+        (f"{prefix} UpperArm", f"{prefix} Clavicle", (0.15 * x, 0.0, 1.28), (0.42 * x, 0.0, 1.28)),
+        (f"{prefix} Forearm", f"{prefix} UpperArm", (0.42 * x, 0.0, 1.28), (0.66 * x, 0.0, 1.28)),
+        (f"{prefix} Hand", f"{prefix} Forearm", (0.66 * x, 0.0, 1.28), (0.74 * x, 0.0, 1.28)),
+        (f"{prefix} Thigh", "Bip001 Pelvis", (0.09 * x, 0.0, 0.9), (0.09 * x, 0.0, 0.5)),
+        (f"{prefix} Calf", f"{prefix} Thigh", (0.09 * x, 0.0, 0.5), (0.09 * x, 0.0, 0.1)),
+        (f"{prefix} Foot", f"{prefix} Calf", (0.09 * x, 0.0, 0.1), (0.09 * x, -0.1, 0.02)),
+        (f"{prefix} Toe0", f"{prefix} Foot", (0.09 * x, -0.1, 0.02), (0.09 * x, -0.16, 0.02)),
+    ]
+    for finger in range(5):
+        y = -0.04 + 0.02 * finger
+        parent = f"{prefix} Hand"
+        for segment, suffix in enumerate(("", "1", "2")):
+            name = f"{prefix} Finger{finger}{suffix}"
+            head = ((0.74 + 0.025 * segment) * x, y, 1.28)
+            tail = ((0.765 + 0.025 * segment) * x, y, 1.28)
+            bones.append((name, parent, head, tail))
+            parent = name
+    return bones
+
+
+def bip001_bones(hair_chains=0, skirt_chains=0, chain_length=4):
+    bones = [
+        ("Bip001 Pelvis", None, (0.0, 0.0, 0.9), (0.0, 0.0, 1.0)),
+        ("Bip001 Spine", "Bip001 Pelvis", (0.0, 0.0, 1.0), (0.0, 0.0, 1.15)),
+        ("Bip001 Spine1", "Bip001 Spine", (0.0, 0.0, 1.15), (0.0, 0.0, 1.3)),
+        ("Bip001 Neck", "Bip001 Spine1", (0.0, 0.0, 1.3), (0.0, 0.0, 1.4)),
+        ("Bip001 Head", "Bip001 Neck", (0.0, 0.0, 1.4), (0.0, 0.0, BODY_HEIGHT)),
+        ("Bone_Breast_L_01", "Bip001 Spine1", (0.07, -0.05, 1.2), (0.07, -0.12, 1.2)),
+        ("Bone_Breast_R_01", "Bip001 Spine1", (-0.07, -0.05, 1.2), (-0.07, -0.12, 1.2)),
+    ]
+    bones += side_bones("L") + side_bones("R")
+
+    for side, x in (("L", 1.0), ("R", -1.0)):
+        bones += [
+            (f"Bip001_B_{side} UpperArm Twist", f"Bip001 {side} UpperArm", (0.25 * x, 0.0, 1.27), (0.3 * x, 0.0, 1.27)),
+            (f"Bone {side} ForeArm Twist", f"Bip001 {side} Forearm", (0.55 * x, 0.0, 1.27), (0.6 * x, 0.0, 1.27)),
+            (f"Bip001_B_{side} Thigh Twist", f"Bip001 {side} Thigh", (0.09 * x, 0.01, 0.75), (0.09 * x, 0.01, 0.7)),
+            (f"bone_Knee{side}", f"Bip001 {side} Calf", (0.09 * x, -0.03, 0.5), (0.09 * x, -0.06, 0.5)),
+        ]
+
+    bones += bone_chains("hair", hair_chains, chain_length, "Bip001 Head", 1.55, 0.12, -0.04)
+    bones += bone_chains("skirt", skirt_chains, chain_length, "Bip001 Pelvis", 0.95, 0.18, -0.08)
+    return bones
+
+
+def bone_chains(label, count, length, parent, top, radius, step):
+    bones = []
+    for chain in range(count):
+        angle = 2.0 * np.pi * chain / max(count, 1)
+        x, y = radius * np.cos(angle), radius * np.sin(angle)
+        chain_parent = parent
+        for index in range(length):
+            name = f"{label}_{chain:02d}_{index:02d}"
+            head = (x, y, top + step * index)
+            tail = (x, y, top + step * (index + 1))
+            bones.append((name, chain_parent, head, tail))
+            chain_parent = name
+    return bones
+
+
+def create_armature(name, bones, context_tools):
+    data = bpy.data.armatures.new(name)
+    obj = bpy.data.objects.new(name, data)
+    bpy.context.scene.collection.objects.link(obj)
+
+    context_tools.set_mode(obj, "EDIT")
+    edit_bones = data.edit_bones
+    for bone_name, parent, head, tail in bones:
+        bone = edit_bones.new(bone_name)
+        bone.head = head
+        bone.tail = tail
+        if parent:
+            bone.parent = edit_bones[parent]
+    context_tools.set_mode(obj, "OBJECT")
+    return obj
+
+
+def create_source_armature(context_tools, hair_chains=0, skirt_chains=0, chain_length=4):
+    return create_armature("Bip001", bip001_bones(hair_chains, skirt_chains, chain_length), context_tools)
+
+
+def create_def_target(source, body_map, context_tools):
+    # Stand-in for a generated Rigify rig: one DEF bone per mapped body bone.
+    bones = []
+    for bone in source.data.bones:
+        target_name = body_map.get(bone.name)
+        if target_name is None:
+            continue
+        parent = body_map.get(bone.parent.name) if bone.parent else None
+        bones.append((target_name, parent, tuple(bone.head_local), tuple(bone.tail_local)))
+    return create_armature("rig", bones, context_tools)
+
+
+def grid_mesh_data(vertex_count):
+    cols = max(2, int(np.sqrt(vertex_count)))
+    rows = max(2, vertex_count // cols)
+    xs = np.linspace(-0.5, 0.5, cols)
+    zs = np.linspace(0.0, BODY_HEIGHT, rows)
+    grid_x, grid_z = np.meshgrid(xs, zs)
+    coords = np.zeros((rows * cols, 3), dtype=np.float32)
+    coords[:, 0] = grid_x.ravel()
+    coords[:, 2] = grid_z.ravel()
+
+    corner = (np.arange(rows - 1)[:, None] * cols + np.arange(cols - 1)[None, :]).ravel()
+    quads = np.stack((corner, corner + 1, corner + cols + 1, corner + cols), axis=1)
+    return coords, quads.astype(np.int32)
+
+
+def create_mesh(name, vertex_count, material_count, prefix="CH0000"):
+    coords, quads = grid_mesh_data(vertex_count)
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(coords))
+    mesh.vertices.foreach_set("co", coords.ravel())
+    mesh.loops.add(quads.size)
+    mesh.loops.foreach_set("vertex_index", quads.ravel())
+    mesh.polygons.add(len(quads))
+    mesh.polygons.foreach_set("loop_start", np.arange(0, quads.size, 4, dtype=np.int32))
+
+    material_count = max(1, material_count)
+    for slot in range(material_count):
+        suffix = MATERIAL_SUFFIXES[slot % len(MATERIAL_SUFFIXES)]
+        variant = "" if slot < len(MATERIAL_SUFFIXES) else f"{slot // len(MATERIAL_SUFFIXES)}"
+        mat = bpy.data.materials.new(f"{prefix}{variant}{suffix}")
+        mat.use_nodes = True
+        mesh.materials.append(mat)
+    bands = (np.arange(len(quads)) * material_count // max(len(quads), 1)).astype(np.int32)
+    mesh.polygons.foreach_set("material_index", bands)
+
+    mesh.update(calc_edges=True)
+    obj = bpy.data.objects.new(name, mesh)
+    bpy.context.scene.collection.objects.link(obj)
+    return obj
+
+
+def bind_mesh(obj, armature, seed=0):
+    # Two influences per vertex over every armature bone, in bulk per group.
+    rng = np.random.default_rng(seed)
+    names = [bone.name for bone in armature.data.bones]
+    count = len(obj.data.vertices)
+    primary = rng.integers(0, len(names), count)
+    secondary = (primary + 1) % len(names)
+    weight = rng.uniform(0.5, 1.0, count).round(2)
+
+    for index, name in enumerate(names):
+        group = obj.vertex_groups.new(name=name)
+        for owner, weights in ((primary, weight), (secondary, 1.0 - weight)):
+            rows = np.flatnonzero(owner == index)
+            for value in np.unique(weights[rows]):
+                group.add(rows[weights[rows] == value].tolist(), float(value), 'REPLACE')
+
+    modifier = obj.modifiers.new(name=armature.name, type="ARMATURE")
+    modifier.object = armature
+    obj.parent = armature
+
+
+def create_textures(directory, prefix="CH0000", size=TEXTURE_SIZE):
+    os.makedirs(directory, exist_ok=True)
+    filenames = []
+    pixels = np.ones(size * size * 4, dtype=np.float32)
+    for suffix in TEXTURE_SUFFIXES:
+        filename = f"{prefix}_{suffix}.png"
+        path = os.path.join(directory, filename)
+        if not os.path.isfile(path):
+            image = bpy.data.images.new(filename, size, size, alpha=True)
+            image.pixels.foreach_set(pixels)
+            image.filepath_raw = path
+            image.file_format = 'PNG'
+            image.save()
+            bpy.data.images.remove(image)
+        filenames.append(filename)
+    return filenames
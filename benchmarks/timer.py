@@ -0,0 +1,92 @@
+import cProfile
+import pstats
+import time
+import tracemalloc
+
+import bpy
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+DATABLOCK_COLLECTIONS = (
+    "objects",
+    "meshes",
+    "armatures",
+    "materials",
+    "node_groups",
+    "images",
+    "collections",
+    "texts",
+)
+
+
+def datablock_counts():
+    return {name: len(getattr(bpy.data, name)) for name in DATABLOCK_COLLECTIONS}
+
+
+def max_rss_kb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class StageTimer:
+    # Wall time and bpy.data counts per stage. With instrument=True it records
+    # Python peak allocation (tracemalloc) and, with count_calls, the stage's
+    # Python function-call count instead, which is deterministic and catches
+    # O(n^2) loops that wall time on a noisy machine can hide. Tracing slows
+    # Python in proportion to its call count, so an instrumented pass keeps no
+    # wall time; take it from a separate plain pass (merge_instrumented).
+    # tracemalloc only sees Python allocations; max_rss_kb is the whole
+    # process high-water mark so far.
+    def __init__(self, instrument=False, count_calls=True):
+        self.instrument = instrument
+        self.count_calls = count_calls
+        self.results = {}
+
+    def __call__(self, name, func, *args, **kwargs):
+        if self.instrument:
+            return self.run_instrumented(name, func, *args, **kwargs)
+
+        before = datablock_counts()
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+
+        entry = self.results.setdefault(name, {"calls": 0, "wall_time": 0.0})
+        entry["calls"] += 1
+        entry["wall_time"] += elapsed
+        entry.setdefault("datablocks_before", before)
+        entry["datablocks_after"] = datablock_counts()
+        entry["max_rss_kb"] = max_rss_kb()
+        return result
+
+    def run_instrumented(self, name, func, *args, **kwargs):
+        profile = cProfile.Profile() if self.count_calls else None
+        tracemalloc.start()
+        if profile is not None:
+            profile.enable()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            if profile is not None:
+                profile.disable()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        entry = self.results.setdefault(name, {"peak_python_bytes": 0})
+        entry["peak_python_bytes"] = max(entry["peak_python_bytes"], peak)
+        if profile is not None:
+            entry["python_calls"] = entry.get("python_calls", 0) + pstats.Stats(profile).total_calls
+        return result
+
+
+def merge_instrumented(stages, instrumented):
+    for name, entry in stages.items():
+        entry.update(instrumented.get(name, {}))
+    return stages
@@ -1,11 +1,16 @@
+import time
+from dataclasses import dataclass
+
 import bpy
-from mathutils import Vector
+from mathutils import Matrix, Vector
+
+from .ba_rig_utils import StageReport, set_mode
 
 # Create a fresh Rigify Human metarig, remove face bones, then align it to the
-# source character skeleton. This script is intended to be run inside Blender.
+# source character skeleton.
 #
-# Select the source armature, then run this script. It creates a fresh Rigify
-# Human metarig and aligns it to the selected source.
+# run(source) creates a fresh Rigify Human metarig, aligns it to the given
+# source armature and returns the metarig together with a StageReport.
 #
 # Updated spine policy:
 # - Keep the standard Human spine chain, including spine.001 and spine.002.
@@ -28,22 +33,26 @@ WORLD_Z = Vector((0.0, 0.0, 1.0))
 WORLD_X = Vector((1.0, 0.0, 0.0))
 WORLD_NEG_Y = Vector((0.0, -1.0, 0.0))
 
-report = {
-    "created": [],
-    "deleted": [],
-    "aligned": [],
-    "derived": [],
-    "missing_source": [],
-    "missing_target": [],
-    "warnings": [],
-}
+REPORT_KEYS = ("created", "deleted", "aligned", "derived", "missing_source", "missing_target", "warnings")
+
+
+@dataclass
+class MetarigOptions:
+    output_name_suffix: str = OUTPUT_NAME_SUFFIX
+    backup_existing_output: bool = BACKUP_EXISTING_OUTPUT
+    initial_scale: float = INITIAL_METARIG_SCALE
+    remove_face: bool = REMOVE_FACE
+    remove_missing_optional_fingers: bool = REMOVE_MISSING_OPTIONAL_FINGERS
 
 
-def resolve_source_armature():
-    selected = [obj for obj in bpy.context.selected_objects if obj.type == "ARMATURE"]
+def new_report():
+    return StageReport("Create and align Human metarig", REPORT_KEYS, quiet_keys=("aligned",))
+
+
+def resolve_source_armature(objects):
+    selected = [obj for obj in objects if obj.type == "ARMATURE"]
     if len(selected) != 1:
         raise RuntimeError(f"Select exactly one source armature before running. Got {len(selected)} armatures.")
-    report["created"].append(f"Using selected source armature: {selected[0].name}")
     return selected[0]
 
 
@@ -56,15 +65,15 @@ def unique_name(base):
     return f"{base}.{index:03d}"
 
 
-def output_name_for_source(source):
-    return f"{source.name}{OUTPUT_NAME_SUFFIX}"
+def output_name_for_source(source, suffix=OUTPUT_NAME_SUFFIX):
+    return f"{source.name}{suffix}"
 
 
-def archive_existing_output(output_name):
+def archive_existing_output(report, output_name, backup=BACKUP_EXISTING_OUTPUT):
     obj = bpy.data.objects.get(output_name)
     if obj is None:
         return
-    if not BACKUP_EXISTING_OUTPUT:
+    if not backup:
         bpy.data.objects.remove(obj, do_unlink=True)
         report["deleted"].append(f"Removed existing {output_name}")
         return
@@ -76,50 +85,43 @@ def archive_existing_output(output_name):
     report["created"].append(f"Archived existing output as hidden {new_name}")
 
 
-def create_human_metarig(source):
-    output_name = output_name_for_source(source)
-    archive_existing_output(output_name)
-    bpy.ops.object.mode_set(mode="OBJECT")
-    bpy.ops.object.select_all(action="DESELECT")
+def create_human_metarig(report, source, options):
+    output_name = output_name_for_source(source, options.output_name_suffix)
+    archive_existing_output(report, output_name, options.backup_existing_output)
+    set_mode(bpy.context.view_layer.objects.active, "OBJECT")
     before = set(bpy.data.objects)
     bpy.ops.object.armature_human_metarig_add()
     after = set(bpy.data.objects)
     new_objects = [obj for obj in after - before if obj.type == "ARMATURE"]
-    obj = bpy.context.object if bpy.context.object and bpy.context.object.type == "ARMATURE" else None
-    if obj is None and new_objects:
-        obj = new_objects[0]
+    obj = new_objects[0] if new_objects else None
     if obj is None:
         raise RuntimeError("Rigify human metarig operator did not create an armature")
     obj.name = output_name
     obj.data.name = output_name
-    obj.scale = (INITIAL_METARIG_SCALE, INITIAL_METARIG_SCALE, INITIAL_METARIG_SCALE)
-    bpy.context.view_layer.update()
-    bpy.ops.object.select_all(action="DESELECT")
-    obj.select_set(True)
-    bpy.context.view_layer.objects.active = obj
-    bpy.ops.object.transform_apply(location=False, rotation=False, scale=True)
-    bpy.context.view_layer.update()
+    # Scaling the bone data directly is what transform_apply(scale=True) does,
+    # without needing the object selected and active.
+    obj.data.transform(Matrix.Scale(options.initial_scale, 4))
     report["created"].append(f"Created {output_name} from Rigify Human metarig")
-    report["derived"].append(f"Scaled {output_name} uniformly to {INITIAL_METARIG_SCALE} and applied scale")
+    report["derived"].append(f"Scaled {output_name} uniformly to {options.initial_scale} and applied scale")
     return obj
 
 
-def src_bone(source, name):
+def src_bone(report, source, name):
     bone = source.data.bones.get(name)
     if bone is None:
         report["missing_source"].append(name)
     return bone
 
 
-def src_head(source, name):
-    bone = src_bone(source, name)
+def src_head(report, source, name):
+    bone = src_bone(report, source, name)
     if bone is None:
         return None
     return source.matrix_world @ bone.head_local
 
 
-def src_tail(source, name):
-    bone = src_bone(source, name)
+def src_tail(report, source, name):
+    bone = src_bone(report, source, name)
     if bone is None:
         return None
     return source.matrix_world @ bone.tail_local
@@ -197,7 +199,7 @@ def source_character_height(source):
     return max(p.z for p in points) - min(p.z for p in points)
 
 
-def set_edit_bone(edit_bones, target, name, head_world, tail_world, fallback_dir=WORLD_Z):
+def set_edit_bone(report, edit_bones, target, name, head_world, tail_world, fallback_dir=WORLD_Z):
     eb = edit_bones.get(name)
     if eb is None:
         report["missing_target"].append(name)
@@ -212,19 +214,19 @@ def set_edit_bone(edit_bones, target, name, head_world, tail_world, fallback_dir
     return True
 
 
-def set_edit_bone_by_direction(edit_bones, target, original_points, name, head_world, direction_world=None, length=None):
+def set_edit_bone_by_direction(report, edit_bones, target, original_points, name, head_world, direction_world=None, length=None):
     original = original_points.get(name, {})
     direction = direction_world if direction_world is not None else original.get("direction", WORLD_Z)
     direction = normalized_or(direction, WORLD_Z)
     bone_len = length if length is not None else original.get("length", MIN_BONE_LENGTH)
     tail_world = head_world + direction * max(bone_len, MIN_BONE_LENGTH) if head_world is not None else None
-    return set_edit_bone(edit_bones, target, name, head_world, tail_world, direction)
+    return set_edit_bone(report, edit_bones, target, name, head_world, tail_world, direction)
 
 
-def align_chain(edit_bones, target, entries):
+def align_chain(report, edit_bones, target, entries):
     for name, head, tail in entries:
         direction = (tail - head) if head is not None and tail is not None else WORLD_Z
-        set_edit_bone(edit_bones, target, name, head, tail, direction)
+        set_edit_bone(report, edit_bones, target, name, head, tail, direction)
 
 
 def chain_direction_from_points(points, fallback):
@@ -234,9 +236,7 @@ def chain_direction_from_points(points, fallback):
     return normalized_or(fallback, WORLD_Z)
 
 
-def delete_face_bones(edit_bones):
-    if not REMOVE_FACE:
-        return
+def delete_face_bones(report, edit_bones):
     roots = [edit_bones.get("face")]
     face_roots = [bone for bone in roots if bone is not None]
     if not face_roots:
@@ -260,7 +260,7 @@ def delete_face_bones(edit_bones):
             report["deleted"].append(name)
 
 
-def remove_bone_subtree(edit_bones, root_name, reason):
+def remove_bone_subtree(report, edit_bones, root_name, reason):
     root = edit_bones.get(root_name)
     if root is None:
         return
@@ -279,9 +279,7 @@ def remove_bone_subtree(edit_bones, root_name, reason):
             report["deleted"].append(f"{name} ({reason})")
 
 
-def delete_missing_optional_fingers(source, edit_bones):
-    if not REMOVE_MISSING_OPTIONAL_FINGERS:
-        return
+def delete_missing_optional_fingers(report, source, edit_bones):
     optional = [
         ("L", "ring", "Bip001 L Finger3", "f_ring.01.L", "palm.03.L"),
         ("L", "pinky", "Bip001 L Finger4", "f_pinky.01.L", "palm.04.L"),
@@ -292,16 +290,16 @@ def delete_missing_optional_fingers(source, edit_bones):
         if source.data.bones.get(source_root) is not None:
             continue
         reason = f"missing source {side} {label} finger"
-        remove_bone_subtree(edit_bones, finger_root, reason)
-        remove_bone_subtree(edit_bones, palm_root, reason)
+        remove_bone_subtree(report, edit_bones, finger_root, reason)
+        remove_bone_subtree(report, edit_bones, palm_root, reason)
 
 
-def align_spine(source, target, edit_bones, original_points):
-    pelvis_h = src_head(source, "Bip001 Pelvis")
-    lower_h = src_head(source, "Bip001 Spine")
-    chest_h = src_head(source, "Bip001 Spine1")
-    neck_h = src_head(source, "Bip001 Neck")
-    head_h = src_head(source, "Bip001 Head")
+def align_spine(report, source, target, edit_bones, original_points):
+    pelvis_h = src_head(report, source, "Bip001 Pelvis")
+    lower_h = src_head(report, source, "Bip001 Spine")
+    chest_h = src_head(report, source, "Bip001 Spine1")
+    neck_h = src_head(report, source, "Bip001 Neck")
+    head_h = src_head(report, source, "Bip001 Head")
     neck_mid = midpoint(neck_h, head_h)
 
     height = source_character_height(source)
@@ -312,7 +310,7 @@ def align_spine(source, target, edit_bones, original_points):
     head_len = HEAD_BONE_LENGTH
     head_tail = head_h + WORLD_Z * head_len if head_h is not None else None
 
-    align_chain(edit_bones, target, [
+    align_chain(report, edit_bones, target, [
         ("spine", pelvis_h, lower_h),
         ("spine.001", lower_h, micro_tail),
         ("spine.002", micro_tail, chest_h),
@@ -324,7 +322,7 @@ def align_spine(source, target, edit_bones, original_points):
     report["derived"].append(f"spine.001 kept as micro transition bone length={micro_len:.5f}")
 
 
-def align_finger_chain(edit_bones, target, original_points, side, rig_prefix, first_head, second_head, second_tail):
+def align_finger_chain(report, edit_bones, target, original_points, side, rig_prefix, first_head, second_head, second_tail):
     suffix = ".L" if side == "L" else ".R"
     b1 = f"{rig_prefix}.01{suffix}"
     b2 = f"{rig_prefix}.02{suffix}"
@@ -347,23 +345,23 @@ def align_finger_chain(edit_bones, target, original_points, side, rig_prefix, fi
         len2 = max((second_tail - second_head).length, len2)
     h3 = h2 + axis * len2
 
-    set_edit_bone(edit_bones, target, b1, h1, h2, axis)
-    set_edit_bone(edit_bones, target, b2, h2, h3, axis)
-    set_edit_bone(edit_bones, target, b3, h3, h3 + axis * len3, axis)
+    set_edit_bone(report, edit_bones, target, b1, h1, h2, axis)
+    set_edit_bone(report, edit_bones, target, b2, h2, h3, axis)
+    set_edit_bone(report, edit_bones, target, b3, h3, h3 + axis * len3, axis)
     report["derived"].append(f"{b1}/{b2}/{b3} use joint axis, not source short-bone tail")
 
 
-def align_toe(edit_bones, target, original_points, side, toe_head, foot_head):
+def align_toe(report, edit_bones, target, original_points, side, toe_head, foot_head):
     suffix = ".L" if side == "L" else ".R"
     name = f"toe{suffix}"
     fallback_dir = original_points.get(name, {}).get("direction", WORLD_NEG_Y)
     axis = horizontal_direction((toe_head - foot_head) if toe_head is not None and foot_head is not None else None, fallback_dir)
     length = original_points.get(name, {}).get("length", 0.026)
-    set_edit_bone(edit_bones, target, name, toe_head, toe_head + axis * length, axis)
+    set_edit_bone(report, edit_bones, target, name, toe_head, toe_head + axis * length, axis)
     report["derived"].append(f"{name} derived from horizontal foot-to-toe axis")
 
 
-def derive_heel(source, target, edit_bones, side, foot_name, toe_name):
+def derive_heel(report, source, target, edit_bones, side, foot_name, toe_name):
     suffix = ".L" if side == "L" else ".R"
     name = f"heel.02{suffix}"
     eb = edit_bones.get(name)
@@ -371,9 +369,9 @@ def derive_heel(source, target, edit_bones, side, foot_name, toe_name):
         report["missing_target"].append(name)
         return
 
-    foot_head = src_head(source, foot_name)
-    toe_head = src_head(source, toe_name)
-    toe_tail = src_tail(source, toe_name)
+    foot_head = src_head(report, source, foot_name)
+    toe_head = src_head(report, source, toe_name)
+    toe_tail = src_tail(report, source, toe_name)
     if foot_head is None or toe_head is None:
         report["warnings"].append(f"Skipped {name}: missing foot/toe source")
         return
@@ -386,11 +384,11 @@ def derive_heel(source, target, edit_bones, side, foot_name, toe_name):
     side_dir = WORLD_X if side == "L" else -WORLD_X
     head = center - side_dir * half_len
     tail = center + side_dir * half_len
-    set_edit_bone(edit_bones, target, name, head, tail, side_dir)
+    set_edit_bone(report, edit_bones, target, name, head, tail, side_dir)
     report["derived"].append(f"{name} derived from foot/toe contact")
 
 
-def align_side(source, target, edit_bones, original_points, side):
+def align_side(report, source, target, edit_bones, original_points, side):
     src_side = "L" if side == "L" else "R"
     suffix = ".L" if side == "L" else ".R"
 
@@ -403,16 +401,16 @@ def align_side(source, target, edit_bones, original_points, side):
     finger3 = f"Bip001 {src_side} Finger3"
 
     hand_tail = average([
-        src_head(source, finger1),
-        src_head(source, finger2),
-        src_head(source, finger3),
+        src_head(report, source, finger1),
+        src_head(report, source, finger2),
+        src_head(report, source, finger3),
     ])
 
-    align_chain(edit_bones, target, [
-        (f"shoulder{suffix}", src_head(source, clav), src_head(source, upper)),
-        (f"upper_arm{suffix}", src_head(source, upper), src_head(source, fore)),
-        (f"forearm{suffix}", src_head(source, fore), src_head(source, hand)),
-        (f"hand{suffix}", src_head(source, hand), hand_tail),
+    align_chain(report, edit_bones, target, [
+        (f"shoulder{suffix}", src_head(report, source, clav), src_head(report, source, upper)),
+        (f"upper_arm{suffix}", src_head(report, source, upper), src_head(report, source, fore)),
+        (f"forearm{suffix}", src_head(report, source, fore), src_head(report, source, hand)),
+        (f"hand{suffix}", src_head(report, source, hand), hand_tail),
     ])
 
     thigh = f"Bip001 {src_side} Thigh"
@@ -420,24 +418,24 @@ def align_side(source, target, edit_bones, original_points, side):
     foot = f"Bip001 {src_side} Foot"
     toe = f"Bip001 {src_side} Toe0"
 
-    align_chain(edit_bones, target, [
-        (f"thigh{suffix}", src_head(source, thigh), src_head(source, calf)),
-        (f"shin{suffix}", src_head(source, calf), src_head(source, foot)),
-        (f"foot{suffix}", src_head(source, foot), src_head(source, toe)),
+    align_chain(report, edit_bones, target, [
+        (f"thigh{suffix}", src_head(report, source, thigh), src_head(report, source, calf)),
+        (f"shin{suffix}", src_head(report, source, calf), src_head(report, source, foot)),
+        (f"foot{suffix}", src_head(report, source, foot), src_head(report, source, toe)),
     ])
-    align_toe(edit_bones, target, original_points, side, src_head(source, toe), src_head(source, foot))
-    derive_heel(source, target, edit_bones, side, foot, toe)
+    align_toe(report, edit_bones, target, original_points, side, src_head(report, source, toe), src_head(report, source, foot))
+    derive_heel(report, source, target, edit_bones, side, foot, toe)
 
-    pelvis_head = src_head(source, "Bip001 Pelvis")
-    thigh_head = src_head(source, thigh)
-    set_edit_bone(edit_bones, target, f"pelvis{suffix}", pelvis_head, thigh_head, WORLD_Z)
+    pelvis_head = src_head(report, source, "Bip001 Pelvis")
+    thigh_head = src_head(report, source, thigh)
+    set_edit_bone(report, edit_bones, target, f"pelvis{suffix}", pelvis_head, thigh_head, WORLD_Z)
 
-    hand_head = src_head(source, hand)
+    hand_head = src_head(report, source, hand)
     palm_sources = {
-        "palm.01": src_head(source, finger1),
-        "palm.02": src_head(source, finger2),
-        "palm.03": src_head(source, finger3),
-        "palm.04": src_head(source, f"Bip001 {src_side} Finger4"),
+        "palm.01": src_head(report, source, finger1),
+        "palm.02": src_head(report, source, finger2),
+        "palm.03": src_head(report, source, finger3),
+        "palm.04": src_head(report, source, f"Bip001 {src_side} Finger4"),
     }
     old_hand_head = original_points.get(f"hand{suffix}", {}).get("head")
     for palm_name, finger_root in palm_sources.items():
@@ -450,7 +448,7 @@ def align_side(source, target, edit_bones, original_points, side):
             head = (hand_head + offset).lerp(finger_root, 0.35)
         else:
             head = finger_root or hand_head
-        set_edit_bone_by_direction(edit_bones, target, original_points, name, head)
+        set_edit_bone_by_direction(report, edit_bones, target, original_points, name, head)
         report["derived"].append(f"{name} keeps metarig palm direction")
 
     finger_specs = {
@@ -466,18 +464,19 @@ def align_side(source, target, edit_bones, original_points, side):
         if edit_bones.get(f"{rig_prefix}.01{suffix}") is None:
             continue
         align_finger_chain(
+            report,
             edit_bones,
             target,
             original_points,
             side,
             rig_prefix,
-            src_head(source, first),
-            src_head(source, second),
-            src_tail(source, second),
+            src_head(report, source, first),
+            src_head(report, source, second),
+            src_tail(report, source, second),
         )
 
 
-def align_breast_optional(source, target, edit_bones, original_points):
+def align_breast_optional(report, source, target, edit_bones, original_points):
     optional = [
         ("breast.L", "Bone_Breast_L_01"),
         ("breast.R", "Bone_Breast_R_01"),
@@ -485,65 +484,52 @@ def align_breast_optional(source, target, edit_bones, original_points):
     for target_name, source_name in optional:
         if source.data.bones.get(source_name):
             set_edit_bone_by_direction(
+                report,
                 edit_bones,
                 target,
                 original_points,
                 target_name,
-                src_head(source, source_name),
+                src_head(report, source, source_name),
             )
             report["derived"].append(f"{target_name} keeps metarig breast direction")
         else:
             report["warnings"].append(f"Optional source missing: {source_name}")
 
 
-def align_metarig(source, target):
+def align_metarig(report, source, target, options):
     original_points = original_world_bone_points(target)
-    bpy.ops.object.mode_set(mode="OBJECT")
-    bpy.ops.object.select_all(action="DESELECT")
-    target.select_set(True)
-    bpy.context.view_layer.objects.active = target
-    bpy.ops.object.mode_set(mode="EDIT")
+    set_mode(target, "EDIT")
 
     edit_bones = target.data.edit_bones
-    delete_face_bones(edit_bones)
-    delete_missing_optional_fingers(source, edit_bones)
-    align_spine(source, target, edit_bones, original_points)
-    align_breast_optional(source, target, edit_bones, original_points)
-    align_side(source, target, edit_bones, original_points, "L")
-    align_side(source, target, edit_bones, original_points, "R")
-
-    bpy.ops.object.mode_set(mode="OBJECT")
-
-
-def dedupe_report():
-    for key in ("created", "deleted", "aligned", "derived", "missing_source", "missing_target", "warnings"):
-        seen = set()
-        unique = []
-        for item in report[key]:
-            if item not in seen:
-                unique.append(item)
-                seen.add(item)
-        report[key] = unique
-
-
-def print_report():
-    dedupe_report()
-    print("\n=== Create and align Human metarig report ===")
-    for key in ("created", "deleted", "aligned", "derived", "missing_source", "missing_target", "warnings"):
-        values = report[key]
-        print(f"{key}: {len(values)}")
-        if key != "aligned":
-            for value in values:
-                print(f"  - {value}")
-    print("=== End report ===\n")
-
-
-def main():
-    source = resolve_source_armature()
-    target = create_human_metarig(source)
-    align_metarig(source, target)
-    print_report()
-    return report
-
-
-main()
+    if options.remove_face:
+        delete_face_bones(report, edit_bones)
+    if options.remove_missing_optional_fingers:
+        delete_missing_optional_fingers(report, source, edit_bones)
+    align_spine(report, source, target, edit_bones, original_points)
+    align_breast_optional(report, source, target, edit_bones, original_points)
+    align_side(report, source, target, edit_bones, original_points, "L")
+    align_side(report, source, target, edit_bones, original_points, "R")
+
+    set_mode(target, "OBJECT")
+
+
+def run(source, options=None):
+    options = options or MetarigOptions()
+    report = new_report()
+    start = time.perf_counter()
+
+    report["created"].append(f"Using source armature: {source.name}")
+    target = create_human_metarig(report, source, options)
+    align_metarig(report, source, target, options)
+
+    report.elapsed = time.perf_counter() - start
+    report.dedupe()
+    return target, report
+
+
+def main(context=None):
+    context = context or bpy.context
+    source = resolve_source_armature(context.selected_objects)
+    target, report = run(source)
+    report.print()
+    return target, report
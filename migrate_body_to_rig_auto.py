@@ -1,38 +1,16 @@
-import bpy
-import importlib.util
-from pathlib import Path
-from mathutils import Matrix
-
-def load_ba_shader_controls_module():
-    try:
-        from . import ba_shader_controls
-        return ba_shader_controls, None
-    except Exception as package_error:
-        module_path = Path(__file__).resolve().parent / "ba_shader_controls.py"
-        try:
-            spec = importlib.util.spec_from_file_location("ba_shader_controls", module_path)
-            if spec is None or spec.loader is None:
-                return None, f"Could not create import spec for {module_path}"
-            module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(module)
-            return module, None
-        except Exception as file_error:
-            return None, f"package import failed: {package_error}; file import failed: {file_error}"
-
-
-ba_shader_controls, BA_SHADER_CONTROLS_LOAD_ERROR = load_ba_shader_controls_module()
-
-IGNORED_RIG_NAME_TOKENS = ("mouthre",)
+import time
+from dataclasses import dataclass
 
+import bpy
+import numpy as np
+from mathutils import Matrix, Vector
 
-def is_ignored_rig(obj):
-    if obj is None or obj.type != "ARMATURE":
-        return False
-    lowered = obj.name.lower()
-    return any(token in lowered for token in IGNORED_RIG_NAME_TOKENS)
+from . import ba_shader_controls
+from .ba_rig_utils import StageReport, is_ignored_rig, object_context, set_mode
+from .ba_utils import span
 
-# Migrate the selected body mesh from the selected original armature to the
-# selected generated Rigify armature.
+# Migrate the body mesh from the original armature to the generated Rigify
+# armature: run(source, target, meshes) returns a StageReport.
 #
 # Policy:
 # - Body/control weights are renamed or merged into target DEF-* groups on the
@@ -51,6 +29,9 @@ def is_ignored_rig(obj):
 REMOVE_OLD_ARMATURE_MODIFIERS = False
 PARENT_BODY_TO_TARGET_ARMATURE = True
 NORMALIZE_AFTER_MIGRATION = False
+MAX_DEFORM_INFLUENCES = 0  # 0 keeps every influence; 4 matches typical game rigs.
+PRUNE_WEIGHT_THRESHOLD = 0.0
+NORMALIZED_WEIGHT_DECIMALS = 4  # Rounding keeps the number of bulk add calls small.
 CREATE_BACKUP_VERTEX_GROUPS = False
 BODY_MESH_SCORE_TIE_MARGIN = 0
 
@@ -120,20 +101,42 @@ BODY_HELPER_TO_BODY = {
     "bone_KneeR": "Bip001 R Calf",
 }
 
-report = {
-    "copied_extra_bones": [],
-    "skipped_body_bones": [],
-    "renamed_groups": [],
-    "merged_groups": [],
-    "kept_groups": [],
-    "deleted_groups": [],
-    "missing_target_bones": [],
-    "missing_source_bones": [],
-    "modifiers": [],
-    "parenting": [],
-    "skipped_unbound_meshes": [],
-    "warnings": [],
-}
+BODY_GROUP_NAMES = frozenset(BODY_BONE_TO_DEF) | frozenset(BODY_BONE_TO_DEF.values()) | frozenset(BODY_HELPER_TO_BODY)
+
+REPORT_KEYS = (
+    "copied_extra_bones",
+    "skipped_body_bones",
+    "renamed_groups",
+    "merged_groups",
+    "kept_groups",
+    "deleted_groups",
+    "missing_target_bones",
+    "missing_source_bones",
+    "modifiers",
+    "parenting",
+    "skipped_unbound_meshes",
+    "warnings",
+)
+PRINTED_REPORT_KEYS = tuple(key for key in REPORT_KEYS if key != "renamed_groups")
+
+
+@dataclass
+class MigrateOptions:
+    remove_old_armature_modifiers: bool = REMOVE_OLD_ARMATURE_MODIFIERS
+    parent_body_to_target_armature: bool = PARENT_BODY_TO_TARGET_ARMATURE
+    normalize_after_migration: bool = NORMALIZE_AFTER_MIGRATION
+    max_deform_influences: int = MAX_DEFORM_INFLUENCES
+    prune_weight_threshold: float = PRUNE_WEIGHT_THRESHOLD
+    create_backup_vertex_groups: bool = CREATE_BACKUP_VERTEX_GROUPS
+    body_mesh_score_tie_margin: int = BODY_MESH_SCORE_TIE_MARGIN
+
+
+def new_report():
+    return StageReport(
+        "Migrate selected body to selected Rigify rig",
+        REPORT_KEYS,
+        quiet_keys=("kept_groups", "skipped_body_bones"),
+    )
 
 
 def has_source_armature_modifier(mesh, source):
@@ -147,20 +150,15 @@ def has_any_armature_modifier_from(mesh, armatures):
     )
 
 
-def body_group_names():
-    return set(BODY_BONE_TO_DEF) | set(BODY_BONE_TO_DEF.values()) | set(BODY_HELPER_TO_BODY)
-
-
 def body_mesh_score(mesh):
     group_names = {group.name for group in mesh.vertex_groups}
-    body_groups = body_group_names()
-    score = len(group_names & body_groups)
+    score = len(group_names & BODY_GROUP_NAMES)
     if "Bip001" in group_names:
         score += 1
     return score
 
 
-def choose_body_mesh(meshes):
+def choose_body_mesh(meshes, tie_margin=BODY_MESH_SCORE_TIE_MARGIN):
     body_candidates = sorted(
         ((body_mesh_score(mesh), mesh.name, mesh) for mesh in meshes),
         key=lambda item: (-item[0], item[1]),
@@ -172,7 +170,7 @@ def choose_body_mesh(meshes):
     tied = [
         mesh.name
         for score, _, mesh in body_candidates[1:]
-        if best_score - score <= BODY_MESH_SCORE_TIE_MARGIN and score > 0
+        if best_score - score <= tie_margin and score > 0
     ]
     if tied:
         raise RuntimeError(
@@ -183,7 +181,7 @@ def choose_body_mesh(meshes):
     return body_mesh
 
 
-def classify_scene_objects(source, target, meshes):
+def classify_scene_objects(report, source, target, meshes, tie_margin=BODY_MESH_SCORE_TIE_MARGIN):
     if source is None or target is None or not meshes:
         return None
 
@@ -192,7 +190,7 @@ def classify_scene_objects(source, target, meshes):
         for mesh in meshes
         if has_source_armature_modifier(mesh, source) or mesh.parent == source
     ]
-    body_mesh = choose_body_mesh(bound_meshes) or choose_body_mesh(meshes)
+    body_mesh = choose_body_mesh(bound_meshes, tie_margin) or choose_body_mesh(meshes, tie_margin)
     if body_mesh is None:
         return None
 
@@ -220,17 +218,14 @@ def classify_scene_objects(source, target, meshes):
     return source, target, body_mesh, modifier_extra_meshes, parented_extra_meshes, unbound_meshes
 
 
-def resolve_scene_objects_from_context():
-    source = globals().get("BA_SOURCE_ARMATURE")
-    target = globals().get("BA_TARGET_ARMATURE")
-    meshes = globals().get("BA_SELECTED_MESHES")
-    if source is None or target is None or meshes is None:
-        return None
-
+def resolve_scene_objects(report, source, target, meshes, options):
     meshes = [mesh for mesh in meshes if mesh and mesh.name in bpy.data.objects and mesh.type == "MESH"]
-    result = classify_scene_objects(source, target, meshes)
+    result = classify_scene_objects(report, source, target, meshes, options.body_mesh_score_tie_margin)
     if result is None:
-        return None
+        raise RuntimeError(
+            "Could not resolve explicit Rigify migration context. "
+            "The selected body mesh may no longer contain recognizable old Bip001 or target DEF body vertex groups."
+        )
 
     source, target, body_mesh, modifier_extra_meshes, parented_extra_meshes, unbound_meshes = result
     report["warnings"].append(
@@ -242,8 +237,8 @@ def resolve_scene_objects_from_context():
     return result
 
 
-def resolve_scene_objects_from_selection():
-    selected = list(bpy.context.selected_objects)
+def resolve_armatures_from_selection(report, selected, options):
+    selected = list(selected)
     meshes = [obj for obj in selected if obj.type == "MESH"]
     armatures = [obj for obj in selected if obj.type == "ARMATURE" and not is_ignored_rig(obj)]
 
@@ -289,7 +284,9 @@ def resolve_scene_objects_from_selection():
             target = with_def[0]
             source = next(arm for arm in armatures if arm != target)
 
-    result = classify_scene_objects(source, target, meshes) if source is not None and target is not None else None
+    result = None
+    if source is not None and target is not None:
+        result = classify_scene_objects(report, source, target, meshes, options.body_mesh_score_tie_margin)
     if result is None:
         raise RuntimeError(
             "Could not infer source and target armatures from selection. "
@@ -308,18 +305,6 @@ def resolve_scene_objects_from_selection():
     return source, target, body_mesh, modifier_extra_meshes, parented_extra_meshes, unbound_meshes
 
 
-def resolve_scene_objects():
-    context_result = resolve_scene_objects_from_context()
-    if context_result is not None:
-        return context_result
-    if "BA_SOURCE_ARMATURE" in globals():
-        raise RuntimeError(
-            "Could not resolve explicit Rigify migration context. "
-            "The selected body mesh may no longer contain recognizable old Bip001 or target DEF body vertex groups."
-        )
-    return resolve_scene_objects_from_selection()
-
-
 def target_def_bones(target):
     return {bone.name for bone in target.data.bones if bone.name.startswith("DEF-")}
 
@@ -379,7 +364,7 @@ def classify_extra_bone_collection(bone_name):
     return "Other"
 
 
-def assign_copied_extra_bones_to_collections(target, copied_bone_names):
+def assign_copied_extra_bones_to_collections(report, target, copied_bone_names):
     if not hasattr(target.data, "collections"):
         report["warnings"].append("Target armature has no bone collections API; skipped extra bone collection assignment")
         return
@@ -396,38 +381,79 @@ def assign_copied_extra_bones_to_collections(target, copied_bone_names):
         report["parenting"].append(f"{bone_name} assigned to bone collection {collection_name}")
 
 
-def copy_extra_bones_to_target(source, target, old_to_new_body):
+class BoneSpecs:
+    # Rest-pose bone data in armature space, one row per bone.
+    def __init__(self, names, heads, tails, rolls, use_deform, inherit_scale, parents):
+        self.names = names
+        self.heads = heads
+        self.tails = tails
+        self.rolls = rolls
+        self.use_deform = use_deform
+        self.inherit_scale = inherit_scale
+        self.parents = parents
+
+    def __len__(self):
+        return len(self.names)
+
+
+def read_bone_specs(armature):
+    bones = armature.data.bones
+    count = len(bones)
+
+    heads = np.empty(count * 3, dtype=np.float32)
+    tails = np.empty(count * 3, dtype=np.float32)
+    matrices = np.empty(count * 16, dtype=np.float32)
+    use_deform = np.empty(count, dtype=bool)
+    bones.foreach_get("head_local", heads)
+    bones.foreach_get("tail_local", tails)
+    bones.foreach_get("matrix_local", matrices)
+    bones.foreach_get("use_deform", use_deform)
+    heads = heads.reshape(count, 3)
+    tails = tails.reshape(count, 3)
+    # foreach_get flattens matrices column by column.
+    rotations = matrices.reshape(count, 4, 4).transpose(0, 2, 1)[:, :3, :3]
+
+    # Roll is not stored on Bone; recover it from the rest matrix so the
+    # source armature never has to enter edit mode.
+    rolls = np.array(
+        [
+            bpy.types.Bone.AxisRollFromMatrix(Matrix(rotation.tolist()), axis=Vector(tail - head))[1]
+            for rotation, head, tail in zip(rotations, heads, tails)
+        ],
+        dtype=np.float32,
+    )
+
+    return BoneSpecs(
+        names=[bone.name for bone in bones],
+        heads=heads,
+        tails=tails,
+        rolls=rolls,
+        use_deform=use_deform,
+        inherit_scale=[bone.inherit_scale for bone in bones],
+        parents=[bone.parent.name if bone.parent else None for bone in bones],
+    )
+
+
+def transform_points(matrix, points):
+    matrix = np.array(matrix, dtype=np.float64)
+    return points @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def copy_extra_bones_to_target(report, source, target, old_to_new_body):
     old_active = bpy.context.view_layer.objects.active
     old_mode = old_active.mode if old_active else "OBJECT"
 
-    # Bone roll is only available from EditBone, not from Armature.data.bones.
-    source_specs = {}
-    bpy.ops.object.mode_set(mode="OBJECT")
-    bpy.ops.object.select_all(action="DESELECT")
-    source.select_set(True)
-    bpy.context.view_layer.objects.active = source
-    bpy.ops.object.mode_set(mode="EDIT")
-    for src_edit_bone in source.data.edit_bones:
-        source_specs[src_edit_bone.name] = {
-            "head": src_edit_bone.head.copy(),
-            "tail": src_edit_bone.tail.copy(),
-            "roll": src_edit_bone.roll,
-            "use_deform": src_edit_bone.use_deform,
-            "inherit_scale": src_edit_bone.inherit_scale,
-            "parent": src_edit_bone.parent.name if src_edit_bone.parent else None,
-        }
-    bpy.ops.object.mode_set(mode="OBJECT")
-
-    bpy.ops.object.mode_set(mode="OBJECT")
-    bpy.ops.object.select_all(action="DESELECT")
-    target.select_set(True)
-    bpy.context.view_layer.objects.active = target
-    bpy.ops.object.mode_set(mode="EDIT")
-
-    edit_bones = target.data.edit_bones
+    # Leaving any edit mode first flushes edit bones back to Armature.bones.
+    set_mode(old_active, "OBJECT")
+    source_specs = read_bone_specs(source)
     source_world_to_target_local = target.matrix_world.inverted() @ source.matrix_world
+    heads = transform_points(source_world_to_target_local, source_specs.heads)
+    tails = transform_points(source_world_to_target_local, source_specs.tails)
+
+    set_mode(target, "EDIT")
 
-    for source_name, spec in source_specs.items():
+    edit_bones = target.data.edit_bones
+    for i, source_name in enumerate(source_specs.names):
         if is_body_bone_name(source_name):
             report["skipped_body_bones"].append(source_name)
             continue
@@ -436,22 +462,21 @@ def copy_extra_bones_to_target(source, target, old_to_new_body):
             continue
 
         eb = edit_bones.new(source_name)
-        eb.head = source_world_to_target_local @ spec["head"]
-        eb.tail = source_world_to_target_local @ spec["tail"]
-        eb.roll = spec["roll"]
-        eb.use_deform = spec["use_deform"]
-        eb.inherit_scale = spec["inherit_scale"]
+        eb.head = heads[i]
+        eb.tail = tails[i]
+        eb.roll = float(source_specs.rolls[i])
+        eb.use_deform = bool(source_specs.use_deform[i])
+        eb.inherit_scale = source_specs.inherit_scale[i]
         eb.use_connect = False
         report["copied_extra_bones"].append(source_name)
 
     # Parent after all extra bones exist.
-    for source_name, spec in source_specs.items():
+    for source_name, old_parent_name in zip(source_specs.names, source_specs.parents):
         if is_body_bone_name(source_name):
             continue
         eb = edit_bones.get(source_name)
         if eb is None:
             continue
-        old_parent_name = spec["parent"]
         parent_name = source_to_target_parent_name(old_parent_name, old_to_new_body)
         parent = edit_bones.get(parent_name) if parent_name else None
         if parent:
@@ -460,26 +485,50 @@ def copy_extra_bones_to_target(source, target, old_to_new_body):
         elif parent_name:
             report["warnings"].append(f"Could not find parent {parent_name} for copied bone {source_name}; left unparented")
 
-    bpy.ops.object.mode_set(mode="OBJECT")
-    assign_copied_extra_bones_to_collections(target, report["copied_extra_bones"])
-    if old_active:
-        bpy.context.view_layer.objects.active = old_active
-        old_active.select_set(True)
-        if old_mode != "OBJECT":
-            try:
-                bpy.ops.object.mode_set(mode=old_mode)
-            except Exception:
-                report["warnings"].append(f"Could not restore previous mode {old_mode}")
+    set_mode(target, "OBJECT")
+    assign_copied_extra_bones_to_collections(report, target, report["copied_extra_bones"])
+    if old_active and old_mode != "OBJECT":
+        try:
+            set_mode(old_active, old_mode)
+        except Exception:
+            report["warnings"].append(f"Could not restore previous mode {old_mode}")
 
 
-def read_vertex_group_weights(mesh, group_index):
-    weights = {}
+def read_weight_table(mesh):
+    # One pass over all memberships; returns parallel (vertex, group, weight) arrays.
+    vertices = []
+    groups = []
+    weights = []
     for vertex in mesh.data.vertices:
+        index = vertex.index
         for membership in vertex.groups:
-            if membership.group == group_index:
-                weights[vertex.index] = membership.weight
-                break
-    return weights
+            vertices.append(index)
+            groups.append(membership.group)
+            weights.append(membership.weight)
+    return (
+        np.array(vertices, dtype=np.int32),
+        np.array(groups, dtype=np.int32),
+        np.array(weights, dtype=np.float32),
+    )
+
+
+def sum_weights(vertices, weights):
+    unique_vertices, inverse = np.unique(vertices, return_inverse=True)
+    totals = np.bincount(inverse, weights=weights, minlength=len(unique_vertices))
+    return unique_vertices, np.minimum(totals, 1.0)
+
+
+def write_group_weights(group, vertices, weights):
+    if len(vertices) == 0:
+        return
+    # Smooth skin weights are nearly all distinct floats; quantizing caps the
+    # add calls at one per 1e-4 step instead of one per vertex.
+    weights = np.round(weights, NORMALIZED_WEIGHT_DECIMALS)
+    values, inverse = np.unique(weights, return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    splits = np.cumsum(np.bincount(inverse, minlength=len(values)))[:-1]
+    for value, chunk in zip(values, np.split(vertices[order], splits)):
+        group.add(chunk.tolist(), float(value), "REPLACE")
 
 
 def ensure_vertex_group(mesh, name):
@@ -489,30 +538,28 @@ def ensure_vertex_group(mesh, name):
     return group
 
 
-def add_weights(mesh, group_name, weights):
-    if not weights:
-        return
-    group = ensure_vertex_group(mesh, group_name)
-    for vertex_index, weight in weights.items():
-        group.add([vertex_index], weight, "ADD")
-
-
-def backup_vertex_groups(mesh):
-    if not CREATE_BACKUP_VERTEX_GROUPS:
-        return
+def backup_vertex_groups(mesh, table):
+    vertices, groups, weights = table
     for group in list(mesh.vertex_groups):
         backup_name = f"OLD_{group.name}"
         if mesh.vertex_groups.get(backup_name):
             continue
-        weights = read_vertex_group_weights(mesh, group.index)
+        rows = groups == group.index
         backup = mesh.vertex_groups.new(name=backup_name)
-        for vertex_index, weight in weights.items():
-            backup.add([vertex_index], weight, "REPLACE")
+        write_group_weights(backup, vertices[rows], weights[rows])
 
 
-def migrate_vertex_groups(mesh, old_to_new_body, valid_target_bones):
-    backup_vertex_groups(mesh)
+def migrate_vertex_groups(report, mesh, old_to_new_body, valid_target_bones, create_backup=CREATE_BACKUP_VERTEX_GROUPS):
+    table = read_weight_table(mesh)
+    if create_backup:
+        backup_vertex_groups(mesh, table)
 
+    vertices, groups, weights = table
+    group_sizes = np.bincount(groups, minlength=len(mesh.vertex_groups))
+    group_index = {group.name: group.index for group in mesh.vertex_groups}
+    existing_targets = set(group_index)
+
+    sources_by_target = {}
     group_names_to_remove = []
     for group in list(mesh.vertex_groups):
         old_name = group.name
@@ -525,14 +572,27 @@ def migrate_vertex_groups(mesh, old_to_new_body, valid_target_bones):
             report["kept_groups"].append(old_name)
             continue
 
-        weights = read_vertex_group_weights(mesh, group.index)
-        add_weights(mesh, new_name, weights)
+        sources_by_target.setdefault(new_name, []).append(old_name)
         group_names_to_remove.append(old_name)
-        if mesh.vertex_groups.get(new_name) and old_name != new_name:
+        if group_sizes[group.index]:
+            existing_targets.add(new_name)
+        if new_name in existing_targets and old_name != new_name:
             report["merged_groups"].append(f"{old_name} -> {new_name}")
         else:
             report["renamed_groups"].append(f"{old_name} -> {new_name}")
 
+    for new_name, old_names in sources_by_target.items():
+        # Helpers merging into the same DEF group, plus any weights the target
+        # group already had, are summed like sequential "ADD" calls would.
+        merged = [group_index[name] for name in old_names]
+        if new_name in group_index:
+            merged.append(group_index[new_name])
+        rows = np.isin(groups, merged)
+        if not rows.any():
+            continue
+        target_vertices, target_weights = sum_weights(vertices[rows], weights[rows])
+        write_group_weights(ensure_vertex_group(mesh, new_name), target_vertices, target_weights)
+
     for group_name in group_names_to_remove:
         group = mesh.vertex_groups.get(group_name)
         if group is not None:
@@ -540,31 +600,79 @@ def migrate_vertex_groups(mesh, old_to_new_body, valid_target_bones):
             report["deleted_groups"].append(group_name)
 
 
-def normalize_deform_weights(mesh):
-    if not NORMALIZE_AFTER_MIGRATION:
+def deform_group_indices(mesh, target):
+    deform_bones = {bone.name for bone in target.data.bones if bone.use_deform}
+    return [group.index for group in mesh.vertex_groups if group.name in deform_bones]
+
+
+def rank_within_vertex(vertices, weights):
+    # 0 for the heaviest influence of each vertex, 1 for the next, ...
+    order = np.lexsort((-weights, vertices))
+    sorted_vertices = vertices[order]
+    starts = np.flatnonzero(np.r_[True, sorted_vertices[1:] != sorted_vertices[:-1]])
+    run_lengths = np.diff(np.r_[starts, len(order)])
+    ranks = np.empty(len(order), dtype=np.int32)
+    ranks[order] = np.arange(len(order)) - np.repeat(starts, run_lengths)
+    return ranks
+
+
+def limit_and_normalize_weights(vertices, weights, max_influences=0, threshold=0.0):
+    keep = weights >= threshold if threshold > 0.0 else np.ones(len(weights), dtype=bool)
+    if max_influences > 0:
+        kept_rows = np.flatnonzero(keep)
+        ranks = rank_within_vertex(vertices[kept_rows], weights[kept_rows])
+        keep[kept_rows[ranks >= max_influences]] = False
+
+    normalized = np.zeros(len(weights), dtype=np.float64)
+    totals = np.bincount(vertices[keep], weights=weights[keep])
+    kept_totals = totals[vertices[keep]]
+    normalized[keep] = np.divide(
+        weights[keep],
+        kept_totals,
+        out=np.zeros(len(kept_totals), dtype=np.float64),
+        where=kept_totals > 0.0,
+    )
+    return keep, normalized
+
+
+def normalize_deform_weights(report, mesh, target, options):
+    deform_groups = deform_group_indices(mesh, target)
+    if not deform_groups:
+        report["warnings"].append(f"No deform vertex groups on {mesh.name} to normalize")
         return
-    old_active = bpy.context.view_layer.objects.active
-    old_mode = old_active.mode if old_active else "OBJECT"
-    bpy.ops.object.mode_set(mode="OBJECT")
-    bpy.ops.object.select_all(action="DESELECT")
-    mesh.select_set(True)
-    bpy.context.view_layer.objects.active = mesh
-    try:
-        bpy.ops.object.vertex_group_normalize_all(lock_active=False)
-        report["modifiers"].append("Normalized all vertex groups")
-    except Exception as exc:
-        report["warnings"].append(f"Could not normalize vertex groups: {exc}")
-    if old_active:
-        bpy.context.view_layer.objects.active = old_active
-        old_active.select_set(True)
-        if old_mode != "OBJECT":
-            try:
-                bpy.ops.object.mode_set(mode=old_mode)
-            except Exception:
-                report["warnings"].append(f"Could not restore previous mode {old_mode}")
-
-
-def reparent_source_children(source, target, processed_meshes, old_to_new_body):
+
+    vertices, groups, weights = read_weight_table(mesh)
+    rows = np.isin(groups, deform_groups)
+    vertices, groups, weights = vertices[rows], groups[rows], weights[rows]
+
+    keep, normalized = limit_and_normalize_weights(
+        vertices,
+        weights,
+        options.max_deform_influences,
+        options.prune_weight_threshold,
+    )
+    normalized = np.round(normalized, NORMALIZED_WEIGHT_DECIMALS)
+    changed = keep & (np.abs(normalized - weights) > 10.0 ** -NORMALIZED_WEIGHT_DECIMALS)
+
+    pruned = 0
+    for group in mesh.vertex_groups:
+        if group.index not in deform_groups:
+            continue
+        in_group = groups == group.index
+        removed = in_group & ~keep
+        if removed.any():
+            group.remove(vertices[removed].tolist())
+            pruned += int(removed.sum())
+        updated = in_group & changed
+        write_group_weights(group, vertices[updated], normalized[updated])
+
+    report["modifiers"].append(
+        f"Normalized {len(deform_groups)} deform vertex groups "
+        f"(max influences={options.max_deform_influences or 'all'}, pruned {pruned} weights)"
+    )
+
+
+def reparent_source_children(report, source, target, processed_meshes, old_to_new_body):
     processed_meshes = set(processed_meshes)
     for obj in bpy.data.objects:
         if obj in processed_meshes:
@@ -590,10 +698,10 @@ def reparent_source_children(source, target, processed_meshes, old_to_new_body):
             report["parenting"].append(f"{obj.name} object-parent moved {source.name} -> {target.name}")
 
 
-def retarget_mesh_to_target(mesh, source, target):
+def retarget_mesh_to_target(report, mesh, source, target, options):
     world = mesh.matrix_world.copy()
 
-    if REMOVE_OLD_ARMATURE_MODIFIERS:
+    if options.remove_old_armature_modifiers:
         for modifier in list(mesh.modifiers):
             if modifier.type == "ARMATURE" and modifier.object == source:
                 mesh.modifiers.remove(modifier)
@@ -610,7 +718,7 @@ def retarget_mesh_to_target(mesh, source, target):
     modifier.object = target
     report["modifiers"].append(f"Armature modifier now targets {target.name}")
 
-    if PARENT_BODY_TO_TARGET_ARMATURE:
+    if options.parent_body_to_target_armature:
         mesh.parent = target
         mesh.parent_type = "OBJECT"
         mesh.matrix_parent_inverse = target.matrix_world.inverted()
@@ -622,77 +730,29 @@ def retarget_mesh_to_target(mesh, source, target):
         report["parenting"].append(f"{mesh.name} parent cleared with world transform preserved")
 
 
-def retarget_shader_control_empties(context, target, meshes):
-    if ba_shader_controls is None:
-        report["warnings"].append(
-            "ba_shader_controls module unavailable; skipped shader control retarget"
-            f" ({BA_SHADER_CONTROLS_LOAD_ERROR})"
-        )
-        return
-
-    old_active = bpy.context.view_layer.objects.active
-    old_selected = list(bpy.context.selected_objects)
-    bpy.ops.object.mode_set(mode="OBJECT")
-    bpy.ops.object.select_all(action="DESELECT")
-    for mesh in meshes:
-        mesh.select_set(True)
-    bpy.context.view_layer.objects.active = meshes[0] if meshes else target
-
-    hair_empty, face_empty = ba_shader_controls.retarget_shader_controls_to_rig(context, target)
+def retarget_shader_control_empties(report, context, target, meshes):
+    # The driver builders read selected_objects; override it instead of
+    # changing the real selection.
+    with object_context(meshes[0] if meshes else target, meshes):
+        hair_empty, face_empty = ba_shader_controls.retarget_shader_controls_to_rig(context, target)
     if hair_empty:
         report["parenting"].append(f"{hair_empty.name} retargeted to {target.name}")
     if face_empty:
         report["parenting"].append(f"{face_empty.name} retargeted to {target.name}")
 
-    bpy.ops.object.select_all(action="DESELECT")
-    for obj in old_selected:
-        if obj.name in bpy.data.objects:
-            obj.select_set(True)
-    if old_active and old_active.name in bpy.data.objects:
-        bpy.context.view_layer.objects.active = old_active
-
-
-def dedupe_report():
-    for key, values in report.items():
-        seen = set()
-        unique = []
-        for value in values:
-            if value not in seen:
-                unique.append(value)
-                seen.add(value)
-        report[key] = unique
-
-
-def print_report():
-    dedupe_report()
-    print("\n=== Migrate selected body to selected Rigify rig report ===")
-    for key in (
-        "copied_extra_bones",
-        "skipped_body_bones",
-        "merged_groups",
-        "kept_groups",
-        "deleted_groups",
-        "missing_target_bones",
-        "missing_source_bones",
-        "modifiers",
-        "parenting",
-        "skipped_unbound_meshes",
-        "warnings",
-    ):
-        values = report[key]
-        print(f"{key}: {len(values)}")
-        if key not in {"kept_groups", "skipped_body_bones"}:
-            for value in values:
-                print(f"  - {value}")
-    print("=== End report ===\n")
-
-
-def main():
-    source, target, mesh, modifier_extra_meshes, parented_extra_meshes, unbound_meshes = resolve_scene_objects()
+
+def run(source, target, meshes, options=None, context=None):
+    options = options or MigrateOptions()
+    context = context or bpy.context
+    report = new_report()
+    started = time.perf_counter()
+
+    source, target, mesh, modifier_extra_meshes, parented_extra_meshes, unbound_meshes = resolve_scene_objects(
+        report, source, target, meshes, options
+    )
     extra_meshes = modifier_extra_meshes + parented_extra_meshes
 
     old_to_new_body = build_body_mapping()
-    valid_target_bones = {bone.name for bone in target.data.bones}
     valid_def_bones = target_def_bones(target)
 
     for old_name, new_name in old_to_new_body.items():
@@ -701,18 +761,35 @@ def main():
         if new_name not in valid_def_bones:
             report["missing_target_bones"].append(new_name)
 
-    copy_extra_bones_to_target(source, target, old_to_new_body)
+    with span("rig/copy_extra_bones"):
+        copy_extra_bones_to_target(report, source, target, old_to_new_body)
     valid_target_bones = {bone.name for bone in target.data.bones}
-    migrate_vertex_groups(mesh, old_to_new_body, valid_target_bones)
-    normalize_deform_weights(mesh)
-    retarget_mesh_to_target(mesh, source, target)
-    for extra_mesh in modifier_extra_meshes:
-        retarget_mesh_to_target(extra_mesh, source, target)
-    retarget_shader_control_empties(bpy.context, target, [mesh] + extra_meshes)
-    reparent_source_children(source, target, [mesh] + extra_meshes, old_to_new_body)
-
-    print_report()
+    with span("rig/migrate_vertex_groups", mesh=mesh.name):
+        migrate_vertex_groups(report, mesh, old_to_new_body, valid_target_bones, options.create_backup_vertex_groups)
+    if options.normalize_after_migration:
+        with span("rig/normalize_weights", mesh=mesh.name):
+            normalize_deform_weights(report, mesh, target, options)
+    with span("rig/retarget_meshes"):
+        retarget_mesh_to_target(report, mesh, source, target, options)
+        for extra_mesh in modifier_extra_meshes:
+            retarget_mesh_to_target(report, extra_mesh, source, target, options)
+    with span("rig/shader_controls"):
+        retarget_shader_control_empties(report, context, target, [mesh] + extra_meshes)
+    with span("rig/reparent_children"):
+        reparent_source_children(report, source, target, [mesh] + extra_meshes, old_to_new_body)
+
+    report.dedupe()
+    report.elapsed = time.perf_counter() - started
     return report
 
 
-main()
+def main(context=None):
+    context = context or bpy.context
+    options = MigrateOptions()
+    selection_report = new_report()
+    source, target, _, _, _, _ = resolve_armatures_from_selection(selection_report, context.selected_objects, options)
+    meshes = [obj for obj in context.selected_objects if obj.type == "MESH"]
+    report = run(source, target, meshes, options, context)
+    report.merge(selection_report)
+    report.print(PRINTED_REPORT_KEYS)
+    return report